@@ -0,0 +1,43 @@
+from typing import Any
+from typing import Dict
+from typing import Optional
+
+from pydantic import BaseModel
+
+from jao_backend_schemas.advice import AdviceResponse
+from jao_backend_schemas.maps import AreaFrequenciesResponse
+from jao_backend_schemas.plots import PlotlyFiguresResponse
+from jao_backend_schemas.vacancies import SimilarVacanciesResponse
+
+
+class AnalysisResponse(BaseModel):
+    """
+    Every section of the job advert analysis, from one request.
+    """
+
+    advice: AdviceResponse
+    similar_adverts: SimilarVacanciesResponse
+    similar_advert_plots: PlotlyFiguresResponse
+    skills_plots: PlotlyFiguresResponse
+    applicant_locations: AreaFrequenciesResponse
+
+
+class AnalysisSection(BaseModel):
+    """
+    One section of the analysis, /analyse/stream sends each as a line of NDJSON as soon
+    as it is built.
+    """
+
+    section: str
+    """Name of the AnalysisResponse field."""
+    data: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    """Set instead of data if the section couldn't be built."""
+
+    def get_response(self) -> BaseModel:
+        """
+        :return: data, as the AnalysisResponse field's model.
+        :raise KeyError: For sections AnalysisResponse doesn't have.
+        """
+        model = AnalysisResponse.model_fields[self.section].annotation
+        return model.model_validate(self.data)
@@ -4,9 +4,11 @@ from pydantic import BaseModel
 
 
 class AreaFrequencyProperties(BaseModel):
-    # TODO: this should have area_code: str (called areacd in our geojson file)
+    area_code: Optional[str] = None
+    """ONS area code, called areacd in our geojson file."""
     area_name: str
     frequency: Optional[float] = None
+    """Percentage of applicants in the area."""
 
 class AreaFrequenciesResponse(BaseModel):
     area_frequencies: list[AreaFrequencyProperties]
@@ -1,12 +1,26 @@
 from typing import List, Dict, Any
 
-from plotly.graph_objs import Figure
 from pydantic import BaseModel
 
 
 class PlotlyFiguresResponse(BaseModel):
+    """
+    Plotly figures as JSON dicts (data, layout), ready for plotly.js.
+
+    plotly is only imported to build Figure objects, clients that pass the JSON to
+    the browser don't need it.
+    """
+
     plotly_figures: List[Dict[str, Any]]
 
     def get_figures(self):
+        from plotly.graph_objs import Figure
+
         figures = [Figure(**plot_kwargs) for plot_kwargs in self.plotly_figures]
         return figures
+
+    def validate_figures(self):
+        """
+        :raise ValueError: If a figure isn't valid plotly JSON.
+        """
+        self.get_figures()
@@ -1,10 +1,27 @@
-from typing import Dict, List
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel
 
 
+class VacancyFilters(BaseModel):
+    """
+    Restrict similar vacancies, unset fields don't filter.
+    """
+
+    live: bool = False
+    grade_ids: Optional[List[int]] = None
+    role_type_ids: Optional[List[int]] = None
+    live_from: Optional[datetime] = None
+    live_to: Optional[datetime] = None
+    min_salary: Optional[Decimal] = None
+    max_salary: Optional[Decimal] = None
+
+
 class JobDescriptionRequest(BaseModel):
     description: str
+    filters: Optional[VacancyFilters] = None
 
 
 class JobDescriptionOptimisationRequest(JobDescriptionRequest):
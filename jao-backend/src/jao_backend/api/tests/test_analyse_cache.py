@@ -0,0 +1,49 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from jao_backend_schemas.vacancies import JobDescriptionRequest
+
+from jao_backend.api.v0 import endpoints
+from jao_backend.embeddings.models import EmbeddingTag
+from jao_backend.vacancies.cache import corpus_version
+from jao_backend.vacancies.cache import similar_vacancies_cache
+from jao_backend.vacancies.models import VacancyEmbedding
+from jao_backend.vacancies.tests.factories import VacancyFactory
+
+
+@pytest.mark.django_db(transaction=True)
+def test_repeated_analyse_skips_search(monkeypatch):
+    """
+    The similar vacancies of a description are cached, so analysing it again doesn't
+    embed and search, until the corpus version is bumped.
+    """
+    EmbeddingTag.get_configured_tags.cache_clear()
+    near, far = VacancyFactory.create(), VacancyFactory.create()
+    searches = []
+
+    async def asimilar_vacancies(text, tag, top_n=10, filters=None):
+        searches.append(text)
+        return [
+            SimpleNamespace(vacancy=near, distance=0.1),
+            SimpleNamespace(vacancy=far, distance=0.4),
+        ]
+
+    monkeypatch.setattr(VacancyEmbedding.objects, "asimilar_vacancies", asimilar_vacancies)
+    payload = JobDescriptionRequest(description="Data analyst")
+
+    first = asyncio.run(endpoints.analyse(None, payload))
+    second = asyncio.run(endpoints.analyse(None, payload))
+
+    assert searches == ["Data analyst"]
+    assert second == first
+    assert [
+        listing.vacancy_id for listing in second.similar_adverts.similar_vacancies
+    ] == [near.pk, far.pk]
+
+    corpus_version.bump()
+    asyncio.run(endpoints.analyse(None, payload))
+    assert len(searches) == 2
+
+    similar_vacancies_cache.local.clear()
+    corpus_version.cache.delete(corpus_version.key)
@@ -0,0 +1,49 @@
+import asyncio
+import json
+
+import pytest
+
+from jao_backend.api.v0 import endpoints
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_stream_analysis_sections(monkeypatch):
+    """
+    Every section is streamed once, a failing section is sent as an error without
+    stopping the others.
+    """
+
+    async def get_similar_vacancies(text, top_n=10, filters=None):
+        return []
+
+    def build_skills_plots(similar_vacancies):
+        raise RuntimeError("Skills are unavailable")
+
+    monkeypatch.setattr(endpoints, "get_similar_vacancies", get_similar_vacancies)
+    monkeypatch.setitem(
+        endpoints.SIMILARITY_SECTIONS, "skills_plots", build_skills_plots
+    )
+
+    lines = asyncio.run(
+        collect(endpoints.stream_analysis_sections("Analyst", filters=None))
+    )
+    sections = {
+        section["section"]: section for section in map(json.loads, lines)
+    }
+
+    assert all(line.endswith("\n") for line in lines)
+    assert set(sections) == {
+        "advice",
+        "similar_adverts",
+        "similar_advert_plots",
+        "skills_plots",
+        "applicant_locations",
+    }
+    assert sections["skills_plots"]["data"] is None
+    assert sections["skills_plots"]["error"] == "Could not build skills_plots."
+    assert sections["similar_adverts"]["data"] == {"similar_vacancies": []}
+    assert sections["applicant_locations"]["data"] == {"area_frequencies": []}
@@ -1,20 +1,34 @@
+import asyncio
+import json
 import logging
+from typing import Optional
 
 from django.conf import settings
 from django.http import HttpRequest
+from django.http import StreamingHttpResponse
 
 import numpy as np
 from ninja import NinjaAPI
 
 from jao_backend_schemas.advice import AdviceResponse
+from jao_backend_schemas.analysis import AnalysisResponse
+from jao_backend_schemas.analysis import AnalysisSection
 from jao_backend_schemas.maps import AreaFrequenciesResponse
+from jao_backend_schemas.maps import AreaFrequencyProperties
 from jao_backend_schemas.plots import PlotlyFiguresResponse
 from jao_backend_schemas.vacancies import SimilarVacanciesResponse
 from jao_backend_schemas.vacancies import JobDescriptionRequest
+from jao_backend_schemas.vacancies import VacancyFilters
 from jao_backend_schemas.vacancies import VacancyListing
 
-from jao_backend.common.text_processing.clean_oleeo import parse_oleeo_bbcode
+from jao_backend.application_statistics.cohorts import get_cohort_figures
+from jao_backend.application_statistics.models import VacancyRegionStatistic
+from jao_backend.application_statistics.regions import get_region_frequencies
+from jao_backend.common.db.executor import db_sync_to_async
 from jao_backend.embeddings.models import EmbeddingTag
+from jao_backend.vacancies.cache import get_cached_similar_vacancies
+from jao_backend.vacancies.cache import similar_vacancies_cache
+from jao_backend.vacancies.models import Vacancy
 from jao_backend.vacancies.models import VacancyEmbedding
 
 logger = logging.getLogger(__name__)
@@ -26,82 +40,284 @@ api = NinjaAPI(
 )
 
 
-def get_similar_vacancies(text, top_n=10):
-    tag = EmbeddingTag.get_tag(settings.EMBEDDING_TAG_JOB_TITLE_RESPONSIBILITIES_ID)
-    similar_vacancy_embeddings = VacancyEmbedding.objects.similar_vacancies(text, tag, top_n)
-    return [
-        vacancy_embedding.vacancy for vacancy_embedding in similar_vacancy_embeddings
-    ]
+async def get_similar_vacancies(
+    text, top_n=10, filters: Optional[VacancyFilters] = None
+):
+    """
+    Results are cached until the vacancies are next ingested or embedded, so repeated
+    descriptions aren't embedded and searched again, see jao_backend.vacancies.cache.
 
+    :param filters: Applied inside the vector search, so up to top_n matches are returned.
+    :return: Vacancies, nearest first, with the distance of their embedding.
+    """
+    filters = filters.model_dump(exclude_none=True) if filters else None
+    # Usually answered by the in-process tier, the thread avoids blocking on Redis.
+    key, cached = await asyncio.to_thread(
+        get_cached_similar_vacancies, text, top_n, filters
+    )
+    if cached is not None:
+        return await db_sync_to_async(load_similar_vacancies)(json.loads(cached))
 
-@api.post("/advice")
-def advice(request: HttpRequest, payload: JobDescriptionRequest) -> AdviceResponse:
-    logger.info(
-        "STUB: advice endpoint called with description: %s", payload.description
+    tag = await db_sync_to_async(EmbeddingTag.get_tag)(
+        settings.EMBEDDING_TAG_JOB_TITLE_RESPONSIBILITIES_ID
+    )
+    similar_vacancy_embeddings = await VacancyEmbedding.objects.asimilar_vacancies(
+        text, tag, top_n, filters=filters
     )
+    similar_vacancies = []
+    for vacancy_embedding in similar_vacancy_embeddings:
+        vacancy = vacancy_embedding.vacancy
+        vacancy.distance = vacancy_embedding.distance
+        similar_vacancies.append(vacancy)
+
+    if key is not None:
+        await asyncio.to_thread(
+            similar_vacancies_cache.set,
+            key,
+            # Distances from the numpy backends are numpy floats.
+            json.dumps(
+                [[vacancy.pk, vacancy.distance] for vacancy in similar_vacancies],
+                default=float,
+            ),
+        )
+    return similar_vacancies
+
+
+def load_similar_vacancies(cached) -> list:
+    """
+    :param cached: [[vacancy_id, distance], ...] from similar_vacancies_cache.
+    :return: The vacancies, in the same order, with their distance.
+    """
+    vacancies = Vacancy.objects.in_bulk([vacancy_id for vacancy_id, _ in cached])
+    similar_vacancies = []
+    for vacancy_id, distance in cached:
+        vacancy = vacancies.get(vacancy_id)
+        if vacancy is not None:
+            vacancy.distance = distance
+            similar_vacancies.append(vacancy)
+    return similar_vacancies
+
+
+# Each section of the analysis is built by one of these functions, so that /analyse and
+# the per-section endpoints return the same thing.  Sections that depend on similarity
+# take the similar vacancies, so /analyse only embeds and searches once.
+
+
+def build_advice(description: str) -> AdviceResponse:
+    logger.info("STUB: advice called with description: %s", description)
     text = """
     This is a sample advice to help improve your job description."""
     logger.info("STUB: advice sending example advice: %s", text)
     return AdviceResponse(advice=text)
 
 
-@api.post("/similar_adverts", response=SimilarVacanciesResponse)
-def similar_adverts(
-    request: HttpRequest, payload: JobDescriptionRequest
-) -> SimilarVacanciesResponse:
+def build_similar_adverts(similar_vacancies) -> SimilarVacanciesResponse:
     # For now convert this into the older format
     similar_vacancies_list = [
         VacancyListing.model_validate(
             {
                 "job_title": vacancy.title,
-                "full_job_desc": parse_oleeo_bbcode(vacancy.description),
+                "full_job_desc": vacancy.get_description_html(),
                 "vacancy_id": vacancy.pk,
             }
         )
-        for vacancy in get_similar_vacancies(payload.description, top_n=10)
+        for vacancy in similar_vacancies
     ]
     return SimilarVacanciesResponse(similar_vacancies=similar_vacancies_list)
 
 
+def build_similar_advert_plots(similar_vacancies) -> PlotlyFiguresResponse:
+    """
+    Applicants to the similar vacancies, weighted by similarity, compared with
+    applicants to all vacancies.
+    """
+    graphs = get_cohort_figures(
+        [vacancy.pk for vacancy in similar_vacancies],
+        [getattr(vacancy, "distance", None) for vacancy in similar_vacancies],
+    )
+    return PlotlyFiguresResponse(plotly_figures=graphs)
+
+
+def build_skills_plots(similar_vacancies) -> PlotlyFiguresResponse:
+    # Stub: skills are not ingested right now.
+    logger.info("STUB: skills_plots called")
+    graphs = []
+    return PlotlyFiguresResponse(plotly_figures=graphs)
+
+
+def build_applicant_locations(similar_vacancies) -> AreaFrequenciesResponse:
+    """
+    Where applicants to the similar vacancies live, from the region counts stored
+    when statistics are aggregated.
+    """
+    region_counts = VacancyRegionStatistic.objects.non_polymorphic().filter(
+        vacancy_id__in=[vacancy.pk for vacancy in similar_vacancies]
+    )
+    area_frequencies = [
+        AreaFrequencyProperties.model_validate(area_frequency)
+        for area_frequency in get_region_frequencies(
+            region_counts.values_list("region_counts", flat=True)
+        )
+    ]
+    return AreaFrequenciesResponse(area_frequencies=area_frequencies)
+
+
+@api.post("/analyse", response=AnalysisResponse)
+async def analyse(request: HttpRequest, payload: JobDescriptionRequest) -> AnalysisResponse:
+    """
+    All sections of the analysis in one response.
+
+    The description is embedded and searched once, then the sections are built from
+    the same similar vacancies concurrently.
+    """
+    similar_vacancies = await get_similar_vacancies(
+        payload.description, top_n=10, filters=payload.filters
+    )
+
+    def build_section(build, *args):
+        return db_sync_to_async(build)(*args)
+
+    (
+        advice_response,
+        similar_adverts_response,
+        similar_advert_plots_response,
+        skills_plots_response,
+        applicant_locations_response,
+    ) = await asyncio.gather(
+        build_section(build_advice, payload.description),
+        build_section(build_similar_adverts, similar_vacancies),
+        build_section(build_similar_advert_plots, similar_vacancies),
+        build_section(build_skills_plots, similar_vacancies),
+        build_section(build_applicant_locations, similar_vacancies),
+    )
+    return AnalysisResponse(
+        advice=advice_response,
+        similar_adverts=similar_adverts_response,
+        similar_advert_plots=similar_advert_plots_response,
+        skills_plots=skills_plots_response,
+        applicant_locations=applicant_locations_response,
+    )
+
+
+SIMILARITY_SECTIONS = {
+    "similar_adverts": build_similar_adverts,
+    "similar_advert_plots": build_similar_advert_plots,
+    "skills_plots": build_skills_plots,
+    "applicant_locations": build_applicant_locations,
+}
+"""Sections of the analysis built from the similar vacancies."""
+
+
+async def iter_analysis_sections(
+    description: str, filters: Optional[VacancyFilters] = None
+):
+    """
+    Build the sections of the analysis concurrently, yielding each as it completes.
+
+    Advice doesn't depend on the similar vacancies, so it doesn't wait for the search.
+    A section that fails is yielded with an error, the others are still built.
+
+    :return: Async iterator of AnalysisSection.
+    """
+    search = asyncio.ensure_future(
+        get_similar_vacancies(description, top_n=10, filters=filters)
+    )
+
+    async def get_similar_vacancies_args():
+        # Shielded, so one section being cancelled doesn't cancel the search for all.
+        return (await asyncio.shield(search),)
+
+    async def get_description_args():
+        return (description,)
+
+    async def build_section(name, build, get_args):
+        try:
+            response = await db_sync_to_async(build)(*await get_args())
+        except Exception:
+            logger.exception("Could not build analysis section %s", name)
+            return AnalysisSection(section=name, error=f"Could not build {name}.")
+        return AnalysisSection(section=name, data=response.model_dump(mode="json"))
+
+    tasks = [
+        asyncio.ensure_future(
+            build_section("advice", build_advice, get_description_args)
+        ),
+        *(
+            asyncio.ensure_future(
+                build_section(name, build, get_similar_vacancies_args)
+            )
+            for name, build in SIMILARITY_SECTIONS.items()
+        ),
+    ]
+    try:
+        for next_section in asyncio.as_completed(tasks):
+            yield await next_section
+    finally:
+        # The client went away, stop building the remaining sections.
+        for task in [search, *tasks]:
+            task.cancel()
+
+
+async def stream_analysis_sections(
+    description: str, filters: Optional[VacancyFilters] = None
+):
+    async for section in iter_analysis_sections(description, filters):
+        yield section.model_dump_json() + "\n"
+
+
+@api.post("/analyse/stream")
+async def analyse_stream(request: HttpRequest, payload: JobDescriptionRequest):
+    """
+    The sections of /analyse, streamed as NDJSON in the order they are built, one
+    AnalysisSection per line, so clients can show each as soon as it is ready.
+    """
+    return StreamingHttpResponse(
+        stream_analysis_sections(payload.description, payload.filters),
+        content_type="application/x-ndjson",
+    )
+
+
+@api.post("/advice")
+async def advice(request: HttpRequest, payload: JobDescriptionRequest) -> AdviceResponse:
+    return build_advice(payload.description)
+
+
+@api.post("/similar_adverts", response=SimilarVacanciesResponse)
+async def similar_adverts(
+    request: HttpRequest, payload: JobDescriptionRequest
+) -> SimilarVacanciesResponse:
+    similar_vacancies = await get_similar_vacancies(
+        payload.description, top_n=10, filters=payload.filters
+    )
+    return await db_sync_to_async(build_similar_adverts)(similar_vacancies)
+
+
 @api.post("/similar_advert_plots")
-def similar_advert_plots(
+async def similar_advert_plots(
     request: HttpRequest, payload: JobDescriptionRequest
 ) -> PlotlyFiguresResponse:
     """
-    Get a graph of the job description.
+    Applicant statistics of vacancies similar to the job description.
     """
-    # Stub: this required aggregated data
-    logger.info(
-        "STUB: similar_advert_plots endpoint called with description: %s",
-        payload.description,
+    similar_vacancies = await get_similar_vacancies(
+        payload.description, top_n=10, filters=payload.filters
     )
-    graphs = []
-    return PlotlyFiguresResponse(plotly_figures=graphs)
+    return await db_sync_to_async(build_similar_advert_plots)(similar_vacancies)
 
 
 @api.post("/skills_plots")
-def skills_plots(request, payload: JobDescriptionRequest) -> PlotlyFiguresResponse:
+async def skills_plots(request, payload: JobDescriptionRequest) -> PlotlyFiguresResponse:
     """
     Get a graph of the job description.
     """
-    # Stub: skills are not ingested right now.
-    logger.info(
-        "STUB: skills_plots endpoint called with description: %s", payload.description
-    )
-    graphs = []
-    result = PlotlyFiguresResponse(plotly_figures=graphs)
-    return result
+    return build_skills_plots([])
 
 
 @api.post("/applicant_locations")
-def applicant_locations(
+async def applicant_locations(
     request, payload: JobDescriptionRequest
 ) -> AreaFrequenciesResponse:
-    # Stub: OLEEO ingestion of locations is TBD
-    logger.info(
-        "STUB: applicant_locations endpoint called with description: %s",
-        payload.description,
+    similar_vacancies = await get_similar_vacancies(
+        payload.description, top_n=10, filters=payload.filters
     )
-    area_frequencies: AreaFrequencyProperties = []
-    # TODO: populate area_frequencies with instances of AreaFrequencyProperties from the database.
-    return AreaFrequenciesResponse(area_frequencies=area_frequencies)
+    return await db_sync_to_async(build_applicant_locations)(similar_vacancies)
@@ -0,0 +1,286 @@
+"""
+Applicant statistics of a cohort of vacancies, e.g. those similar to a job description,
+compared with every vacancy.
+
+Each AggregatedApplicationStatistic is the ratio of a vacancy's applicants in one
+category (e.g. the AgeGroup "25-29") of a protected characteristic.  For a cohort:
+
+- One query fetches the ratios of every vacancy in the cohort.
+- NumPy places them in a vacancy × category matrix and takes the mean of each category,
+  weighted by similarity, over the vacancies with data for that characteristic.
+
+The corpus-wide means (`StatisticsBaseline`) are computed by the aggregation task and
+cached per `statistics_version`, so requests don't aggregate the whole table.  Only
+aggregation bumps that version, embedding and ingest don't change the baseline.
+"""
+
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+
+import numpy as np
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count
+from django.db.models import FloatField
+from django.db.models import Sum
+from django.db.models.functions import Cast
+
+from jao_backend.application_statistics.models import AggregatedApplicationStatistic
+from jao_backend.common.cache import TieredCache
+from jao_backend.common.cache import VersionStamp
+
+SIMILAR_VACANCIES_NAME = "Similar vacancies"
+ALL_VACANCIES_NAME = "All vacancies"
+
+statistics_version = VersionStamp(
+    "application-statistics:version",
+    alias="shared",
+    check_interval=settings.JAO_BACKEND_CORPUS_VERSION_CHECK_INTERVAL,
+)
+"""Bumped when statistics are aggregated, see `update_statistics_baseline`."""
+
+baseline_cache = TieredCache(
+    "statistics-baseline",
+    alias="shared",
+    timeout=settings.JAO_BACKEND_STATISTICS_BASELINE_CACHE_TIMEOUT,
+    local_maxsize=2,
+)
+"""StatisticsBaseline, keyed by statistics version."""
+
+
+class StatisticsBaseline(NamedTuple):
+    """
+    Categories of every characteristic, with their mean ratio over all vacancies.
+
+    Arrays are indexed by category, ordered by `keys`.
+    """
+
+    keys: np.ndarray
+    """Sorted category keys, see `get_category_keys`."""
+    characteristic_indexes: np.ndarray
+    """Index into characteristics of each category."""
+    characteristics: List[str]
+    """Names of the characteristics, e.g. "Age groups"."""
+    labels: List[str]
+    """Descriptions of the categories, e.g. "25-29"."""
+    ratios: np.ndarray
+    """Mean ratio of each category, over vacancies with data for its characteristic."""
+
+
+def get_category_keys(content_type_ids, object_ids) -> np.ndarray:
+    """
+    :return: A sortable int64 key for each (content_type_id, object_id) category.
+    """
+    return (np.asarray(content_type_ids, dtype=np.int64) << 32) | np.asarray(
+        object_ids, dtype=np.int64
+    )
+
+
+def compute_statistics_baseline() -> StatisticsBaseline:
+    statistics = AggregatedApplicationStatistic.objects.non_polymorphic().filter(
+        vacancy__isnull=False
+    )
+    totals = list(
+        statistics.values("content_type_id", "object_id")
+        .annotate(total=Sum(Cast("ratio", FloatField())))
+        .order_by("content_type_id", "object_id")
+        .values_list("content_type_id", "object_id", "total")
+    )
+    vacancy_counts = dict(
+        statistics.values("content_type_id")
+        .annotate(vacancy_count=Count("vacancy_id", distinct=True))
+        .order_by()
+        .values_list("content_type_id", "vacancy_count")
+    )
+
+    content_type_ids = sorted(vacancy_counts)
+    characteristics = []
+    descriptions = {}
+    for content_type_id in content_type_ids:
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        characteristics.append(str(model._meta.verbose_name_plural).capitalize())
+        descriptions[content_type_id] = dict(
+            model.objects.values_list("pk", "description")
+        )
+
+    characteristic_positions = {
+        content_type_id: i for i, content_type_id in enumerate(content_type_ids)
+    }
+    return StatisticsBaseline(
+        keys=get_category_keys([row[0] for row in totals], [row[1] for row in totals]),
+        characteristic_indexes=np.array(
+            [characteristic_positions[row[0]] for row in totals], dtype=np.int64
+        ),
+        characteristics=characteristics,
+        labels=[
+            descriptions[content_type_id].get(object_id, str(object_id))
+            for content_type_id, object_id, _ in totals
+        ],
+        ratios=np.array(
+            [
+                total / vacancy_counts[content_type_id]
+                for content_type_id, _, total in totals
+            ],
+            dtype=np.float64,
+        ),
+    )
+
+
+def get_statistics_baseline() -> StatisticsBaseline:
+    """
+    :return: The baseline for the current statistics version, computed if it isn't
+            cached.
+    """
+    version = statistics_version.get()
+    if version is None:
+        return compute_statistics_baseline()
+
+    baseline = baseline_cache.get(str(version))
+    if baseline is None:
+        baseline = compute_statistics_baseline()
+        baseline_cache.set(str(version), baseline)
+    return baseline
+
+
+def update_statistics_baseline() -> StatisticsBaseline:
+    """
+    Precompute the baseline and bump the statistics version, call after statistics are
+    aggregated.
+    """
+    # Computed before the bump, so requests don't compute it again in between.
+    baseline = compute_statistics_baseline()
+    version = statistics_version.bump()
+    if version is not None:
+        baseline_cache.set(str(version), baseline)
+    return baseline
+
+
+def get_similarity_weights(distances: Sequence[Optional[float]]) -> np.ndarray:
+    """
+    :param distances: Cosine distance of each vacancy from the query, or None.
+    :return: Weight of each vacancy, its cosine similarity, or equal weights if
+            distances are unknown.
+    """
+    if not distances or any(distance is None for distance in distances):
+        return np.ones(len(distances))
+
+    weights = np.clip(1.0 - np.asarray(distances, dtype=np.float64), 0.0, None)
+    if not weights.any():
+        return np.ones(len(distances))
+    return weights
+
+
+def get_cohort_ratios(
+    vacancy_ids: Sequence[int],
+    weights: np.ndarray,
+    baseline: StatisticsBaseline,
+) -> np.ndarray:
+    """
+    :param weights: Weight of each vacancy, see `get_similarity_weights`.
+    :return: Weighted mean ratio of each baseline category over the vacancies with
+            data for its characteristic, NaN if there are none.
+    """
+    category_count = len(baseline.keys)
+    if not len(vacancy_ids) or not category_count:
+        return np.full(category_count, np.nan)
+
+    rows = np.array(
+        list(
+            AggregatedApplicationStatistic.objects.non_polymorphic()
+            .filter(vacancy_id__in=vacancy_ids)
+            .annotate(ratio_float=Cast("ratio", FloatField()))
+            .values_list("vacancy_id", "content_type_id", "object_id", "ratio_float")
+        ),
+        dtype=np.float64,
+    ).reshape(-1, 4)
+
+    vacancy_ids = np.asarray(vacancy_ids, dtype=np.int64)
+    vacancy_order = np.argsort(vacancy_ids)
+    vacancy_positions = vacancy_order[
+        np.searchsorted(vacancy_ids, rows[:, 0].astype(np.int64), sorter=vacancy_order)
+    ]
+
+    # Categories added since the baseline was computed are left out.
+    keys = get_category_keys(rows[:, 1], rows[:, 2])
+    categories = np.searchsorted(baseline.keys, keys).clip(max=category_count - 1)
+    known = baseline.keys[categories] == keys
+    vacancy_positions = vacancy_positions[known]
+    categories = categories[known]
+
+    ratios = np.zeros((len(vacancy_ids), category_count))
+    ratios[vacancy_positions, categories] = rows[known, 3]
+
+    # Only categories with applicants are aggregated, so a vacancy missing a category
+    # of a characteristic it has data for had none in that category.
+    answered = np.zeros((len(vacancy_ids), len(baseline.characteristics)))
+    answered[vacancy_positions, baseline.characteristic_indexes[categories]] = 1.0
+    characteristic_weights = answered * np.asarray(weights)[:, None]
+
+    category_weights = characteristic_weights[:, baseline.characteristic_indexes]
+    total_weights = category_weights.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (ratios * category_weights).sum(axis=0) / total_weights
+
+
+def get_figure(name, labels, cohort_ratios, baseline_ratios) -> dict:
+    """
+    :return: Plotly figure dict, comparing the cohort with all vacancies.
+    """
+    return {
+        "data": [
+            {
+                "type": "bar",
+                "name": SIMILAR_VACANCIES_NAME,
+                "x": labels,
+                "y": np.round(cohort_ratios, 4).tolist(),
+            },
+            {
+                "type": "bar",
+                "name": ALL_VACANCIES_NAME,
+                "x": labels,
+                "y": np.round(baseline_ratios, 4).tolist(),
+            },
+        ],
+        "layout": {
+            "title": {"text": name},
+            "barmode": "group",
+            "yaxis": {"title": {"text": "Applicants"}, "tickformat": ".0%"},
+        },
+    }
+
+
+def get_cohort_figures(
+    vacancy_ids: Sequence[int],
+    distances: Optional[Sequence[Optional[float]]] = None,
+    baseline: Optional[StatisticsBaseline] = None,
+) -> List[dict]:
+    """
+    Plotly figure dicts comparing the applicants of vacancy_ids with all vacancies, one
+    per characteristic the vacancies have data for.
+
+    :param distances: Distance of each vacancy from the query, to weight by similarity.
+    """
+    if baseline is None:
+        baseline = get_statistics_baseline()
+    if distances is None:
+        distances = [None] * len(vacancy_ids)
+
+    cohort_ratios = get_cohort_ratios(
+        vacancy_ids, get_similarity_weights(distances), baseline
+    )
+    figures = []
+    for i, name in enumerate(baseline.characteristics):
+        categories = np.flatnonzero(baseline.characteristic_indexes == i)
+        if np.isnan(cohort_ratios[categories]).all():
+            continue
+        figures.append(
+            get_figure(
+                name,
+                [baseline.labels[category] for category in categories],
+                cohort_ratios[categories],
+                baseline.ratios[categories],
+            )
+        )
+    return figures
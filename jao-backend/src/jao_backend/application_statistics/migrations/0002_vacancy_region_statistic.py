@@ -0,0 +1,31 @@
+# Generated by Django 5.0.14 on 2026-10-18 22:57
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('application_statistics', '0001_initial'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('vacancies', '0005_vacancy_derived_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VacancyRegionStatistic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated_at', models.DateTimeField()),
+                ('region_counts', django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(), default=list, size=None)),
+                ('polymorphic_ctype', models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='polymorphic_%(app_label)s.%(class)s_set+', to='contenttypes.contenttype')),
+                ('vacancy', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='vacancies.vacancy')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='vacancyregionstatistic',
+            constraint=models.UniqueConstraint(fields=('vacancy',), name='vacancy_region_statistic_unique_vacancy'),
+        ),
+    ]
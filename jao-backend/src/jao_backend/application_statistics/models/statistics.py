@@ -1,4 +1,5 @@
 from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.postgres.fields import ArrayField
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from polymorphic.models import PolymorphicModel
@@ -55,6 +56,23 @@ class VacancyStatistic(BaseVacancyStatistic):
         ]
 
 
+class VacancyRegionStatistic(BaseVacancyStatistic):
+    """
+    Where applicants to a vacancy live, see `jao_backend.application_statistics.regions`.
+    """
+
+    region_counts = ArrayField(models.PositiveIntegerField(), size=None, default=list)
+    """Count of applicants in each region, ordered as regions.REGIONS."""
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["vacancy"],
+                name="vacancy_region_statistic_unique_vacancy",
+            )
+        ]
+
+
 class AggregatedApplicationStatistic(BaseApplicationCategoryStatistic):
     object_id = models.PositiveIntegerField(db_index=True)
     """
@@ -0,0 +1,118 @@
+"""
+Where applicants to a vacancy live, by ONS region.
+
+Applicant postcodes are mapped to regions when statistics are aggregated, and each
+vacancy stores a count of applicants per region (`VacancyRegionStatistic`), ordered as
+REGIONS.  Requests sum those counts for a cohort of vacancies, there are no geographic
+lookups after aggregation.
+
+Postcodes are mapped by postcode area (the leading letters) to the region most of the
+area lies in.  A few areas cross region boundaries (e.g. CH, SY, TD), so counts near
+those boundaries are approximate.
+"""
+
+import re
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+import numpy as np
+
+REGIONS = [
+    ("E12000001", "North East"),
+    ("E12000002", "North West"),
+    ("E12000003", "Yorkshire and The Humber"),
+    ("E12000004", "East Midlands"),
+    ("E12000005", "West Midlands"),
+    ("E12000006", "East of England"),
+    ("E12000007", "London"),
+    ("E12000008", "South East"),
+    ("E12000009", "South West"),
+    ("W92000004", "Wales"),
+    ("S92000003", "Scotland"),
+    ("N92000002", "Northern Ireland"),
+]
+"""
+ONS region codes (areacd) and names, in the order of region counts.
+
+Stored counts depend on this order, add regions at the end.
+"""
+
+REGION_INDEXES = {area_code: i for i, (area_code, _) in enumerate(REGIONS)}
+
+POSTCODE_AREA_REGIONS = {
+    "E12000001": ["DH", "DL", "NE", "SR", "TS"],
+    "E12000002": [
+        "BB", "BL", "CA", "CH", "CW", "FY", "L", "LA", "M", "OL", "PR", "SK", "WA",
+        "WN",
+    ],
+    "E12000003": ["BD", "DN", "HD", "HG", "HU", "HX", "LS", "S", "WF", "YO"],
+    "E12000004": ["DE", "LE", "LN", "NG", "NN"],
+    "E12000005": ["B", "CV", "DY", "HR", "ST", "SY", "TF", "WR", "WS", "WV"],
+    "E12000006": [
+        "AL", "CB", "CM", "CO", "EN", "IP", "LU", "NR", "PE", "SG", "SS", "WD",
+    ],
+    "E12000007": [
+        "BR", "CR", "E", "EC", "HA", "IG", "N", "NW", "RM", "SE", "SM", "SW", "TW",
+        "UB", "W", "WC",
+    ],
+    "E12000008": [
+        "BN", "CT", "DA", "GU", "HP", "KT", "ME", "MK", "OX", "PO", "RG", "RH", "SL",
+        "SO", "TN",
+    ],
+    "E12000009": [
+        "BA", "BH", "BS", "DT", "EX", "GL", "PL", "SN", "SP", "TA", "TQ", "TR",
+    ],
+    "W92000004": ["CF", "LD", "LL", "NP", "SA"],
+    "S92000003": [
+        "AB", "DD", "DG", "EH", "FK", "G", "HS", "IV", "KA", "KW", "KY", "ML", "PA",
+        "PH", "TD", "ZE",
+    ],
+    "N92000002": ["BT"],
+}  # fmt: skip
+"""
+Postcode areas by region, Crown Dependencies (GY, JE, IM) are not in a region.
+"""
+
+POSTCODE_AREA_INDEXES = {
+    postcode_area: REGION_INDEXES[area_code]
+    for area_code, postcode_areas in POSTCODE_AREA_REGIONS.items()
+    for postcode_area in postcode_areas
+}
+
+POSTCODE_AREA_RE = re.compile(r"\s*([A-Za-z]{1,2})[0-9]")
+
+
+def get_postcode_region_index(postcode: Optional[str]) -> Optional[int]:
+    """
+    :param postcode: A full postcode, or its outward code, e.g. "SW1A 2AA" or "SW1A".
+    :return: Index of the postcode's region in REGIONS, or None if it isn't known.
+    """
+    if not postcode:
+        return None
+    match = POSTCODE_AREA_RE.match(postcode)
+    if match is None:
+        return None
+    return POSTCODE_AREA_INDEXES.get(match.group(1).upper())
+
+
+def get_region_frequencies(region_counts: Sequence[Sequence[int]]) -> List[dict]:
+    """
+    :param region_counts: Applicants per region of each vacancy, ordered as REGIONS.
+    :return: Percentage of applicants in each region, as AreaFrequencyProperties
+            fields, or [] if there are no applicants.
+    """
+    totals = np.zeros(len(REGIONS), dtype=np.int64)
+    for counts in region_counts:
+        # Vectors stored before a region was added are shorter.
+        totals[: len(counts)] += counts
+
+    total = totals.sum()
+    if not total:
+        return []
+
+    percentages = np.round(totals * 100.0 / total, 1).tolist()
+    return [
+        {"area_code": area_code, "area_name": area_name, "frequency": percentage}
+        for (area_code, area_name), percentage in zip(REGIONS, percentages)
+    ]
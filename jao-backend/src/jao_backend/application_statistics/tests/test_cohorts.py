@@ -0,0 +1,101 @@
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+
+from jao_backend.application_statistics.cohorts import baseline_cache
+from jao_backend.application_statistics.cohorts import compute_statistics_baseline
+from jao_backend.application_statistics.cohorts import get_cohort_figures
+from jao_backend.application_statistics.cohorts import get_cohort_ratios
+from jao_backend.application_statistics.cohorts import get_similarity_weights
+from jao_backend.application_statistics.cohorts import get_statistics_baseline
+from jao_backend.application_statistics.cohorts import statistics_version
+from jao_backend.application_statistics.cohorts import update_statistics_baseline
+from jao_backend.application_statistics.models import AgeGroup
+from jao_backend.application_statistics.models import AggregatedApplicationStatistic
+from jao_backend.application_statistics.models import Gender
+from jao_backend.vacancies.cache import bump_corpus_version
+from jao_backend.vacancies.cache import corpus_version
+from jao_backend.vacancies.tests.factories import VacancyFactory
+
+
+@pytest.fixture
+def statistics():
+    now = timezone.now()
+    young = AgeGroup.objects.create(id=1, description="16-24", last_updated=now)
+    older = AgeGroup.objects.create(id=2, description="25-29", last_updated=now)
+    female = Gender.objects.create(id=1, description="Female", last_updated=now)
+    vacancies = VacancyFactory.create_batch(3)
+
+    ratios = [
+        (vacancies[0], young, "0.4"),
+        (vacancies[0], older, "0.6"),
+        (vacancies[0], female, "1.0"),
+        (vacancies[1], older, "1.0"),
+        (vacancies[2], young, "1.0"),
+    ]
+    AggregatedApplicationStatistic.objects.bulk_create(
+        AggregatedApplicationStatistic(
+            vacancy=vacancy,
+            content_type=ContentType.objects.get_for_model(category),
+            object_id=category.pk,
+            ratio=Decimal(ratio),
+            updated_at=now,
+        )
+        for vacancy, category, ratio in ratios
+    )
+    return vacancies
+
+
+@pytest.mark.django_db
+def test_cohort_ratios(statistics):
+    """
+    Categories missing for a vacancy count as zero, if it has data for the
+    characteristic, otherwise the vacancy is left out of its mean.
+    """
+    baseline = compute_statistics_baseline()
+    assert baseline.characteristics == ["Age groups", "Genders"]
+    assert baseline.labels == ["16-24", "25-29", "Female"]
+    np.testing.assert_allclose(baseline.ratios, [1.4 / 3, 1.6 / 3, 1.0])
+
+    ratios = get_cohort_ratios(
+        [statistics[0].pk, statistics[1].pk],
+        get_similarity_weights([0.0, 0.5]),
+        baseline,
+    )
+    np.testing.assert_allclose(ratios, [0.4 / 1.5, 1.1 / 1.5, 1.0])
+
+
+@pytest.mark.django_db
+def test_cohort_figures(statistics):
+    baseline = compute_statistics_baseline()
+
+    figures = get_cohort_figures([statistics[2].pk], baseline=baseline)
+
+    assert len(figures) == 1
+    assert figures[0]["layout"]["title"]["text"] == "Age groups"
+    similar, everyone = figures[0]["data"]
+    assert similar["x"] == ["16-24", "25-29"]
+    assert similar["y"] == [1.0, 0.0]
+    assert everyone["y"] == [0.4667, 0.5333]
+
+    assert get_cohort_figures([], baseline=baseline) == []
+
+
+@pytest.mark.django_db
+def test_statistics_baseline_survives_corpus_bump(statistics, django_assert_num_queries):
+    """
+    The precomputed baseline is kept when embedding bumps the corpus version.
+    """
+    baseline = update_statistics_baseline()
+    bump_corpus_version()
+
+    with django_assert_num_queries(0):
+        cached = get_statistics_baseline()
+    np.testing.assert_array_equal(cached.ratios, baseline.ratios)
+
+    baseline_cache.local.clear()
+    statistics_version.cache.delete(statistics_version.key)
+    corpus_version.cache.delete(corpus_version.key)
@@ -0,0 +1,51 @@
+import pytest
+
+from jao_backend.application_statistics.regions import REGION_INDEXES
+from jao_backend.application_statistics.regions import REGIONS
+from jao_backend.application_statistics.regions import get_postcode_region_index
+from jao_backend.application_statistics.regions import get_region_frequencies
+
+
+@pytest.mark.parametrize(
+    "postcode,area_code",
+    [
+        ("SW1A 2AA", "E12000007"),
+        ("wc2n", "E12000007"),
+        ("W1", "E12000007"),
+        ("M1 1AE", "E12000002"),
+        ("EH1 1YZ", "S92000003"),
+        ("CF10 1EP", "W92000004"),
+        ("BT1 5GS", "N92000002"),
+        ("B1 1BB", "E12000005"),
+    ],
+)
+def test_get_postcode_region_index(postcode, area_code):
+    assert get_postcode_region_index(postcode) == REGION_INDEXES[area_code]
+
+
+@pytest.mark.parametrize("postcode", [None, "", "JE2 3AB", "Unknown", "1234"])
+def test_get_postcode_region_index_unknown(postcode):
+    assert get_postcode_region_index(postcode) is None
+
+
+def test_get_region_frequencies():
+    london = REGION_INDEXES["E12000007"]
+    wales = REGION_INDEXES["W92000004"]
+    first = [0] * len(REGIONS)
+    first[london] = 3
+    # Stored before the last region was added.
+    second = [0] * (len(REGIONS) - 1)
+    second[wales] = 1
+
+    frequencies = get_region_frequencies([first, second])
+
+    assert [frequency["area_code"] for frequency in frequencies] == [
+        area_code for area_code, _ in REGIONS
+    ]
+    assert frequencies[london] == {
+        "area_code": "E12000007",
+        "area_name": "London",
+        "frequency": 75.0,
+    }
+    assert frequencies[wales]["frequency"] == 25.0
+    assert get_region_frequencies([]) == []
@@ -0,0 +1,232 @@
+"""
+Two tier cache, an in-process LRU in front of a Django cache (Redis in deployment).
+
+The in-process tier avoids a network round trip for repeated keys within a worker, the
+Django cache shares entries between workers and processes.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from django.core.cache import caches
+from django_redis import get_redis_connection
+from django_redis.cache import RedisCache
+from django_redis.exceptions import ConnectionInterrupted
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+CACHE_ERRORS = (RedisError, ConnectionInterrupted)
+
+
+class LRUCache:
+    """
+    Thread safe LRU cache with a maximum size, and optional expiry in seconds.
+    """
+
+    def __init__(self, maxsize=1024, timeout=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                return default
+
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = timeout if timeout is not None else self.timeout
+        expires = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache:
+    """
+    LRUCache in front of a Django cache.
+
+    Entries expire after timeout seconds in both tiers.
+
+    If max_entries is set and the cache is django-redis, keys are tracked in a sorted
+    set by insertion time and the oldest are evicted once there are more than
+    max_entries.  Other cache backends have their own MAX_ENTRIES option.
+
+    Errors from Redis are logged and treated as a cache miss, so an outage makes
+    requests slower rather than failing them.
+
+    >>> cache = TieredCache("query-embedding", alias="embeddings", timeout=3600)
+    ... cache.set(key, value)
+    ... cache.get(key)
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        alias="default",
+        timeout: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        local_maxsize=1024,
+    ):
+        self.prefix = prefix
+        self.alias = alias
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.local = LRUCache(maxsize=local_maxsize, timeout=timeout)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    @property
+    def index_key(self):
+        return self.make_key("index")
+
+    def get(self, key: str, default=None):
+        value = self.local.get(key)
+        if value is not None:
+            return value
+
+        try:
+            value = self.cache.get(self.make_key(key))
+        except CACHE_ERRORS as e:
+            logger.warning("Cache get failed for %s: %s", self.prefix, e)
+            return default
+
+        if value is None:
+            return default
+
+        self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value):
+        self.local.set(key, value)
+        try:
+            self.cache.set(self.make_key(key), value, timeout=self.timeout)
+            self.evict(key)
+        except CACHE_ERRORS as e:
+            logger.warning("Cache set failed for %s: %s", self.prefix, e)
+
+    def evict(self, key: str):
+        """
+        Record key in the index, and remove the oldest keys above max_entries.
+        """
+        if not self.max_entries or not isinstance(self.cache, RedisCache):
+            return
+
+        client = get_redis_connection(self.alias)
+        cache_key = self.cache.make_key(self.make_key(key))
+        index_key = self.cache.make_key(self.index_key)
+
+        pipe = client.pipeline()
+        pipe.zadd(index_key, {cache_key: time.time()})
+        pipe.zcard(index_key)
+        if self.timeout:
+            # Entries in the index outlive their keys by at most timeout.
+            pipe.expire(index_key, self.timeout)
+        count = pipe.execute()[1]
+
+        overflow = count - self.max_entries
+        if overflow > 0:
+            oldest = [member for member, _ in client.zpopmin(index_key, overflow)]
+            if oldest:
+                client.delete(*oldest)
+
+    def delete(self, key: str):
+        self.local.delete(key)
+        try:
+            self.cache.delete(self.make_key(key))
+        except CACHE_ERRORS as e:
+            logger.warning("Cache delete failed for %s: %s", self.prefix, e)
+
+    def clear_local(self):
+        self.local.clear()
+
+
+class VersionStamp:
+    """
+    A counter in a Django cache, included in cache keys so that bumping it
+    invalidates every entry without scanning for keys.
+
+    The value is checked at most every check_interval seconds per process.
+
+    The counter starts at the current time in nanoseconds, rather than zero, so if the
+    key is evicted, old versions aren't reused.
+
+    >>> corpus_version = VersionStamp("corpus-version", alias="shared")
+    ... key = f"{corpus_version.get()}:{digest}"
+    ... corpus_version.bump()  # after the data changes
+    """
+
+    def __init__(self, key: str, alias="default", check_interval=5):
+        self.key = key
+        self.alias = alias
+        self.local = LRUCache(maxsize=1, timeout=check_interval)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self) -> Optional[int]:
+        """
+        :return: The current version, or None if the cache is unavailable.
+        """
+        version = self.local.get(self.key)
+        if version is not None:
+            return version
+
+        try:
+            self.cache.add(self.key, time.time_ns(), timeout=None)
+            version = self.cache.get(self.key)
+        except CACHE_ERRORS as e:
+            logger.warning("Could not read version %s: %s", self.key, e)
+            return None
+
+        if version is not None:
+            self.local.set(self.key, version)
+        return version
+
+    def bump(self) -> Optional[int]:
+        """
+        :return: The new version, or None if the cache is unavailable.
+        """
+        self.local.clear()
+        try:
+            try:
+                return self.cache.incr(self.key)
+            except ValueError:
+                # Not set yet.
+                self.cache.add(self.key, time.time_ns(), timeout=None)
+                return self.cache.incr(self.key)
+        except CACHE_ERRORS as e:
+            logger.warning("Could not bump version %s: %s", self.key, e)
+            return None
@@ -0,0 +1,45 @@
+"""
+Run synchronous database code from async views, in a bounded thread pool.
+
+sync_to_async(thread_sensitive=True) runs everything on one thread, so concurrent
+requests queue behind each other, thread_sensitive=False uses an unbounded number
+of threads, each with its own database connection.
+
+`db_sync_to_async` runs on a pool of settings.JAO_BACKEND_DB_THREADS threads, so
+there are at most that many connections per process.
+"""
+
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+
+@functools.cache
+def get_db_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=settings.JAO_BACKEND_DB_THREADS, thread_name_prefix="jao-db"
+    )
+
+
+def db_sync_to_async(fn):
+    """
+    Like asgiref's sync_to_async, but using the bounded database thread pool.
+
+    Each call is treated like a request: connections are closed before and after it
+    if they are unusable or older than CONN_MAX_AGE.
+
+    >>> vacancies = await db_sync_to_async(list)(Vacancy.objects.all()[:10])
+    """
+
+    @functools.wraps(fn)
+    def call(*args, **kwargs):
+        close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(call, thread_sensitive=False, executor=get_db_executor())
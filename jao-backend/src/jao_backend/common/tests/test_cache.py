@@ -0,0 +1,61 @@
+from jao_backend.common.cache import LRUCache
+from jao_backend.common.cache import TieredCache
+from jao_backend.common.cache import VersionStamp
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_lru_cache_timeout(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr("jao_backend.common.cache.time.monotonic", lambda: now)
+    cache = LRUCache(timeout=10)
+    cache.set("a", 1)
+
+    now += 11
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_tiered_cache_falls_back_to_shared_cache():
+    """
+    Entries missing from the local tier are read from the Django cache, and kept locally.
+    """
+    cache = TieredCache("test", alias="shared", timeout=60)
+    cache.set("key", b"value")
+
+    cache.clear_local()
+    assert cache.get("key") == b"value"
+    assert cache.local.get("key") == b"value"
+
+    cache.delete("key")
+    assert cache.get("key") is None
+
+
+def test_version_stamp_bump():
+    """
+    Bumping changes the version seen by other processes, and this one straight away.
+    """
+    stamp = VersionStamp("test-version", alias="shared", check_interval=60)
+    other_process = VersionStamp("test-version", alias="shared", check_interval=60)
+    version = stamp.get()
+    assert other_process.get() == version
+
+    assert stamp.bump() == version + 1
+    assert stamp.get() == version + 1
+
+    # Other processes see the new version after check_interval.
+    assert other_process.get() == version
+    other_process.local.clear()
+    assert other_process.get() == version + 1
+    stamp.cache.delete(stamp.key)
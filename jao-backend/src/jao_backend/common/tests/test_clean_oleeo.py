@@ -0,0 +1,124 @@
+"""
+The OLEEO tokenizer must give the same output as the bbcode library parser.
+"""
+
+import random
+
+import pytest
+
+from jao_backend.common.text_processing.clean_oleeo import parse_oleeo_bbcode
+from jao_backend.common.text_processing.clean_oleeo import (
+    parse_oleeo_bbcode_with_parser,
+)
+from jao_backend.common.text_processing.clean_oleeo import strip_oleeo_bbcode
+from jao_backend.common.text_processing.clean_oleeo import (
+    strip_oleeo_bbcode_with_parser,
+)
+
+GOLDEN_CORPUS = [
+    "",
+    "Plain text",
+    "  Leading and trailing whitespace  ",
+    "Line one\r\nLine two\rLine three\nLine four",
+    "[p]A paragraph[/p][p]Another paragraph[/p]",
+    "[P]Upper case tags[/P]",
+    "[p]Unclosed paragraph",
+    "Stray closing tag[/p] and text",
+    "[list=ul][li]First[/li][li]Second[/li][/list]",
+    "[list=ul]\r\n[li]First\r\n[/li]\r\n[li]Second[/li]\r\n[/list]",
+    "[LIST=UL][LI]Upper[/LI][/LIST]",
+    "[li]Unclosed item [li]nested[/li] after[/li]",
+    "[list][*]One[*]Two[/list]",
+    "Before[br]after",
+    "[p]Before[br]after[/p] outside",
+    "Salary: £30,000 - £40,000 & benefits",
+    "Quotes \"double\" and 'single' <b>html</b>",
+    "Dashes -- and --- and ... (c) (reg) (tm)",
+    "Apply at https://www.civil-service-careers.gov.uk/apply?id=1 today.",
+    "See www.gov.uk or example.com/jobs (or email jobs@example.com).",
+    "[p]Visit https://example.com/a_(b) and www.example.org.[/p]",
+    "Dear [insert name], please [click here]",
+    "Unbalanced [ bracket and ] bracket",
+    "Nested [[p]] brackets [[",
+    "Tag across lines [p\n]text[/p]",
+    "[ p ]Spaces in tag[/ p ]",
+    "[list=ul ][li]Item[/li][/list]",
+    "[b]Bold[/b] and [i]italic[/i] and [u]underline[/u]",
+    "[url=https://example.com]Link[/url]",
+    '[url="https://example.com"]Quoted link[/url]',
+    "[color=red]Red[/color] [quote]Quote[/quote] [code]x = 1[/code]",
+    "[hr] [center]Centre[/center] [sub]2[/sub] [sup]3[/sup] [s]strike[/s]",
+    "[]Empty tag[/]",
+    "Tab\tseparated\ttext",
+    "Unicode: café – naïve — “quotes”",
+    (
+        "[p]Job description[/p][p]About the role:[/p]\r\n"
+        "[list=ul][li]Manage a team of 5 people[/li]"
+        "[li]Work with stakeholders -- internal & external[/li]"
+        "[li]Report to the Director...[/li][/list]\r\n"
+        "[p]Find out more at www.gov.uk/government/organisations.[/p]"
+    ),
+]
+
+# Fragments for random texts, mostly OLEEO markup, with some text the library
+# tokenizes unusually.
+FRAGMENTS = [
+    "[p]",
+    "[/p]",
+    "[br]",
+    "[list=ul]",
+    "[/list]",
+    "[li]",
+    "[/li]",
+    "[*]",
+    "[b]",
+    "[/b]",
+    "[LI]",
+    "[ p ]",
+    "[url=",
+    '="',
+    "[",
+    "]",
+    "[x]",
+    "\r\n",
+    "\r",
+    "\n",
+    " ",
+    "text",
+    "&",
+    "<",
+    "'",
+    "--",
+    "-",
+    "...",
+    ".",
+    "(c)",
+    "www.gov.uk",
+    "https://example.com/x",
+    "example.com/a",
+    "(",
+    ")",
+]
+
+
+def random_texts(count, seed=1):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield "".join(rng.choices(FRAGMENTS, k=rng.randint(0, 30)))
+
+
+@pytest.mark.parametrize("text", GOLDEN_CORPUS)
+def test_strip_oleeo_bbcode_golden(text):
+    assert strip_oleeo_bbcode(text) == strip_oleeo_bbcode_with_parser(text)
+
+
+@pytest.mark.parametrize("text", GOLDEN_CORPUS)
+def test_parse_oleeo_bbcode_golden(text):
+    assert parse_oleeo_bbcode(text) == parse_oleeo_bbcode_with_parser(text)
+
+
+def test_oleeo_bbcode_random():
+    for text in random_texts(2000):
+        assert strip_oleeo_bbcode(text) == strip_oleeo_bbcode_with_parser(text), text
+        assert parse_oleeo_bbcode(text) == parse_oleeo_bbcode_with_parser(text), text
+
@@ -1,4 +1,16 @@
+"""
+OLEEO text uses a small subset of BBCode: [p], [br], [list=ul] and [li].
+
+`strip_oleeo_bbcode` and `parse_oleeo_bbcode` tokenize that subset in one pass, with
+precompiled patterns, and give the same output as the bbcode library parser they
+replace (kept as `strip_oleeo_bbcode_with_parser` and `parse_oleeo_bbcode_with_parser`).
+
+Text the fast path doesn't handle, other BBCode tags when rendering, or quoted tag
+options, falls back to the library parser.
+"""
+
 import bbcode
+import functools
 import re
 
 from jao_backend.common.text_processing.clean_bbcode import strip_bbcode
@@ -27,7 +39,9 @@ def oleeo_to_bbcode(text, strip_paragraphs=True):
     return text
 
 
+@functools.cache
 def get_oleeo_bbcode_parser():
+    # Parsers hold no state between format calls, so one is shared.
     parser = bbcode.Parser()
     parser.add_simple_formatter("br", "<br>")
     parser.add_simple_formatter("p", "<p>%(value)s</p>")
@@ -36,12 +50,263 @@ def get_oleeo_bbcode_parser():
     return parser
 
 
-def strip_oleeo_bbcode(text):
+def strip_oleeo_bbcode_with_parser(text):
     parser = get_oleeo_bbcode_parser()
     return strip_bbcode(text, parser=parser)
 
 
-def parse_oleeo_bbcode(text):
+def parse_oleeo_bbcode_with_parser(text):
     parser = get_oleeo_bbcode_parser()
     text = oleeo_to_bbcode(text, strip_paragraphs=False)
     return parser.format(text).strip()
+
+
+class UnsupportedMarkup(Exception):
+    """Text the tokenizer leaves to the bbcode library parser."""
+
+
+# Templates of the tags the tokenizer renders, as in get_oleeo_bbcode_parser.
+# [br] isn't standalone there, so it swallows the rest of its parent, this is kept.
+TEMPLATES = {
+    "br": "<br>",
+    "p": "<p>%(value)s</p>",
+    "list": "<ul>%(value)s</ul>",
+    "*": "<li>%(value)s</li>",
+}
+
+# Every tag the library parser recognises (its defaults and the OLEEO tags), stripped
+# by strip_oleeo_bbcode.
+RECOGNISED_TAGS = frozenset(
+    ["b", "i", "u", "s", "hr", "sub", "sup", "quote", "code", "center", "color", "url"]
+    + list(TEMPLATES)
+)
+
+NEWLINES_RE = re.compile(r"\r\n?")
+# A "[" is a tag if it is closed before the next "[", as in bbcode.Parser.tokenize.
+TAG_RE = re.compile(r"\[[^\[\]]*\]")
+# Tokens as split by bbcode.Parser.tokenize: every "[" starts a new token, which is
+# a tag if it is closed before the next "[".  Tokens aren't merged, which matters
+# when finding links in the text.
+TOKEN_RE = re.compile(r"\[[^\[\]]*\]?|[^\[]+")
+# Quoted options can contain brackets, these tags are left to the library.
+QUOTED_OPTION_RE = re.compile(r"\[[^\[\]]*=[^\[\]]*[\"']")
+# The name of a tag with options, e.g. list in [list=ul], see bbcode.Parser._parse_opts
+TAG_NAME_RE = re.compile(r"[^ =]*")
+LI_RE = re.compile(r"\[(/?)li\]", re.IGNORECASE)
+
+# Same as bbcode's _url_re, every match contains "." or "://".
+URL_RE = re.compile(
+    r"(?im)\b((?:https?://|www\d{0,3}[.]|[a-z0-9.\-]+[.][a-z]{2,4}/)"
+    r'(?:[^\s()<>]+|\([^\s()<>]+\))+(?:\([^\s()<>]+\)|[^\s`!()\[\]{};:\'".,<>?]))'
+)
+URL_TEMPLATE = '<a rel="nofollow" href="{href}">{text}</a>'
+ESCAPE = str.maketrans(
+    {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;"}
+)
+COSMETIC = {
+    "---": "&mdash;",
+    "--": "&ndash;",
+    "...": "&#8230;",
+    "(c)": "&copy;",
+    "(reg)": "&reg;",
+    "(tm)": "&trade;",
+}
+# Alternatives are tried left to right, so "---" is preferred to "--", as when the
+# library replaces each in turn.
+COSMETIC_RE = re.compile("|".join(re.escape(find) for find in COSMETIC))
+
+DATA = 0
+NEWLINE = 1
+START = 2
+END = 3
+
+# Deeper nesting is left to the library, which stops rendering tags at its recursion limit.
+MAX_DEPTH = 100
+
+
+@functools.lru_cache(maxsize=1024)
+def get_tag_name(tag):
+    """
+    :return: (tag name, is closing tag) for "[...]" text, or (None, False) if the
+            library wouldn't parse it as a tag.
+    """
+    if "\n" in tag:
+        return None, False
+    name = tag[1:-1].strip()
+    if not name:
+        return None, False
+    if name[0] == "/":
+        return name[1:].strip().lower(), True
+    if "=" in name or " " in name:
+        name = TAG_NAME_RE.match(name).group()
+    return name.strip().lower(), False
+
+
+def normalise_newlines(text):
+    """
+    :raise UnsupportedMarkup: If the library would tokenize text differently.
+    """
+    if QUOTED_OPTION_RE.search(text):
+        raise UnsupportedMarkup()
+    return NEWLINES_RE.sub("\n", text)
+
+
+def add_data(tokens, text):
+    """
+    Add text as DATA and NEWLINE tokens, as bbcode.Parser._newline_tokenize does.
+    """
+    parts = text.split("\n")
+    last = len(parts) - 1
+    for i, part in enumerate(parts):
+        if part:
+            tokens.append((DATA, part))
+        if i < last:
+            tokens.append((NEWLINE, "\n"))
+
+
+def tokenize(text):
+    """
+    Split text into (kind, value) tokens in one pass, as bbcode.Parser.tokenize does.
+
+    Tags are (START or END, tag name), other text is DATA or NEWLINE.
+
+    :raise UnsupportedMarkup: For text the library would tokenize differently, or
+            tags it would render other than by TEMPLATES.
+    """
+    text = normalise_newlines(text)
+    tokens = []
+    for match in TOKEN_RE.finditer(text):
+        token = match.group()
+        if token[0] == "[" and token[-1] == "]":
+            name, closing = get_tag_name(token)
+            if name in TEMPLATES:
+                tokens.append((END if closing else START, name))
+                continue
+            if name in RECOGNISED_TAGS:
+                raise UnsupportedMarkup()
+        add_data(tokens, token)
+    return tokens
+
+
+def strip_tag(match):
+    tag = match.group()
+    name, _ = get_tag_name(tag)
+    return "" if name in RECOGNISED_TAGS else tag
+
+
+def replace_link(match):
+    url = match.group(0)
+    href = url if "://" in url else "http://" + url
+    return URL_TEMPLATE.format(href=href.replace('"', "%22"), text=url)
+
+
+def transform(text):
+    """
+    Link URLs, escape HTML and make cosmetic replacements in a DATA token, as
+    bbcode.Parser._transform does.
+    """
+    links = {}
+    if "." in text or "://" in text:
+        pos = 0
+        while True:
+            match = URL_RE.search(text, pos)
+            if not match:
+                break
+            placeholder = "{{ bbcode-link-%s }}" % len(links)
+            links[placeholder] = replace_link(match)
+            start, end = match.span()
+            text = text[:start] + placeholder + text[end:]
+            pos = start
+
+    text = text.translate(ESCAPE)
+    text = COSMETIC_RE.sub(lambda match: COSMETIC[match.group()], text)
+    for placeholder, replacement in links.items():
+        text = text.replace(placeholder, replacement)
+    return text
+
+
+def find_closing(tokens, pos, end, name):
+    """
+    :return: Position of the END token that closes the tag name, or end.
+    """
+    nested = 0
+    while pos < end:
+        kind, value = tokens[pos]
+        if value == name:
+            if kind == START:
+                nested += 1
+            elif kind == END:
+                if not nested:
+                    return pos
+                nested -= 1
+        pos += 1
+    return end
+
+
+def render(tokens, pos, end, depth=1):
+    """
+    Render tokens[pos:end] as bbcode.Parser._format_tokens does, newlines are "\\r".
+    """
+    if depth >= MAX_DEPTH:
+        raise UnsupportedMarkup()
+
+    formatted = []
+    while pos < end:
+        kind, value = tokens[pos]
+        if kind == DATA:
+            formatted.append(transform(value))
+        elif kind == NEWLINE:
+            formatted.append("\r")
+        elif kind == START:
+            closing = find_closing(tokens, pos + 1, end, value)
+            inner = render(tokens, pos + 1, closing, depth + 1)
+            formatted.append(TEMPLATES[value] % {"value": inner})
+            pos = closing
+        # END tags that weren't matched to a START are dropped.
+        pos += 1
+    return "".join(formatted)
+
+
+def replace_li(text):
+    """
+    [li]...[/li] to [*]..., other [li] and [/li] removed, as oleeo_to_bbcode does.
+    """
+    parts = []
+    pos = 0
+    # A [li] opens an item if there is a [/li] later on, which closes it.
+    open_li = None
+    for match in LI_RE.finditer(text):
+        parts.append(text[pos : match.start()])
+        pos = match.end()
+        if match.group(1):
+            if open_li is not None:
+                parts[open_li] = "[*]"
+                open_li = None
+        elif open_li is None:
+            open_li = len(parts)
+            parts.append("")
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def strip_oleeo_bbcode(text):
+    """
+    :return: text without BBCode tags, e.g. for embedding.
+    """
+    try:
+        text = normalise_newlines(text)
+    except UnsupportedMarkup:
+        return strip_oleeo_bbcode_with_parser(text)
+    return TAG_RE.sub(strip_tag, text)
+
+
+def parse_oleeo_bbcode(text):
+    """
+    :return: text rendered as HTML.
+    """
+    try:
+        tokens = tokenize(replace_li(text))
+        html = render(tokens, 0, len(tokens))
+    except UnsupportedMarkup:
+        return parse_oleeo_bbcode_with_parser(text)
+    return html.replace("\r", "<br />").strip()
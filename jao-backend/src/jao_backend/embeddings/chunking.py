@@ -1,7 +1,179 @@
-class ChunkingStrategy:
-    def chunk(self, embedding_vectors):
+"""
+Chunking and pooling of text that may not fit an embedding model's context window.
+
+Text is split into overlapping windows of tokens by `TokenWindowChunker`, every
+window is embedded, then a `PoolingStrategy` combines the chunk vectors.
+
+The same chunker and pooling strategy are used when indexing and when querying,
+both are configured per `EmbeddingTag` (see `EmbeddingTag.get_chunker` and
+`EmbeddingTag.get_pooling_strategy`).
+"""
+
+from typing import List
+from typing import Optional
+
+import numpy as np
+from litellm import decode
+from litellm import encode
+
+
+class TokenWindowChunker:
+    """
+    Split text into sliding windows of `chunk_size` tokens, consecutive windows
+    share `chunk_overlap` tokens.
+
+    Tokens are counted with litellm, which uses the model's own tokenizer where
+    one is known and falls back to tiktoken (cl100k) otherwise, so chunk_size
+    should leave some headroom below the model's context window.
+
+    >>> chunker = TokenWindowChunker("nomic-embed-text:latest", chunk_size=3)
+    >>> chunker.chunk("one two three four five")
+    ['one two three', ' four five']
+    """
+
+    def __init__(
+        self,
+        model: str,
+        chunk_size: Optional[int] = None,
+        chunk_overlap: int = 0,
+        max_chunks: Optional[int] = None,
+    ):
+        """
+        :param model: litellm model name, used to pick a tokenizer.
+        :param chunk_size: Tokens per chunk, if None text is not chunked.
+        :param chunk_overlap: Tokens shared between consecutive chunks.
+        :param max_chunks: Cap on the chunks per text, this caps the token cost of embedding one text.
+        """
+        if chunk_size is not None and chunk_size <= chunk_overlap:
+            raise ValueError(
+                f"chunk_size ({chunk_size}) must be larger than chunk_overlap ({chunk_overlap})"
+            )
+
+        self.model = model
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap or 0
+        self.max_chunks = max_chunks
+
+    def window_bounds(self, token_count: int) -> List[tuple]:
+        """
+        :return: [(start, end), ...] token offsets of each window.
+        """
+        if self.chunk_size is None or token_count <= self.chunk_size:
+            return [(0, token_count)]
+
+        step = self.chunk_size - self.chunk_overlap
+        bounds = []
+        for start in range(0, token_count, step):
+            end = min(start + self.chunk_size, token_count)
+            bounds.append((start, end))
+            if end == token_count:
+                break
+
+        if self.max_chunks is not None:
+            bounds = bounds[: self.max_chunks]
+        return bounds
+
+    def chunk_tokens(self, text: str) -> List[List[int]]:
+        tokens = encode(model=self.model, text=text)
+        return [tokens[start:end] for start, end in self.window_bounds(len(tokens))]
+
+    def chunk(self, text: str) -> List[str]:
+        """
+        :return: The text of each chunk.
+        """
+        if self.chunk_size is None:
+            return [text]
+
+        return [
+            decode(model=self.model, tokens=tokens)
+            for tokens in self.chunk_tokens(text)
+        ]
+
+    def chunk_with_weights(self, text: str):
+        """
+        :return: (chunks, weights) where weights are the token counts of each chunk.
+        """
+        if self.chunk_size is None:
+            return [text], np.ones(1, dtype=np.float32)
+
+        token_chunks = self.chunk_tokens(text)
+        chunks = [decode(model=self.model, tokens=tokens) for tokens in token_chunks]
+        weights = np.fromiter(
+            (len(tokens) for tokens in token_chunks),
+            dtype=np.float32,
+            count=len(token_chunks),
+        )
+        return chunks, weights
+
+
+class PoolingStrategy:
+    """
+    Combine the vectors of a text's chunks.
+
+    pool() takes an (n_chunks, dimensions) array, and returns an (n, dimensions)
+    array, where n is 1 unless the strategy retains chunks.
+    """
+
+    name = None
+
+    def pool(self, vectors: np.ndarray, weights: Optional[np.ndarray] = None):
         raise NotImplementedError
 
-class MeanStrategy(ChunkingStrategy):
-    def chunk(self, embedding_vectors):
-        return np.mean(embedding_vectors, axis=0)
\ No newline at end of file
+
+class MeanPooling(PoolingStrategy):
+    """
+    Mean of the chunk vectors, weighted by token count if weights are given, so that a short
+    trailing chunk doesn't count as much as a full one.
+    """
+
+    name = "mean"
+
+    def pool(self, vectors, weights=None):
+        return np.average(vectors, axis=0, weights=weights)[np.newaxis, :]
+
+
+class MaxPooling(PoolingStrategy):
+    """Element-wise maximum of the chunk vectors."""
+
+    name = "max"
+
+    def pool(self, vectors, weights=None):
+        return vectors.max(axis=0, keepdims=True)
+
+
+class FirstChunkPooling(PoolingStrategy):
+    """Only use the first chunk, this matches the behaviour of truncating text."""
+
+    name = "first"
+
+    def pool(self, vectors, weights=None):
+        return vectors[:1]
+
+
+class ChunkRetention(PoolingStrategy):
+    """Keep every chunk vector, these are saved with their chunk_index."""
+
+    name = "chunks"
+
+    def pool(self, vectors, weights=None):
+        return vectors
+
+
+POOLING_STRATEGIES = {
+    strategy.name: strategy
+    for strategy in (MeanPooling, MaxPooling, FirstChunkPooling, ChunkRetention)
+}
+
+POOLING_CHOICES = [(name, name) for name in POOLING_STRATEGIES]
+
+
+def get_pooling_strategy(name: str) -> PoolingStrategy:
+    """
+    :param name: One of the keys of POOLING_STRATEGIES.
+    """
+    try:
+        return POOLING_STRATEGIES[name]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown pooling strategy '{name}', choose from: {', '.join(POOLING_STRATEGIES)}"
+        )
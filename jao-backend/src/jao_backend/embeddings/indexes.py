@@ -0,0 +1,477 @@
+"""
+Approximate nearest neighbour (ANN) indexes on the Embedding subclass tables.
+
+Each Embedding subclass stores one vector size in its own table, each table gets one
+pgvector index named by `get_vector_index_name`.
+
+Migrations create HNSW indexes with default parameters, the `build_vector_indexes`
+management command can build them with other parameters or switch to IVFFlat.
+
+Search time parameters (hnsw.ef_search, ivfflat.probes) are set per query with
+`vector_search_settings`.
+
+Indexes can be quantised, to fit more of them in memory: "halfvec" indexes 16 bit
+floats (half the size), "bit" indexes the sign of each dimension (1/32 of the size),
+compared by Hamming distance.  Tables keep the full precision vectors, the candidates
+found in a quantised index are re-ranked by exact cosine distance, see
+`search_nearest_ids`.  Check the recall with: manage.py check_vector_recall
+
+Migrations only create "vector" indexes, so searches check the definition of the index
+that exists, see `get_search_quantisation`.
+"""
+
+import logging
+import math
+from contextlib import contextmanager
+from typing import Iterable
+from typing import Optional
+
+import numpy as np
+from django.conf import settings
+from django.contrib.postgres.indexes import OpClass
+from django.db import connections
+from django.db import transaction
+from django.db.models import F
+from django.db.models import Func
+from django.db.models import Value
+from django.db.models.functions import Cast
+from pgvector.django import BitField
+from pgvector.django import CosineDistance
+from pgvector.django import HalfVectorField
+from pgvector.django import HammingDistance
+from pgvector.django import HnswIndex
+from pgvector.django import IvfflatIndex
+
+from jao_backend.common.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+HNSW = "hnsw"
+IVFFLAT = "ivfflat"
+VECTOR_INDEX_TYPES = (HNSW, IVFFLAT)
+
+# Similarity search uses cosine distance, indexes must use the matching operator class.
+VECTOR_INDEX_OPCLASS = "vector_cosine_ops"
+
+VECTOR = "vector"
+HALFVEC = "halfvec"
+BIT = "bit"
+VECTOR_QUANTISATIONS = (VECTOR, HALFVEC, BIT)
+
+QUANTISED_INDEX_OPCLASSES = {HALFVEC: "halfvec_cosine_ops", BIT: "bit_hamming_ops"}
+
+# Defaults used by migrations, these match pgvector's own defaults.
+DEFAULT_HNSW_M = 16
+DEFAULT_HNSW_EF_CONSTRUCTION = 64
+
+# pgvector rejects larger values of hnsw.ef_search.
+MAX_HNSW_EF_SEARCH = 1000
+
+_search_quantisations = LRUCache(
+    maxsize=64, timeout=settings.JAO_BACKEND_VECTOR_INDEX_CHECK_INTERVAL
+)
+
+
+def get_vector_index_name(model_name: str) -> str:
+    """
+    :param model_name: Lower case model name, e.g. "embeddingtiny"
+
+    The name doesn't depend on the index type, so rebuilding as a different type replaces
+    the existing index.
+    """
+    return f"{model_name}_ann_idx"
+
+
+def get_vector_quantisation(model) -> str:
+    """
+    Quantisation of the index on an Embedding subclass.
+
+    settings.JAO_BACKEND_VECTOR_QUANTISATION is one of VECTOR_QUANTISATIONS for every
+    subclass, or set per subclass, e.g. "embeddingxl=bit,embeddinglarge=halfvec", others
+    are "vector".
+    """
+    setting = settings.JAO_BACKEND_VECTOR_QUANTISATION.replace(" ", "")
+    if "=" in setting:
+        quantisations = dict(item.split("=", 1) for item in setting.split(",") if item)
+        quantisation = quantisations.get(model._meta.model_name, VECTOR)
+    else:
+        quantisation = setting or VECTOR
+
+    if quantisation not in VECTOR_QUANTISATIONS:
+        raise ValueError(
+            f"Unknown quantisation '{quantisation}', choose from: {', '.join(VECTOR_QUANTISATIONS)}"
+        )
+    return quantisation
+
+
+def get_index_quantisation(model, using="default") -> Optional[str]:
+    """
+    :return: Quantisation of the existing index on an Embedding subclass, from its
+            definition in pg_indexes, or None if it has no index.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname = %s",
+            [model._meta.db_table, get_vector_index_name(model._meta.model_name)],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+
+    for quantisation, opclass in QUANTISED_INDEX_OPCLASSES.items():
+        if opclass in row[0]:
+            return quantisation
+    return VECTOR
+
+
+def get_search_quantisation(model, using="default") -> str:
+    """
+    Quantisation searches of an Embedding subclass use: the configured one, see
+    `get_vector_quantisation`, if its index was built with it, otherwise "vector".
+    A quantised search without a matching index would scan every row.
+
+    The index is checked at most every JAO_BACKEND_VECTOR_INDEX_CHECK_INTERVAL seconds.
+    """
+    configured = get_vector_quantisation(model)
+    if configured == VECTOR:
+        return VECTOR
+
+    key = (using, model._meta.model_name, configured)
+    quantisation = _search_quantisations.get(key)
+    if quantisation is None:
+        index_quantisation = get_index_quantisation(model, using=using)
+        quantisation = configured
+        if index_quantisation != configured:
+            logger.warning(
+                "%s is configured for a %s index, but its index is %s, searching "
+                "vectors instead.  Rebuild it with: manage.py build_vector_indexes --rebuild",
+                model.__name__,
+                configured,
+                index_quantisation or "missing",
+            )
+            quantisation = VECTOR
+        _search_quantisations.set(key, quantisation)
+    return quantisation
+
+
+class BinaryQuantize(Func):
+    """
+    pgvector binary_quantize, 1 for each dimension greater than zero.
+    """
+
+    function = "binary_quantize"
+    output_field = BitField()
+
+
+def quantised_embedding(dimensions: int, quantisation: str, expression="embedding"):
+    """
+    :return: expression cast to the quantised type, the same as the index expression,
+            so postgres can use the index.
+    """
+    if quantisation == HALFVEC:
+        return Cast(expression, HalfVectorField(dimensions=dimensions))
+    elif quantisation == BIT:
+        return Cast(BinaryQuantize(expression), BitField(length=dimensions))
+    return F(expression)
+
+
+def vector_index(
+    model_name: str, index_type=HNSW, quantisation=VECTOR, dimensions=None, **params
+):
+    """
+    :return: A pgvector Django index for the embedding field of the model.
+
+    :param model_name: Lower case model name, e.g. "embeddingtiny"
+    :param index_type: "hnsw" or "ivfflat"
+    :param quantisation: "vector", "halfvec" or "bit"
+    :param dimensions: Embedding size, needed to quantise.
+    :param params: m, ef_construction for HNSW, lists for IVFFlat.
+    """
+    if quantisation == VECTOR:
+        expressions = ()
+        kwargs = {"fields": ["embedding"], "opclasses": [VECTOR_INDEX_OPCLASS]}
+    elif quantisation in QUANTISED_INDEX_OPCLASSES:
+        expressions = (
+            OpClass(
+                quantised_embedding(dimensions, quantisation),
+                name=QUANTISED_INDEX_OPCLASSES[quantisation],
+            ),
+        )
+        kwargs = {}
+    else:
+        raise ValueError(
+            f"Unknown quantisation '{quantisation}', choose from: {', '.join(VECTOR_QUANTISATIONS)}"
+        )
+    kwargs["name"] = get_vector_index_name(model_name)
+
+    if index_type == HNSW:
+        return HnswIndex(
+            *expressions,
+            m=params.get("m") or DEFAULT_HNSW_M,
+            ef_construction=params.get("ef_construction")
+            or DEFAULT_HNSW_EF_CONSTRUCTION,
+            **kwargs,
+        )
+    elif index_type == IVFFLAT:
+        return IvfflatIndex(*expressions, lists=params.get("lists"), **kwargs)
+
+    raise ValueError(
+        f"Unknown index type '{index_type}', choose from: {', '.join(VECTOR_INDEX_TYPES)}"
+    )
+
+
+def default_ivfflat_lists(row_count: int) -> int:
+    """
+    Number of IVFFlat lists, following the pgvector recommendation:
+    rows / 1000 up to 1M rows and sqrt(rows) above that.
+    """
+    if row_count > 1_000_000:
+        return int(math.sqrt(row_count))
+    return max(row_count // 1000, 1)
+
+
+def vector_index_exists(model, name=None, using="default") -> bool:
+    name = name or get_vector_index_name(model._meta.model_name)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_indexes WHERE tablename = %s AND indexname = %s",
+            [model._meta.db_table, name],
+        )
+        return cursor.fetchone() is not None
+
+
+def build_vector_index(
+    model,
+    index_type=None,
+    quantisation=None,
+    rebuild=False,
+    using="default",
+    **params,
+):
+    """
+    Build the ANN index for an Embedding subclass with CREATE INDEX CONCURRENTLY,
+    so that search and embedding can continue while the index builds.
+
+    On rebuild the new index is built under a temporary name, then swapped in.
+
+    Must be called outside a transaction (CONCURRENTLY is not allowed in one).
+
+    :param model: Embedding subclass.
+    :param index_type: "hnsw" or "ivfflat", defaults to settings.JAO_BACKEND_VECTOR_INDEX_TYPE
+    :param quantisation: "vector", "halfvec" or "bit", defaults to the quantisation
+            searches use, see get_vector_quantisation.
+    :param rebuild: Replace an existing index.
+    :param params: m, ef_construction for HNSW, lists for IVFFlat; defaults come from settings.
+    :return: True if an index was built.
+    """
+    index_type = index_type or settings.JAO_BACKEND_VECTOR_INDEX_TYPE
+    quantisation = quantisation or get_vector_quantisation(model)
+    connection = connections[using]
+    model_name = model._meta.model_name
+    name = get_vector_index_name(model_name)
+
+    if index_type == HNSW:
+        params.setdefault("m", settings.JAO_BACKEND_HNSW_M)
+        params.setdefault("ef_construction", settings.JAO_BACKEND_HNSW_EF_CONSTRUCTION)
+    elif index_type == IVFFLAT and not params.get("lists"):
+        # IVFFlat clusters existing rows, so should be built once the table is populated.
+        params["lists"] = settings.JAO_BACKEND_IVFFLAT_LISTS or default_ivfflat_lists(
+            model.objects.using(using).count()
+        )
+
+    exists = vector_index_exists(model, name, using=using)
+    if exists and not rebuild:
+        logger.info("%s already exists, skipping.", name)
+        return False
+
+    index = vector_index(
+        model_name,
+        index_type=index_type,
+        quantisation=quantisation,
+        dimensions=model.dimensions,
+        **params,
+    )
+    if exists:
+        index.name = f"{name}_new"
+
+    logger.info(
+        "Building %s %s index %s on %s %s",
+        quantisation,
+        index_type,
+        index.name,
+        model._meta.db_table,
+        params,
+    )
+    with connection.schema_editor(atomic=False) as schema_editor:
+        if vector_index_exists(model, index.name, using=using):
+            # Left over from an interrupted rebuild.
+            schema_editor.execute(f"DROP INDEX CONCURRENTLY {index.name}")
+
+        schema_editor.execute(index.create_sql(model, schema_editor, concurrently=True))
+
+        if exists:
+            schema_editor.execute(f"DROP INDEX CONCURRENTLY {name}")
+            schema_editor.execute(f"ALTER INDEX {index.name} RENAME TO {name}")
+
+    # Other processes see the new index after JAO_BACKEND_VECTOR_INDEX_CHECK_INTERVAL.
+    _search_quantisations.clear()
+    return True
+
+
+def drop_vector_index(model, using="default"):
+    name = get_vector_index_name(model._meta.model_name)
+    with connections[using].schema_editor(atomic=False) as schema_editor:
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+@contextmanager
+def vector_search_settings(
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    using="default",
+):
+    """
+    Set pgvector search parameters for queries run inside the block.
+
+    Higher values trade speed for recall:
+    - ef_search: candidate list size for HNSW indexes.
+    - probes: lists searched in IVFFlat indexes.
+
+    SET LOCAL only lasts for a transaction, so the block runs in one, querysets must be
+    evaluated inside it.
+
+    >>> with vector_search_settings(ef_search=100):
+    ...     results = list(queryset.order_by("distance")[:10])
+    """
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            # set_config(..., is_local=true) is SET LOCAL, but accepts parameters.
+            if ef_search:
+                cursor.execute(
+                    "SELECT set_config('hnsw.ef_search', %s, true)", [str(int(ef_search))]
+                )
+            if probes:
+                cursor.execute(
+                    "SELECT set_config('ivfflat.probes', %s, true)", [str(int(probes))]
+                )
+        yield
+
+
+def binary_quantise(vector) -> str:
+    """
+    :return: Bit string of the vector, as binary_quantize in postgres.
+    """
+    return "".join(np.where(np.asarray(vector) > 0, "1", "0"))
+
+
+def quantised_distance(query_vector, quantisation: str):
+    """
+    :return: Distance from the quantised embedding to query_vector, the Hamming distance
+            for "bit", or the cosine distance.
+    """
+    embedding = quantised_embedding(len(query_vector), quantisation)
+    if quantisation == BIT:
+        return HammingDistance(embedding, Value(binary_quantise(query_vector)))
+    return CosineDistance(embedding, query_vector)
+
+
+def get_rerank_fetch(fetch: int, quantisation: str) -> int:
+    """
+    :return: Candidates to fetch from the index, for the exact fetch nearest of them.
+    """
+    if quantisation == VECTOR:
+        return fetch
+    return min(fetch * settings.JAO_BACKEND_VECTOR_RERANK_OVERFETCH, MAX_HNSW_EF_SEARCH)
+
+
+def search_nearest_ids(
+    queryset, query_vector, fetch, distance_function=CosineDistance, exact=False
+):
+    """
+    Ids of the fetch rows of queryset nearest to query_vector.
+
+    With a quantised index, get_rerank_fetch candidates are found in the index, then
+    re-ranked by the exact distance, see `get_search_quantisation`.
+
+    :param queryset: QuerySet of one Embedding subclass.
+    :param exact: Compare against every row instead of using the index.
+    :return: list of ids, nearest first.
+    """
+    distance = distance_function("embedding", query_vector)
+    if exact:
+        # The ANN index only serves ORDER BY embedding <=> query.
+        distance = distance + Value(0.0)
+        return list(
+            queryset.annotate(distance=distance)
+            .order_by("distance")
+            .values_list("pk", flat=True)[:fetch]
+        )
+
+    quantisation = get_search_quantisation(queryset.model, using=queryset.db)
+    if quantisation != VECTOR and distance_function is CosineDistance:
+        candidate_ids = list(
+            queryset.annotate(
+                quantised_distance=quantised_distance(query_vector, quantisation)
+            )
+            .order_by("quantised_distance")
+            .values_list("pk", flat=True)[: get_rerank_fetch(fetch, quantisation)]
+        )
+        queryset = queryset.filter(pk__in=candidate_ids)
+        distance = distance + Value(0.0)
+
+    return list(
+        queryset.annotate(distance=distance)
+        .order_by("distance")
+        .values_list("pk", flat=True)[:fetch]
+    )
+
+
+def recall_at_k(expected_ids: Iterable, found_ids: Iterable) -> float:
+    """
+    :return: Fraction of expected_ids (the exact nearest) in found_ids.
+    """
+    expected_ids = set(expected_ids)
+    if not expected_ids:
+        return 1.0
+    return len(expected_ids.intersection(found_ids)) / len(expected_ids)
+
+
+def measure_recall(
+    model,
+    queries=100,
+    k=10,
+    ef_search=None,
+    probes=None,
+    using="default",
+) -> Optional[float]:
+    """
+    Mean recall@k of searching the index of an Embedding subclass, as configured, for
+    a sample of its own vectors.
+
+    :param queries: Number of vectors to sample as queries.
+    :param ef_search: HNSW search candidates, default settings.JAO_BACKEND_HNSW_EF_SEARCH
+    :param probes: IVFFlat lists to search, default settings.JAO_BACKEND_IVFFLAT_PROBES
+    :return: Mean recall, or None if the table is empty.
+    """
+    queryset = model.objects.using(using).non_polymorphic()
+    query_vectors = list(
+        queryset.filter(embedding__isnull=False)
+        .order_by("?")
+        .values_list("embedding", flat=True)[:queries]
+    )
+    if not query_vectors:
+        return None
+
+    quantisation = get_search_quantisation(model, using=using)
+    ef_search = ef_search or settings.JAO_BACKEND_HNSW_EF_SEARCH
+    recalls = []
+    for query_vector in query_vectors:
+        expected_ids = search_nearest_ids(queryset, query_vector, k, exact=True)
+        with vector_search_settings(
+            ef_search=max(ef_search, get_rerank_fetch(k, quantisation)),
+            probes=probes or settings.JAO_BACKEND_IVFFLAT_PROBES,
+            using=using,
+        ):
+            found_ids = search_nearest_ids(queryset, query_vector, k)
+        recalls.append(recall_at_k(expected_ids, found_ids))
+    return sum(recalls) / len(recalls)
@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.core.management import CommandError
+
+from jao_backend.embeddings.indexes import VECTOR_INDEX_TYPES
+from jao_backend.embeddings.indexes import VECTOR_QUANTISATIONS
+from jao_backend.embeddings.indexes import build_vector_index
+from jao_backend.embeddings.indexes import drop_vector_index
+from jao_backend.embeddings.models import Embedding
+
+
+def get_models(names):
+    """
+    :param names: Embedding subclass names, case insensitive, or None for all of them.
+    """
+    subclasses = {
+        subclass.__name__.lower(): subclass
+        for subclass in Embedding.get_subclasses_by_dimensions().values()
+    }
+    if not names:
+        return list(subclasses.values())
+
+    try:
+        return [subclasses[name.lower()] for name in names]
+    except KeyError as e:
+        raise CommandError(
+            f"Unknown embedding model {e}, choose from: {', '.join(subclasses)}"
+        )
+
+
+class Command(BaseCommand):
+    help = "Build or rebuild the HNSW / IVFFlat indexes on the embedding tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--type",
+            choices=VECTOR_INDEX_TYPES,
+            default=settings.JAO_BACKEND_VECTOR_INDEX_TYPE,
+            help="Index type (default is settings.JAO_BACKEND_VECTOR_INDEX_TYPE)",
+        )
+        parser.add_argument(
+            "--quantisation",
+            choices=VECTOR_QUANTISATIONS,
+            help="Index full precision vectors, halfvec or bit vectors (default is "
+            "settings.JAO_BACKEND_VECTOR_QUANTISATION, which searches also use)",
+        )
+        parser.add_argument(
+            "--model",
+            action="append",
+            dest="models",
+            help="Embedding model to index, e.g. EmbeddingXL (default: all of them), may be repeated.",
+        )
+        parser.add_argument("--m", type=int, help="HNSW: connections per layer")
+        parser.add_argument(
+            "--ef-construction",
+            type=int,
+            help="HNSW: size of the candidate list when building",
+        )
+        parser.add_argument(
+            "--lists",
+            type=int,
+            help="IVFFlat: number of lists (default is derived from the row count)",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Replace existing indexes, the old index is used until the new one is ready.",
+        )
+        parser.add_argument(
+            "--drop", action="store_true", help="Drop the indexes instead."
+        )
+
+    def handle(self, *args, **options):
+        params = {
+            key: options[key]
+            for key in ("m", "ef_construction", "lists")
+            if options[key] is not None
+        }
+
+        for model in get_models(options["models"]):
+            if options["drop"]:
+                drop_vector_index(model)
+                self.stdout.write(f"Dropped index on {model.__name__}.")
+                continue
+
+            built = build_vector_index(
+                model,
+                index_type=options["type"],
+                quantisation=options["quantisation"],
+                rebuild=options["rebuild"],
+                **params,
+            )
+            if built:
+                self.stdout.write(f"Built {options['type']} index on {model.__name__}.")
+            else:
+                self.stdout.write(
+                    f"{model.__name__} is already indexed, use --rebuild to replace it."
+                )
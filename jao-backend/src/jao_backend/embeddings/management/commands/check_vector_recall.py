@@ -0,0 +1,61 @@
+from django.core.management import BaseCommand
+from django.core.management import CommandError
+
+from jao_backend.embeddings.indexes import get_search_quantisation
+from jao_backend.embeddings.indexes import measure_recall
+from jao_backend.embeddings.management.commands.build_vector_indexes import get_models
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure recall@k of similarity search on the embedding tables, the fraction "
+        "of the exact k nearest embeddings the index finds, for a sample of queries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model",
+            action="append",
+            dest="models",
+            help="Embedding model to check, e.g. EmbeddingXL (default: all of them), may be repeated.",
+        )
+        parser.add_argument(
+            "--queries",
+            type=int,
+            default=100,
+            help="Stored vectors sampled as queries.",
+        )
+        parser.add_argument("-k", type=int, default=10, help="Results per query.")
+        parser.add_argument("--ef-search", type=int, help="HNSW: search candidates")
+        parser.add_argument("--probes", type=int, help="IVFFlat: lists to search")
+        parser.add_argument(
+            "--min-recall",
+            type=float,
+            help="Exit with an error if the recall of any model is below this.",
+        )
+
+    def handle(self, *args, **options):
+        failed = []
+        for model in get_models(options["models"]):
+            recall = measure_recall(
+                model,
+                queries=options["queries"],
+                k=options["k"],
+                ef_search=options["ef_search"],
+                probes=options["probes"],
+            )
+            if recall is None:
+                self.stdout.write(f"{model.__name__}: no embeddings.")
+                continue
+
+            self.stdout.write(
+                f"{model.__name__} ({get_search_quantisation(model)}): "
+                f"recall@{options['k']} {recall:.3f}"
+            )
+            if options["min_recall"] is not None and recall < options["min_recall"]:
+                failed.append(model.__name__)
+
+        if failed:
+            raise CommandError(
+                f"Recall below {options['min_recall']}: {', '.join(failed)}"
+            )
@@ -0,0 +1,21 @@
+from django.core.management import BaseCommand
+
+from jao_backend.common.management.helpers import TaskCommandMixin
+from jao_backend.vacancies.tasks import write_vacancy_embedding_snapshots
+
+
+class Command(TaskCommandMixin, BaseCommand):
+    help = "Write the memory mapped vacancy embedding snapshots used for similarity search."
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Write snapshots even if the embeddings haven't changed.",
+        )
+
+    def handle(self, *args, **options):
+        super().run_task(
+            options, write_vacancy_embedding_snapshots, force=options["force"]
+        )
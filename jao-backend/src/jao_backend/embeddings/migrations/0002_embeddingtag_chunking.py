@@ -0,0 +1,55 @@
+# Generated by Django 5.0.14 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("embeddings", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="embeddingtag",
+            name="chunk_size",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Tokens per chunk, if empty text is embedded whole.",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="embeddingtag",
+            name="chunk_overlap",
+            field=models.PositiveIntegerField(
+                blank=True,
+                default=0,
+                help_text="Tokens shared between consecutive chunks.",
+            ),
+        ),
+        migrations.AddField(
+            model_name="embeddingtag",
+            name="max_chunks",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Maximum chunks embedded per text, caps the token cost per text.",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="embeddingtag",
+            name="pooling",
+            field=models.CharField(
+                choices=[
+                    ("mean", "mean"),
+                    ("max", "max"),
+                    ("first", "first"),
+                    ("chunks", "chunks"),
+                ],
+                default="mean",
+                help_text="How chunk embeddings are combined.",
+                max_length=10,
+            ),
+        ),
+    ]
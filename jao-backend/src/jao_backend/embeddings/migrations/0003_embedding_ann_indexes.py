@@ -0,0 +1,68 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:41
+
+import pgvector.django.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run in a transaction, this avoids locking the
+    # embedding tables while the indexes build.
+    atomic = False
+
+    dependencies = [
+        ("embeddings", "0002_embeddingtag_chunking"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="embeddingtiny",
+            index=pgvector.django.indexes.HnswIndex(
+                ef_construction=64,
+                fields=["embedding"],
+                m=16,
+                name="embeddingtiny_ann_idx",
+                opclasses=["vector_cosine_ops"],
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="embeddingsmall",
+            index=pgvector.django.indexes.HnswIndex(
+                ef_construction=64,
+                fields=["embedding"],
+                m=16,
+                name="embeddingsmall_ann_idx",
+                opclasses=["vector_cosine_ops"],
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="embeddingbase",
+            index=pgvector.django.indexes.HnswIndex(
+                ef_construction=64,
+                fields=["embedding"],
+                m=16,
+                name="embeddingbase_ann_idx",
+                opclasses=["vector_cosine_ops"],
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="embeddinglarge",
+            index=pgvector.django.indexes.HnswIndex(
+                ef_construction=64,
+                fields=["embedding"],
+                m=16,
+                name="embeddinglarge_ann_idx",
+                opclasses=["vector_cosine_ops"],
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="embeddingxl",
+            index=pgvector.django.indexes.HnswIndex(
+                ef_construction=64,
+                fields=["embedding"],
+                m=16,
+                name="embeddingxl_ann_idx",
+                opclasses=["vector_cosine_ops"],
+            ),
+        ),
+    ]
@@ -1,8 +1,12 @@
+import asyncio
+import hashlib
 import logging
 
 from cachemethod import lru_cachemethod
 from functools import cache
 from typing import List
+from typing import Tuple
+from typing import Union
 
 import numpy as np
 
@@ -14,9 +18,17 @@ from pgvector.django import VectorField
 from polymorphic.models import PolymorphicModel
 
 from litellm import APIConnectionError, completion_cost
+from litellm import aembedding
 from litellm import embedding
 
+from jao_backend.common.cache import TieredCache
 from jao_backend.common.db.fields import UUIDField
+from jao_backend.embeddings.chunking import MeanPooling
+from jao_backend.embeddings.chunking import POOLING_CHOICES
+from jao_backend.embeddings.chunking import TokenWindowChunker
+from jao_backend.embeddings.chunking import get_pooling_strategy
+from jao_backend.embeddings.indexes import vector_index
+from jao_backend.embeddings.singleflight import SingleFlight
 from jao_backend.embeddings.querysets import EmbeddingTagQuerySet
 
 logger = logging.getLogger(__name__)
@@ -24,6 +36,22 @@ logger = logging.getLogger(__name__)
 LITELLM_API_BASE = settings.LITELLM_API_BASE
 LITELLM_CUSTOM_PROVIDER = settings.LITELLM_CUSTOM_PROVIDER
 
+query_embedding_cache = TieredCache(
+    "query-embedding",
+    alias="shared",
+    timeout=settings.JAO_BACKEND_QUERY_EMBEDDING_CACHE_TIMEOUT,
+    max_entries=settings.JAO_BACKEND_QUERY_EMBEDDING_CACHE_MAX_ENTRIES,
+    local_maxsize=settings.JAO_BACKEND_QUERY_EMBEDDING_CACHE_LOCAL_MAXSIZE,
+)
+"""Query vectors, stored as float32 bytes, see EmbeddingTag.embed_query."""
+
+query_embedding_flight = SingleFlight(
+    "query-embedding",
+    alias="shared",
+    lock_timeout=settings.JAO_BACKEND_EMBEDDING_LOCK_TIMEOUT,
+)
+"""Concurrent requests to embed the same query share one embedding call."""
+
 
 class EmbeddingModel(models.Model):
     """Configurable vector types"""
@@ -107,6 +135,9 @@ class EmbeddingTiny(Embedding):
 
     embedding = VectorField(dimensions=384, null=True)
 
+    class Meta:
+        indexes = [vector_index("embeddingtiny")]
+
 
 class EmbeddingSmall(Embedding):
     """
@@ -116,6 +147,9 @@ class EmbeddingSmall(Embedding):
 
     embedding = VectorField(dimensions=512, null=True)
 
+    class Meta:
+        indexes = [vector_index("embeddingsmall")]
+
 
 class EmbeddingBase(Embedding):
     """
@@ -125,6 +159,9 @@ class EmbeddingBase(Embedding):
 
     embedding = VectorField(dimensions=768, null=True)
 
+    class Meta:
+        indexes = [vector_index("embeddingbase")]
+
 
 class EmbeddingLarge(Embedding):
     """
@@ -134,6 +171,9 @@ class EmbeddingLarge(Embedding):
 
     embedding = VectorField(dimensions=1024, null=True)
 
+    class Meta:
+        indexes = [vector_index("embeddinglarge")]
+
 
 class EmbeddingXL(Embedding):
     """
@@ -143,6 +183,9 @@ class EmbeddingXL(Embedding):
 
     embedding = VectorField(dimensions=1536, null=True)
 
+    class Meta:
+        indexes = [vector_index("embeddingxl")]
+
 
 class EmbeddingTag(models.Model):
     """
@@ -172,6 +215,25 @@ class EmbeddingTag(models.Model):
     version = models.IntegerField(
         help_text="The version of the embedding tag.", default=0, blank=True, null=True
     )
+    chunk_size = models.PositiveIntegerField(
+        help_text="Tokens per chunk, if empty text is embedded whole.",
+        null=True,
+        blank=True,
+    )
+    chunk_overlap = models.PositiveIntegerField(
+        help_text="Tokens shared between consecutive chunks.", default=0, blank=True
+    )
+    max_chunks = models.PositiveIntegerField(
+        help_text="Maximum chunks embedded per text, caps the token cost per text.",
+        null=True,
+        blank=True,
+    )
+    pooling = models.CharField(
+        max_length=10,
+        choices=POOLING_CHOICES,
+        default=MeanPooling.name,
+        help_text="How chunk embeddings are combined.",
+    )
 
     objects = EmbeddingTagQuerySet.as_manager()
 
@@ -185,10 +247,11 @@ class EmbeddingTag(models.Model):
         ]
 
     @lru_cachemethod(maxsize=1)
-    def embed(self, text: str):
+    def embed(self, text: Union[str, Tuple[str, ...]]):
         """
         Call LITELLM to embed the text using this tag's model.
 
+        :param text: Text, or a tuple of chunks of text that are embedded in one request.
         :return: litellm.EmbeddingResponse, see litellm.embedding
                 https://deepwiki.com/mikeplavsky/litellm/2.1-completion-and-embedding-functions#example-usage---embedding
         """
@@ -198,7 +261,28 @@ class EmbeddingTag(models.Model):
         try:
             response = embedding(
                 model=self.model.name,
-                input=text,
+                input=list(text) if isinstance(text, tuple) else text,
+                api_base=LITELLM_API_BASE,
+                custom_llm_provider=LITELLM_CUSTOM_PROVIDER,
+            )
+        except APIConnectionError as e:
+            logger.error(
+                "Connection refused to the embedding service. "
+                "Ensure the service is running and accessible: %s",
+                e,
+            )
+            raise
+
+        return response
+
+    async def aembed(self, text: Union[str, Tuple[str, ...]]):
+        """
+        Async version of `embed`, the event loop isn't blocked waiting on the provider.
+        """
+        try:
+            response = await aembedding(
+                model=self.model.name,
+                input=list(text) if isinstance(text, tuple) else text,
                 api_base=LITELLM_API_BASE,
                 custom_llm_provider=LITELLM_CUSTOM_PROVIDER,
             )
@@ -212,6 +296,114 @@ class EmbeddingTag(models.Model):
 
         return response
 
+    def get_chunker(self) -> TokenWindowChunker:
+        return TokenWindowChunker(
+            self.model.name,
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
+            max_chunks=self.max_chunks,
+        )
+
+    def get_pooling_strategy(self):
+        return get_pooling_strategy(self.pooling)
+
+    def embed_text(self, text: str):
+        """
+        Chunk, embed and pool text using this tag's chunking and pooling settings.
+
+        All chunks of the text are sent in one request to the embedding provider.
+
+        :return: (vectors, response) where vectors is an (n, dimensions) array, n is 1 unless
+                 the pooling strategy retains chunks.  response is the litellm response.
+        """
+        chunks, weights = self.get_chunker().chunk_with_weights(text)
+        response = self.embed(tuple(chunks))
+        return self.pool_response(response, weights), response
+
+    async def aembed_text(self, text: str):
+        """
+        Async version of `embed_text`.
+        """
+        chunks, weights = self.get_chunker().chunk_with_weights(text)
+        response = await self.aembed(tuple(chunks))
+        return self.pool_response(response, weights), response
+
+    def pool_response(self, response, weights) -> np.ndarray:
+        vectors = np.asarray(self.response_chunks(response), dtype=np.float32)
+        if len(vectors) != len(weights):
+            # Some providers drop empty chunks, weights no longer line up.
+            weights = None
+        return self.get_pooling_strategy().pool(vectors, weights)
+
+    def get_query_cache_key(self, text: str) -> str:
+        """
+        Cache key for the query embedding of text.
+
+        Whitespace is normalised, so resubmitting text that only differs in layout
+        is a cache hit.
+        """
+        normalised_text = " ".join(text.split())
+        digest = hashlib.sha256(
+            f"{self.chunk_size}:{self.chunk_overlap}:{self.max_chunks}:{self.pooling}:"
+            f"{normalised_text}".encode()
+        ).hexdigest()
+        return f"{self.uuid}:{self.version}:{self.model.name}:{digest}"
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """
+        Embed query text, in the same way as indexed text, to a single vector.
+
+        If the pooling strategy retains chunks, then the chunks are averaged for the query.
+
+        Vectors are cached in `query_embedding_cache`, shared between workers, and
+        concurrent calls for the same text make one embedding call.
+        """
+        key = self.get_query_cache_key(text)
+        cached = query_embedding_cache.get(key)
+        if cached is not None:
+            return np.frombuffer(cached, dtype=np.float32)
+
+        def embed_and_cache():
+            vectors, _ = self.embed_text(text)
+            return self.cache_query_vectors(key, vectors)
+
+        vector_bytes = query_embedding_flight.do(
+            key, embed_and_cache, lookup=lambda: query_embedding_cache.get(key)
+        )
+        return np.frombuffer(vector_bytes, dtype=np.float32)
+
+    async def aembed_query(self, text: str) -> np.ndarray:
+        """
+        Async version of `embed_query`.
+        """
+        key = self.get_query_cache_key(text)
+        # The cache may be a network call to Redis.
+        cached = await asyncio.to_thread(query_embedding_cache.get, key)
+        if cached is not None:
+            return np.frombuffer(cached, dtype=np.float32)
+
+        async def embed_and_cache():
+            vectors, _ = await self.aembed_text(text)
+            return await asyncio.to_thread(self.cache_query_vectors, key, vectors)
+
+        vector_bytes = await query_embedding_flight.ado(
+            key, embed_and_cache, lookup=lambda: query_embedding_cache.get(key)
+        )
+        return np.frombuffer(vector_bytes, dtype=np.float32)
+
+    @staticmethod
+    def cache_query_vectors(key: str, vectors: np.ndarray) -> bytes:
+        """
+        Pool vectors to one query vector and cache it.
+
+        :return: The query vector as float32 bytes.
+        """
+        if len(vectors) > 1:
+            vectors = MeanPooling().pool(vectors)
+        vector_bytes = vectors[0].astype(np.float32).tobytes()
+        query_embedding_cache.set(key, vector_bytes)
+        return vector_bytes
+
     @staticmethod
     def completion_cost(response, **kwargs):
         """
@@ -252,6 +444,8 @@ class EmbeddingTag(models.Model):
         """
         tags = {}
         for tag_data in settings.EMBEDDING_TAGS.values():
+            # Copy, so settings are unchanged if this is called again after cache_clear.
+            tag_data = dict(tag_data)
             model_name = tag_data.pop("model")
             model, _ = EmbeddingModel.objects.get_or_create(
                 name=model_name, defaults={"is_active": True}
@@ -299,6 +493,12 @@ class TaggedEmbedding(models.Model):
         help_text="The chunk ID of the embedding.", default=0, blank=True, null=True
     )
 
+    chunk_parent_field = None
+    """
+    Field shared by the chunks of one document, e.g. "vacancy_id", so searches can
+    rank documents rather than chunks.
+    """
+
     class Meta:
         verbose_name_plural = "Tagged Embeddings"
         abstract = True
@@ -317,7 +517,12 @@ class TaggedEmbedding(models.Model):
 
         kwargs should be used to filter to a specific model of cls, this is used to
         clear previous embeddings.
+
+        Vectors are L2 normalised, cosine distances are unchanged, and quantised
+        indexes (see jao_backend.embeddings.indexes) compare vectors of the same scale.
         """
+        from jao_backend.embeddings.search import normalise
+
         assert kwargs, "kwargs must be provided to filter the model of cls."
 
         with transaction.atomic():
@@ -338,7 +543,7 @@ class TaggedEmbedding(models.Model):
                     cls(
                         tag=tag,
                         embedding=embedding_model.objects.create(
-                            embedding=chunk, embedding_model=tag.model
+                            embedding=normalise(chunk), embedding_model=tag.model
                         ),
                         chunk_index=i,
                         **kwargs,
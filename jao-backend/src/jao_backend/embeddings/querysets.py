@@ -7,6 +7,8 @@ from django.db.models import Subquery
 from django.db.models import When
 from pgvector.django.functions import CosineDistance
 
+from jao_backend.embeddings.indexes import search_nearest_ids
+
 
 class PolymorphicEmbeddingQuerySetMixin:
 
@@ -48,6 +50,95 @@ class PolymorphicEmbeddingQuerySetMixin:
 
         return self.annotate(distance=distance_function(embedding_case, query_vector))
 
+    def nearest(
+        self,
+        query_vector,
+        top_n=10,
+        base_lookup_prefix="embedding",
+        distance_function=CosineDistance,
+        candidates=None,
+        fetch=None,
+        exact=False,
+    ):
+        """
+        The top_n rows with embeddings nearest to query_vector, annotated with distance.
+
+        Unlike `distance`, this queries a single Embedding subclass table, picked by the
+        dimensions of query_vector:
+
+            ORDER BY embeddingtiny.embedding <=> query LIMIT top_n
+
+        so postgres can use the ANN index on that table.  Only the winning top_n are
+        joined back to this queryset.
+
+        The nearest embeddings are found when this is called, if search settings are
+        needed (see `vector_search_settings`), call it inside that block.
+
+        :param candidates: QuerySet searched for the nearest embeddings, default this
+                one.  Pass an unfiltered queryset to search the ANN index, then apply
+                this queryset's filters to the results.
+        :param fetch: Number of embeddings to fetch from the search, default top_n.
+                When candidates are filtered afterwards, fetch more than top_n and slice.
+        :param exact: Compare against every candidate instead of using the ANN index,
+                for small candidate sets, where the index would drop filtered rows.
+        :return: QuerySet ordered by distance.
+        """
+        from jao_backend.embeddings.models import Embedding
+
+        if not callable(distance_function):
+            raise TypeError("distance_function must be a callable")
+
+        subclass = Embedding.get_subclass_for_embedding_dimensions(len(query_vector))
+        nearest_ids = self.nearest_embedding_ids(
+            query_vector,
+            fetch or top_n,
+            base_lookup_prefix=base_lookup_prefix,
+            distance_function=distance_function,
+            candidates=candidates,
+            exact=exact,
+        )
+
+        # Distance is recalculated for top_n rows only, against the one subclass table.
+        field_path = f"{base_lookup_prefix}__{subclass._meta.model_name}__embedding"
+        return (
+            self.filter(**{f"{base_lookup_prefix}_id__in": nearest_ids})
+            .annotate(distance=distance_function(F(field_path), query_vector))
+            .order_by("distance")
+        )
+
+    def nearest_embedding_ids(
+        self,
+        query_vector,
+        fetch,
+        base_lookup_prefix="embedding",
+        distance_function=CosineDistance,
+        candidates=None,
+        exact=False,
+    ):
+        """
+        Ids of the fetch embeddings nearest to query_vector, see `nearest`.
+
+        If the subclass has a quantised index, its candidates are re-ranked by the exact
+        distance, see `search_nearest_ids`.
+
+        :return: list of Embedding ids, nearest first.
+        """
+        from jao_backend.embeddings.models import Embedding
+
+        subclass = Embedding.get_subclass_for_embedding_dimensions(len(query_vector))
+        if candidates is None:
+            candidates = self
+
+        return search_nearest_ids(
+            subclass.objects.non_polymorphic().filter(
+                pk__in=candidates.values(f"{base_lookup_prefix}_id")
+            ),
+            query_vector,
+            fetch,
+            distance_function=distance_function,
+            exact=exact,
+        )
+
 
 class EmbeddingTagQuerySet(models.QuerySet, PolymorphicEmbeddingQuerySetMixin):
     def configured_models(self):
@@ -0,0 +1,457 @@
+"""
+Exact in-memory similarity search.
+
+For a corpus of tens of thousands of vectors, one matrix-vector product in NumPy is
+faster than a round trip to pgvector, and keeps search load off the database.
+
+`NumpyVectorIndex` holds the vectors for one TaggedEmbedding model and tag as a
+contiguous, L2 normalised float32 matrix, so cosine distance is 1 - matrix @ query.
+
+Long documents are embedded as several chunks, if the model sets chunk_parent_field
+the index can rank documents instead of chunks, see `NumpyVectorIndex.search`.
+
+For large vectors, search can run in two stages (settings.JAO_BACKEND_FIRST_STAGE_*):
+candidates are found with a copy of the vectors reduced to fewer dimensions, see
+`Projection`, then re-ranked with the full vectors.
+"""
+
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count
+from django.db.models import Max
+
+from jao_backend.embeddings.models import Embedding
+
+logger = logging.getLogger(__name__)
+
+PGVECTOR = "pgvector"
+NUMPY = "numpy"
+SNAPSHOT = "snapshot"
+SIMILARITY_SEARCH_BACKENDS = (PGVECTOR, NUMPY, SNAPSHOT)
+
+# How the distances of a document's chunks are combined to rank the document.
+MIN = "min"
+MEAN = "mean"
+CHUNK_POOLINGS = (MIN, MEAN)
+
+# How vectors are reduced for the first stage of two stage search.
+TRUNCATE = "truncate"
+PCA = "pca"
+REDUCTIONS = (TRUNCATE, PCA)
+
+# Rows sampled to fit a PCA projection.
+PCA_SAMPLE_SIZE = 20_000
+
+
+def normalise(vectors: np.ndarray) -> np.ndarray:
+    """
+    L2 normalise vectors (1D or rows of a 2D array) as float32, zero vectors stay zero.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def top_n_indices(distances: np.ndarray, top_n: int) -> np.ndarray:
+    """
+    :return: Indices of the top_n smallest distances, smallest first.
+    """
+    top_n = min(top_n, len(distances))
+    if top_n < len(distances):
+        nearest = np.argpartition(distances, top_n - 1)[:top_n]
+    else:
+        nearest = np.arange(len(distances))
+    return nearest[np.argsort(distances[nearest], kind="stable")]
+
+
+class Projection:
+    """
+    Reduces normalised vectors to fewer dimensions, for the first stage of search.
+
+    - "truncate" keeps the first dimensions, normalised again.  Models trained with
+      Matryoshka representation learning keep most of their quality this way.
+    - "pca" projects onto the top principal components, fitted with an SVD of a sample
+      of the vectors, so dot products approximate the dot products of the full vectors.
+
+    >>> projection = Projection.fit(vectors, "pca", dimensions=256)
+    ... reduced = projection.project(vectors)
+    ... scores = reduced @ projection.project(query_vector)
+    """
+
+    def __init__(self, method: str, dimensions: int, components=None):
+        if method not in REDUCTIONS:
+            raise ValueError(
+                f"Unknown reduction '{method}', choose from: {', '.join(REDUCTIONS)}"
+            )
+        self.method = method
+        self.dimensions = dimensions
+        self.components = components
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, method: str, dimensions: int) -> "Projection":
+        if method != PCA:
+            return cls(method, dimensions)
+
+        rows = np.arange(len(vectors))
+        if len(rows) > PCA_SAMPLE_SIZE:
+            rows = np.sort(
+                np.random.default_rng(0).choice(rows, PCA_SAMPLE_SIZE, replace=False)
+            )
+        # Not centred, the projection preserves dot products rather than variance.
+        _, _, vt = np.linalg.svd(np.asarray(vectors[rows]), full_matrices=False)
+        components = np.zeros((dimensions, vectors.shape[1]), dtype=np.float32)
+        components[: len(vt)] = vt[:dimensions]
+        return cls(method, dimensions, components)
+
+    @classmethod
+    def from_settings(cls, vectors: np.ndarray) -> Optional["Projection"]:
+        """
+        :return: Projection configured by settings.JAO_BACKEND_FIRST_STAGE_REDUCTION,
+                or None if two stage search is off, or wouldn't reduce these vectors.
+        """
+        method = settings.JAO_BACKEND_FIRST_STAGE_REDUCTION
+        dimensions = settings.JAO_BACKEND_FIRST_STAGE_DIMENSIONS
+        if not method or not len(vectors) or dimensions >= vectors.shape[1]:
+            return None
+        return cls.fit(vectors, method, dimensions)
+
+    def matches_settings(self) -> bool:
+        return (self.method, self.dimensions) == (
+            settings.JAO_BACKEND_FIRST_STAGE_REDUCTION,
+            settings.JAO_BACKEND_FIRST_STAGE_DIMENSIONS,
+        )
+
+    def project(self, vectors) -> np.ndarray:
+        """
+        :param vectors: Normalised vector, or rows of vectors.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.method == TRUNCATE:
+            return normalise(vectors[..., : self.dimensions])
+        return np.ascontiguousarray(vectors @ self.components.T)
+
+    def save(self, file):
+        np.savez(
+            file,
+            method=np.array(self.method),
+            dimensions=np.array(self.dimensions),
+            components=np.empty(0) if self.components is None else self.components,
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "Projection":
+        with np.load(path) as data:
+            components = data["components"]
+            return cls(
+                str(data["method"]),
+                int(data["dimensions"]),
+                components if components.size else None,
+            )
+
+
+class NumpyVectorIndex:
+    """
+    Brute force top-k search over the embeddings of one TaggedEmbedding model and tag.
+
+    Rows are loaded once, then new rows are appended by id watermark.  If rows were
+    deleted (e.g. a vacancy was re-embedded) the index is reloaded.
+
+    Each row also stores its model.chunk_parent_field (e.g. vacancy_id) as its group,
+    or its own id if the model doesn't set one.
+
+    >>> index = NumpyVectorIndex(VacancyEmbedding, tag, dimensions=384)
+    ... ids, distances = index.search(query_vector, top_n=10)
+    """
+
+    def __init__(self, model, tag, dimensions: int, refresh_interval=None):
+        """
+        :param model: TaggedEmbedding subclass, e.g. VacancyEmbedding
+        :param tag: EmbeddingTag
+        :param dimensions: Embedding size, picks the Embedding subclass table.
+        :param refresh_interval: Seconds between checks for new rows,
+                default settings.JAO_BACKEND_NUMPY_INDEX_REFRESH_INTERVAL
+        """
+        self.model = model
+        self.tag = tag
+        self.dimensions = dimensions
+        self.embedding_subclass = Embedding.get_subclass_for_embedding_dimensions(
+            dimensions
+        )
+        if refresh_interval is None:
+            refresh_interval = settings.JAO_BACKEND_NUMPY_INDEX_REFRESH_INTERVAL
+        self.refresh_interval = refresh_interval
+
+        self.group_field = getattr(model, "chunk_parent_field", None) or "pk"
+
+        # ids, vectors and groups are replaced together, so readers never see a mix.
+        self.arrays = self.empty_arrays()
+        self.watermark = 0
+        self.refreshed_at = None
+        self._lock = threading.Lock()
+
+        # First stage of two stage search, (arrays, projection, reduced vectors),
+        # replaced together under the lock by `update_reduced`.
+        self.reduced = (None, None, None)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def ids(self):
+        return self.arrays[0]
+
+    @property
+    def vectors(self):
+        return self.arrays[1]
+
+    @property
+    def groups(self):
+        return self.arrays[2]
+
+    @property
+    def projection(self) -> Optional[Projection]:
+        return self.reduced[1]
+
+    def empty_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return (
+            np.empty(0, dtype=np.int64),
+            np.empty((0, self.dimensions), dtype=np.float32),
+            np.empty(0, dtype=np.int64),
+        )
+
+    def get_queryset(self):
+        embedding_path = f"embedding__{self.embedding_subclass._meta.model_name}__embedding"
+        return (
+            self.model.objects.filter(tag=self.tag)
+            .filter(**{f"{embedding_path}__isnull": False})
+            .order_by("pk")
+            .values_list("pk", embedding_path, self.group_field)
+        )
+
+    def load(self, after=0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :return: (ids, vectors, groups) of rows with pk greater than after.
+        """
+        rows = list(self.get_queryset().filter(pk__gt=after))
+        if not rows:
+            return self.empty_arrays()
+
+        ids, vectors, groups = zip(*rows)
+        return (
+            np.array(ids, dtype=np.int64),
+            normalise(np.vstack(vectors)),
+            np.array(groups, dtype=np.int64),
+        )
+
+    def refresh_due(self, now) -> bool:
+        return (
+            self.refreshed_at is None
+            or now - self.refreshed_at >= self.refresh_interval
+        )
+
+    def refresh(self, force=False):
+        """
+        Load new rows, or reload everything if rows were deleted.
+
+        Checks the database at most once every refresh_interval seconds, unless forced.
+        """
+        now = time.monotonic()
+        if not (force or self.refresh_due(now)):
+            return
+
+        with self._lock:
+            stats = self.get_queryset().aggregate(count=Count("pk"), max_id=Max("pk"))
+            max_id = stats["max_id"] or 0
+
+            if max_id > self.watermark:
+                ids, vectors, groups = self.load(after=self.watermark)
+                if len(self.ids) + len(ids) == stats["count"]:
+                    self.arrays = (
+                        np.concatenate([self.ids, ids]),
+                        np.vstack([self.vectors, vectors]),
+                        np.concatenate([self.groups, groups]),
+                    )
+                    self.watermark = int(ids[-1])
+                    self.update_reduced(appended=vectors)
+                    logger.debug("Added %s rows to %s", len(ids), self)
+                else:
+                    # Rows were deleted as well as added.
+                    self._reload()
+            elif stats["count"] != len(self.ids):
+                self._reload()
+            elif self.reduced[0] is not self.arrays:
+                self.update_reduced()
+
+            self.refreshed_at = now
+
+    def _reload(self):
+        self.arrays = self.load()
+        self.watermark = int(self.ids[-1]) if len(self.ids) else 0
+        # Fitted again, to the current rows.
+        self.reduced = (None, None, None)
+        self.update_reduced()
+        logger.info("Loaded %s rows into %s", len(self.ids), self)
+
+    def update_reduced(self, appended=None):
+        """
+        Reduce the vectors of self.arrays for two stage search, call with self._lock
+        held.  The projection is fitted here, during refresh, never during a search.
+
+        :param appended: Vectors appended to the previously reduced arrays, only these
+                are projected if the projection still matches the settings.
+        """
+        reduced_arrays, projection, reduced = self.reduced
+        if projection is None or not projection.matches_settings():
+            projection = Projection.from_settings(self.vectors)
+            appended = None
+
+        if projection is None:
+            reduced = None
+        elif appended is not None and reduced_arrays is not None:
+            reduced = np.vstack([reduced, projection.project(appended)])
+        else:
+            reduced = projection.project(self.vectors)
+        self.reduced = (self.arrays, projection, reduced)
+
+    def search(
+        self, query_vector, top_n=10, allowed_ids=None, pooling=None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        With two stage search on, only the rows from `get_candidate_rows` are compared
+        with the full vectors.
+
+        :param allowed_ids: Only return rows with these ids, e.g. from a filtered queryset.
+        :param pooling: Rank groups instead of rows, by the "min" or "mean" distance of
+                their rows.  The nearest row of each of the top_n groups is returned,
+                with the pooled distance.
+        :return: (ids, distances) of the top_n nearest rows by cosine distance, nearest first.
+        """
+        self.refresh()
+        arrays = self.arrays
+        ids, vectors, groups = arrays
+        if not len(ids):
+            return ids, np.empty(0, dtype=np.float32)
+
+        query_vector = normalise(query_vector)
+        rows = None
+        if allowed_ids is not None:
+            rows = np.flatnonzero(np.isin(ids, allowed_ids))
+            if not len(rows):
+                return ids[rows], np.empty(0, dtype=np.float32)
+
+        candidate_rows = self.get_candidate_rows(arrays, query_vector, top_n, rows)
+        if candidate_rows is not None:
+            rows = candidate_rows
+
+        if rows is None:
+            distances = 1.0 - vectors @ query_vector
+        else:
+            ids, groups = ids[rows], groups[rows]
+            distances = 1.0 - vectors[rows] @ query_vector
+
+        if pooling == MIN:
+            nearest = self.nearest_per_group(distances, groups, top_n)
+            return ids[nearest], distances[nearest]
+        if pooling == MEAN:
+            return self.mean_per_group(ids, distances, groups, top_n)
+
+        nearest = top_n_indices(distances, top_n)
+        return ids[nearest], distances[nearest]
+
+    def get_candidate_rows(
+        self, arrays, query_vector, top_n, rows=None
+    ) -> Optional[np.ndarray]:
+        """
+        First stage of two stage search, rows nearest to query_vector by their reduced
+        vectors, and the other rows of their groups, so chunks can still be pooled.
+
+        :param rows: Only consider these rows.
+        :return: Rows to re-rank with the full vectors, or None if two stage search is
+                off, there are too few rows for it to help, or arrays haven't been
+                reduced yet, see `update_reduced`.
+        """
+        fetch = top_n * settings.JAO_BACKEND_FIRST_STAGE_OVERFETCH
+        if fetch >= (len(arrays[0]) if rows is None else len(rows)):
+            return None
+        reduced_arrays, projection, reduced = self.reduced
+        if (
+            reduced_arrays is not arrays
+            or projection is None
+            or not projection.matches_settings()
+        ):
+            return None
+
+        if rows is not None:
+            reduced = reduced[rows]
+        scores = reduced @ projection.project(query_vector)
+        nearest = top_n_indices(-scores, fetch)
+        if rows is not None:
+            nearest = rows[nearest]
+
+        groups = arrays[2]
+        candidate_rows = np.flatnonzero(np.isin(groups, groups[nearest]))
+        if rows is not None:
+            candidate_rows = np.intersect1d(candidate_rows, rows, assume_unique=True)
+        return candidate_rows
+
+    @staticmethod
+    def nearest_per_group(distances, groups, top_n) -> np.ndarray:
+        """
+        :return: Indices of the nearest row of each of the top_n nearest groups.
+
+        Only the nearest rows are sorted, more are taken until they cover top_n groups.
+        """
+        fetch = top_n * 2
+        while True:
+            nearest = top_n_indices(distances, fetch)
+            # np.unique returns the first index of each group, i.e. its nearest row.
+            _, first = np.unique(groups[nearest], return_index=True)
+            if len(first) >= top_n or len(nearest) == len(distances):
+                return nearest[np.sort(first)[:top_n]]
+            fetch *= 4
+
+    @staticmethod
+    def mean_per_group(ids, distances, groups, top_n) -> Tuple[np.ndarray, np.ndarray]:
+        _, inverse = np.unique(groups, return_inverse=True)
+        pooled = np.bincount(inverse, weights=distances) / np.bincount(inverse)
+        top_groups = top_n_indices(pooled, top_n)
+
+        # Rows sorted by group then distance, the first row of a group is its nearest.
+        order = np.lexsort((distances, inverse))
+        first = order[np.searchsorted(inverse[order], top_groups)]
+        return ids[first], pooled[top_groups].astype(np.float32)
+
+    def __str__(self):
+        return f"{type(self).__name__}({self.model.__name__}, {self.tag.name}, {self.dimensions})"
+
+
+_indexes: Dict[tuple, NumpyVectorIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_numpy_vector_index(
+    model, tag, dimensions: int, index_class=NumpyVectorIndex
+) -> NumpyVectorIndex:
+    """
+    The process wide index for model, tag and dimensions, created on first use.
+
+    :param index_class: NumpyVectorIndex or a subclass, e.g. SnapshotVectorIndex
+    """
+    key = (model._meta.label, tag.pk, dimensions, index_class)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = index_class(model, tag, dimensions)
+        return _indexes[key]
+
+
+def clear_numpy_vector_indexes():
+    with _indexes_lock:
+        _indexes.clear()
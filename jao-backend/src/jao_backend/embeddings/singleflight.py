@@ -0,0 +1,199 @@
+"""
+Coalesce concurrent identical calls, e.g. embedding the same text.
+
+When several requests embed the same text at the same moment, only one provider call
+is made and the others share its result:
+
+- In a process, callers with the same key wait on the first caller's future.
+- Across workers, the first caller takes a short Redis lock, others wait for the result
+  to appear via `lookup` (normally a cache read) until the lock is released.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from typing import Callable
+from typing import Optional
+
+from django.core.cache import caches
+from django_redis import get_redis_connection
+from django_redis.cache import RedisCache
+from redis.exceptions import LockError
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+
+class _AsyncCall:
+    """
+    A call in flight in `SingleFlight.ado`, and the number of callers waiting on it.
+    """
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    >>> flight = SingleFlight("embed", alias="shared")
+    ... vector = flight.do(key, lambda: embed(text), lookup=lambda: cache.get(key))
+    """
+
+    def __init__(
+        self, prefix: str, alias="shared", lock_timeout=30, poll_interval=0.05
+    ):
+        """
+        :param prefix: Prefix of the Redis lock keys.
+        :param alias: Django cache alias, locks are only taken if it is django-redis.
+        :param lock_timeout: Seconds before a lock expires, e.g. if a worker dies.
+        :param poll_interval: Seconds between lookups while another worker holds the lock.
+        """
+        self.prefix = prefix
+        self.alias = alias
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+
+        self._calls = {}
+        self._calls_lock = threading.Lock()
+
+    def get_redis_lock(self, key):
+        """
+        :return: A non-blocking redis-py Lock, or None if the cache isn't Redis.
+        """
+        if not isinstance(caches[self.alias], RedisCache):
+            return None
+        client = get_redis_connection(self.alias)
+        # Not thread local: async callers acquire and release in separate
+        # asyncio.to_thread calls, which may run on different threads.
+        return client.lock(
+            f"{self.prefix}:lock:{key}",
+            timeout=self.lock_timeout,
+            blocking=False,
+            thread_local=False,
+        )
+
+    def acquire(self, lock) -> bool:
+        try:
+            return lock.acquire()
+        except RedisError as e:
+            logger.warning("Could not take lock %s: %s", lock.name, e)
+            # Without Redis, fall back to calling the function.
+            return True
+
+    def release(self, lock):
+        try:
+            lock.release()
+        except (LockError, RedisError) as e:
+            # Expired, or Redis is unavailable; either way another caller may proceed.
+            logger.warning("Could not release lock %s: %s", lock.name, e)
+
+    def is_locked(self, lock) -> bool:
+        try:
+            return lock.locked()
+        except RedisError:
+            return False
+
+    def do(self, key: str, fn: Callable, lookup: Optional[Callable] = None):
+        """
+        Call fn, unless a call with the same key is in flight, then return its result.
+
+        :param lookup: Returns the result stored by another worker, or None.
+        """
+        with self._calls_lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = concurrent.futures.Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = self._call_with_lock(key, fn, lookup)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._calls_lock:
+                self._calls.pop(key, None)
+
+    def _call_with_lock(self, key, fn, lookup):
+        lock = self.get_redis_lock(key)
+        if lock is None or self.acquire(lock):
+            try:
+                return fn()
+            finally:
+                if lock is not None:
+                    self.release(lock)
+
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            result = lookup() if lookup else None
+            if result is not None:
+                return result
+            if not self.is_locked(lock):
+                # The other worker finished without storing a result, or failed.
+                break
+            time.sleep(self.poll_interval)
+
+        return fn()
+
+    async def ado(self, key: str, fn: Callable, lookup: Optional[Callable] = None):
+        """
+        Async version of `do`, fn is an async function, lookup is sync.
+
+        The call runs in its own task, shared by every caller with the key.  A caller
+        that is cancelled (e.g. its client went away) stops waiting, the call is only
+        cancelled once no callers are waiting for it.
+        """
+        loop = asyncio.get_running_loop()
+        calls_key = (id(loop), key)
+        call = self._calls.get(calls_key)
+        if call is None:
+            call = self._calls[calls_key] = _AsyncCall(
+                loop.create_task(self._acall_with_lock(key, fn, lookup))
+            )
+            call.task.add_done_callback(lambda task: self._discard(calls_key, call))
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            # The call was cancelled, but not this caller, make a new call.
+            return await self.ado(key, fn, lookup)
+        finally:
+            call.waiters -= 1
+            if not call.waiters:
+                call.task.cancel()
+
+    def _discard(self, calls_key, call):
+        if self._calls.get(calls_key) is call:
+            del self._calls[calls_key]
+
+    async def _acall_with_lock(self, key, fn, lookup):
+        lock = await asyncio.to_thread(self.get_redis_lock, key)
+        if lock is None or await asyncio.to_thread(self.acquire, lock):
+            try:
+                return await fn()
+            finally:
+                if lock is not None:
+                    await asyncio.to_thread(self.release, lock)
+
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            result = await asyncio.to_thread(lookup) if lookup else None
+            if result is not None:
+                return result
+            if not await asyncio.to_thread(self.is_locked, lock):
+                break
+            await asyncio.sleep(self.poll_interval)
+
+        return await fn()
@@ -0,0 +1,238 @@
+"""
+Embedding snapshots shared between processes.
+
+Loading the vectors in every API worker means memory grows with the number of
+workers.  Instead, `write_snapshot` exports the vectors for a TaggedEmbedding model and
+tag to .npy files, and workers open them with np.load(mmap_mode="r"), so every process
+on a node shares one copy in the page cache.
+
+Snapshots are written by the Celery worker, so JAO_BACKEND_EMBEDDING_SNAPSHOT_DIR must be
+a volume shared by the worker and every API node.
+
+Layout, under settings.JAO_BACKEND_EMBEDDING_SNAPSHOT_DIR:
+
+    vacancies.vacancyembedding/<tag uuid>-v<tag version>/
+        <version>.ids.npy
+        <version>.vectors.npy      L2 normalised float32
+        <version>.groups.npy       chunk_parent_field of each row, e.g. vacancy_id
+        <version>.reduced.npy      vectors reduced for two stage search, if enabled
+        <version>.projection.npz   the Projection that reduced them
+        CURRENT                    json: version, count, max_id, dimensions, reduction
+
+Files are written under a temporary name and moved into place with os.replace, and
+CURRENT is replaced last, so readers only ever see complete snapshots.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count
+from django.db.models import Max
+
+from jao_backend.embeddings.models import Embedding
+from jao_backend.embeddings.models import EmbeddingTag
+from jao_backend.embeddings.search import NumpyVectorIndex
+from jao_backend.embeddings.search import Projection
+
+logger = logging.getLogger(__name__)
+
+CURRENT = "CURRENT"
+
+# Older snapshots may still be open in a worker, though files stay readable after
+# being unlinked, this avoids unlinking a snapshot between reading CURRENT and opening.
+KEEP_SNAPSHOTS = 2
+
+
+def get_snapshot_dir(model, tag, root=None) -> Path:
+    root = Path(root or settings.JAO_BACKEND_EMBEDDING_SNAPSHOT_DIR)
+    return root / model._meta.label_lower / f"{tag.uuid}-v{tag.version}"
+
+
+def get_tag_dimensions(model, tag) -> Optional[int]:
+    """
+    :return: Dimensions of the embeddings saved for tag, or None if there are none yet.
+    """
+    embedding_id = (
+        model.objects.filter(tag=tag).values_list("embedding_id", flat=True).first()
+    )
+    if embedding_id is None:
+        return None
+    # Embedding is polymorphic, so this is an instance of the subclass.
+    return Embedding.objects.get(pk=embedding_id).dimensions
+
+
+def read_current(snapshot_dir: Path) -> Optional[dict]:
+    try:
+        return json.loads((snapshot_dir / CURRENT).read_text())
+    except FileNotFoundError:
+        return None
+
+
+def _atomic_write(path: Path, write):
+    """
+    Call write(file) on a temporary file, then move it to path.
+    """
+    with tempfile.NamedTemporaryFile(
+        dir=path.parent, prefix=f".{path.name}.", delete=False
+    ) as f:
+        try:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            os.unlink(f.name)
+            raise
+    os.replace(f.name, path)
+
+
+def write_snapshot(model, tag, root=None, force=False) -> Optional[dict]:
+    """
+    Export the vectors of model (a TaggedEmbedding subclass) for tag.
+
+    :param force: Write a snapshot, even if the embeddings haven't changed.
+    :return: The snapshot metadata, or None if nothing was written.
+    """
+    snapshot_dir = get_snapshot_dir(model, tag, root=root)
+    dimensions = get_tag_dimensions(model, tag)
+    if dimensions is None:
+        logger.info("No %s embeddings for %s, skipping snapshot.", model.__name__, tag)
+        return None
+
+    index = NumpyVectorIndex(model, tag, dimensions)
+    stats = index.get_queryset().aggregate(count=Count("pk"), max_id=Max("pk"))
+    current = read_current(snapshot_dir)
+    if (
+        not force
+        and current
+        and (current["count"], current["max_id"]) == (stats["count"], stats["max_id"])
+    ):
+        logger.info("Snapshot %s is up to date.", snapshot_dir)
+        return None
+
+    ids, vectors, groups = index.load()
+    # Fitted once here, rather than in every worker.
+    projection = Projection.from_settings(vectors)
+    metadata = {
+        "version": time.time_ns(),
+        "count": len(ids),
+        "max_id": int(ids[-1]) if len(ids) else None,
+        "dimensions": dimensions,
+        "reduction": projection and [projection.method, projection.dimensions],
+    }
+
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    version = metadata["version"]
+    _atomic_write(snapshot_dir / f"{version}.ids.npy", lambda f: np.save(f, ids))
+    _atomic_write(
+        snapshot_dir / f"{version}.vectors.npy", lambda f: np.save(f, vectors)
+    )
+    _atomic_write(
+        snapshot_dir / f"{version}.groups.npy", lambda f: np.save(f, groups)
+    )
+    if projection is not None:
+        _atomic_write(
+            snapshot_dir / f"{version}.reduced.npy",
+            lambda f: np.save(f, projection.project(vectors)),
+        )
+        _atomic_write(snapshot_dir / f"{version}.projection.npz", projection.save)
+    _atomic_write(
+        snapshot_dir / CURRENT, lambda f: f.write(json.dumps(metadata).encode())
+    )
+    logger.info("Wrote snapshot %s, %s rows", snapshot_dir / str(version), len(ids))
+
+    remove_old_snapshots(snapshot_dir)
+    return metadata
+
+
+def remove_old_snapshots(snapshot_dir: Path, keep=KEEP_SNAPSHOTS):
+    versions = sorted(
+        {int(path.name.split(".")[0]) for path in snapshot_dir.glob("*.npy")},
+        reverse=True,
+    )
+    for version in versions[keep:]:
+        for path in snapshot_dir.glob(f"{version}.*.np[yz]"):
+            path.unlink(missing_ok=True)
+
+
+def write_snapshots(model, root=None, force=False):
+    """
+    Write snapshots for every configured tag.
+    """
+    return {
+        tag.uuid: write_snapshot(model, tag, root=root, force=force)
+        for tag in EmbeddingTag.get_configured_tags().values()
+    }
+
+
+class SnapshotVectorIndex(NumpyVectorIndex):
+    """
+    NumpyVectorIndex backed by a memory mapped snapshot.
+
+    Every refresh_interval seconds CURRENT is checked, and a newer snapshot is swapped
+    in without restarting.  Until a snapshot is written, rows are loaded from the
+    database, as NumpyVectorIndex does.
+    """
+
+    def __init__(self, model, tag, dimensions: int, refresh_interval=None, root=None):
+        super().__init__(model, tag, dimensions, refresh_interval=refresh_interval)
+        self.snapshot_dir = get_snapshot_dir(model, tag, root=root)
+        self.snapshot_version = None
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not (force or self.refresh_due(now)):
+            return
+
+        current = read_current(self.snapshot_dir)
+        if current is None or current["dimensions"] != self.dimensions:
+            if self.snapshot_version is None:
+                # No snapshot written yet.
+                if self.refreshed_at is None:
+                    logger.warning(
+                        "No snapshot in %s, loading %s from the database.  Is "
+                        "JAO_BACKEND_EMBEDDING_SNAPSHOT_DIR shared with the Celery worker?",
+                        self.snapshot_dir,
+                        self,
+                    )
+                super().refresh(force=True)
+            else:
+                self.refreshed_at = now
+            return
+
+        with self._lock:
+            version = current["version"]
+            if version != self.snapshot_version:
+                self.arrays = tuple(
+                    np.load(self.snapshot_dir / f"{version}.{name}.npy", mmap_mode="r")
+                    for name in ("ids", "vectors", "groups")
+                )
+                self.open_reduced(version)
+                self.snapshot_version = version
+                self.watermark = current["max_id"] or 0
+                logger.info("Opened snapshot %s/%s", self.snapshot_dir, version)
+
+            self.refreshed_at = now
+
+    def open_reduced(self, version):
+        """
+        Use the reduced vectors written with the snapshot, for two stage search.
+        Without them, they are computed in this process, with self._lock held.
+        """
+        projection_path = self.snapshot_dir / f"{version}.projection.npz"
+        if not projection_path.exists():
+            self.reduced = (None, None, None)
+            self.update_reduced()
+            return
+
+        self.reduced = (
+            self.arrays,
+            Projection.load(projection_path),
+            np.load(self.snapshot_dir / f"{version}.reduced.npy", mmap_mode="r"),
+        )
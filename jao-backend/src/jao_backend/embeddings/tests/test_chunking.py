@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from jao_backend.embeddings.chunking import ChunkRetention
+from jao_backend.embeddings.chunking import FirstChunkPooling
+from jao_backend.embeddings.chunking import MaxPooling
+from jao_backend.embeddings.chunking import MeanPooling
+from jao_backend.embeddings.chunking import TokenWindowChunker
+from jao_backend.embeddings.chunking import get_pooling_strategy
+
+MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+@pytest.mark.parametrize(
+    "token_count, chunk_size, chunk_overlap, expected_bounds",
+    [
+        (5, None, 0, [(0, 5)]),
+        (5, 10, 2, [(0, 5)]),
+        (10, 4, 0, [(0, 4), (4, 8), (8, 10)]),
+        (10, 4, 2, [(0, 4), (2, 6), (4, 8), (6, 10)]),
+    ],
+)
+def test_window_bounds(token_count, chunk_size, chunk_overlap, expected_bounds):
+    """
+    Windows should cover every token, overlapping by chunk_overlap.
+    """
+    chunker = TokenWindowChunker(
+        MODEL, chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
+    assert chunker.window_bounds(token_count) == expected_bounds
+
+
+def test_window_bounds_max_chunks():
+    """
+    max_chunks caps the number of windows, so the cost of embedding a text is bounded.
+    """
+    chunker = TokenWindowChunker(MODEL, chunk_size=4, max_chunks=2)
+    assert chunker.window_bounds(100) == [(0, 4), (4, 8)]
+
+
+def test_chunk_overlap_must_be_smaller_than_chunk_size():
+    with pytest.raises(ValueError):
+        TokenWindowChunker(MODEL, chunk_size=4, chunk_overlap=4)
+
+
+def test_chunk_roundtrips_text():
+    """
+    Chunks without overlap should join back into the original text.
+    """
+    text = "The quick brown fox jumps over the lazy dog. " * 20
+    chunker = TokenWindowChunker(MODEL, chunk_size=16)
+
+    chunks, weights = chunker.chunk_with_weights(text)
+
+    assert len(chunks) > 1
+    assert "".join(chunks) == text
+    [all_tokens] = TokenWindowChunker(MODEL).chunk_tokens(text)
+    assert weights.sum() == len(all_tokens)
+
+
+@pytest.mark.parametrize(
+    "strategy, expected",
+    [
+        (MeanPooling(), [[2.0, 3.0]]),
+        (MaxPooling(), [[3.0, 4.0]]),
+        (FirstChunkPooling(), [[1.0, 2.0]]),
+        (ChunkRetention(), [[1.0, 2.0], [3.0, 4.0]]),
+    ],
+)
+def test_pooling(strategy, expected):
+    vectors = np.array([[1.0, 2.0], [3.0, 4.0]], dtype=np.float32)
+    np.testing.assert_allclose(strategy.pool(vectors), expected)
+
+
+def test_mean_pooling_weights():
+    """
+    Weighted by token count, a short trailing chunk has less influence.
+    """
+    vectors = np.array([[0.0], [4.0]], dtype=np.float32)
+    pooled = MeanPooling().pool(vectors, weights=np.array([3.0, 1.0]))
+    np.testing.assert_allclose(pooled, [[1.0]])
+
+
+def test_get_pooling_strategy_unknown():
+    with pytest.raises(ValueError):
+        get_pooling_strategy("median")
@@ -1,11 +1,15 @@
+import numpy as np
 import pytest
+from django.conf import settings
 
 from jao_backend.embeddings.models import Embedding
 from jao_backend.embeddings.models import EmbeddingBase
 from jao_backend.embeddings.models import EmbeddingLarge
 from jao_backend.embeddings.models import EmbeddingSmall
+from jao_backend.embeddings.models import EmbeddingTag
 from jao_backend.embeddings.models import EmbeddingTiny
 from jao_backend.embeddings.models import EmbeddingXL
+from jao_backend.embeddings.models import query_embedding_cache
 
 
 @pytest.mark.parametrize(
@@ -35,3 +39,28 @@ def test_get_embedding_subclass_by_invalid_dimension():
     """
     with pytest.raises(KeyError):
         Embedding.get_subclass_for_embedding_dimensions(9999)
+
+
+@pytest.mark.django_db
+def test_embed_query_is_cached(monkeypatch):
+    """
+    Resubmitting the same text, apart from whitespace, should not call the embedding model again.
+    """
+    EmbeddingTag.get_configured_tags.cache_clear()
+    tag = EmbeddingTag.get_tag(settings.TEST_TAG_ID)
+    calls = []
+
+    def embed_text(text):
+        calls.append(text)
+        return np.array([[1.0, 2.0, 3.0]], dtype=np.float32), None
+
+    monkeypatch.setattr(tag, "embed_text", embed_text)
+    query_embedding_cache.delete(tag.get_query_cache_key("Data  scientist"))
+
+    first = tag.embed_query("Data  scientist")
+    query_embedding_cache.clear_local()
+    second = tag.embed_query("Data scientist\n")
+
+    assert calls == ["Data  scientist"]
+    np.testing.assert_array_equal(first, second)
+    EmbeddingTag.get_configured_tags.cache_clear()
@@ -0,0 +1,175 @@
+import numpy as np
+import pytest
+from django.db import connection
+
+from jao_backend.embeddings import indexes
+from jao_backend.embeddings.indexes import BIT
+from jao_backend.embeddings.indexes import HALFVEC
+from jao_backend.embeddings.indexes import VECTOR
+from jao_backend.embeddings.indexes import binary_quantise
+from jao_backend.embeddings.indexes import build_vector_index
+from jao_backend.embeddings.indexes import default_ivfflat_lists
+from jao_backend.embeddings.indexes import get_index_quantisation
+from jao_backend.embeddings.indexes import get_rerank_fetch
+from jao_backend.embeddings.indexes import get_search_quantisation
+from jao_backend.embeddings.indexes import get_vector_quantisation
+from jao_backend.embeddings.indexes import measure_recall
+from jao_backend.embeddings.indexes import quantised_distance
+from jao_backend.embeddings.indexes import recall_at_k
+from jao_backend.embeddings.indexes import search_nearest_ids
+from jao_backend.embeddings.indexes import vector_index
+from jao_backend.embeddings.indexes import vector_search_settings
+from jao_backend.embeddings.models import EmbeddingModel
+from jao_backend.embeddings.models import EmbeddingTiny
+from jao_backend.embeddings.models import EmbeddingXL
+
+
+def get_index_definition(model):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname LIKE %s",
+            [model._meta.db_table, "%_ann_idx%"],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_build_vector_index_rebuild():
+    """
+    Migrations create HNSW indexes, rebuilding replaces them without leaving
+    the temporary index behind.
+    """
+    [definition] = get_index_definition(EmbeddingTiny)
+    assert "USING hnsw" in definition
+
+    assert build_vector_index(EmbeddingTiny, index_type="ivfflat") is False
+
+    assert build_vector_index(EmbeddingTiny, index_type="ivfflat", rebuild=True)
+    [definition] = get_index_definition(EmbeddingTiny)
+    assert "USING ivfflat" in definition
+    assert "embeddingtiny_ann_idx " in definition
+
+    assert build_vector_index(EmbeddingTiny, index_type="hnsw", rebuild=True, m=8)
+    [definition] = get_index_definition(EmbeddingTiny)
+    assert "USING hnsw" in definition
+    assert "m='8'" in definition
+
+
+@pytest.mark.django_db
+def test_vector_search_settings():
+    with vector_search_settings(ef_search=123, probes=7):
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW hnsw.ef_search")
+            assert cursor.fetchone()[0] == "123"
+            cursor.execute("SHOW ivfflat.probes")
+            assert cursor.fetchone()[0] == "7"
+
+
+@pytest.mark.parametrize(
+    "row_count, expected_lists", [(0, 1), (50_000, 50), (4_000_000, 2000)]
+)
+def test_default_ivfflat_lists(row_count, expected_lists):
+    assert default_ivfflat_lists(row_count) == expected_lists
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "quantisation, expected",
+    [
+        (HALFVEC, ['("embedding")::halfvec(384) halfvec_cosine_ops']),
+        (BIT, ['(binary_quantize("embedding"))::bit(384) bit_hamming_ops']),
+    ],
+)
+def test_quantised_vector_index(quantisation, expected):
+    index = vector_index(
+        "embeddingtiny", quantisation=quantisation, dimensions=EmbeddingTiny.dimensions
+    )
+    with connection.schema_editor() as schema_editor:
+        sql = str(index.create_sql(EmbeddingTiny, schema_editor))
+
+    assert "embeddingtiny_ann_idx" in sql
+    for expected_sql in expected:
+        assert expected_sql in sql
+
+
+def test_get_vector_quantisation(settings):
+    settings.JAO_BACKEND_VECTOR_QUANTISATION = "halfvec"
+    assert get_vector_quantisation(EmbeddingTiny) == HALFVEC
+
+    settings.JAO_BACKEND_VECTOR_QUANTISATION = "embeddingxl=bit, embeddinglarge=halfvec"
+    assert get_vector_quantisation(EmbeddingXL) == BIT
+    assert get_vector_quantisation(EmbeddingTiny) == VECTOR
+
+    settings.JAO_BACKEND_VECTOR_QUANTISATION = "float8"
+    with pytest.raises(ValueError):
+        get_vector_quantisation(EmbeddingTiny)
+
+
+@pytest.mark.django_db
+def test_get_search_quantisation(settings, monkeypatch):
+    """
+    Migrations create "vector" indexes, searches don't use a quantisation the index
+    wasn't built with.
+    """
+    indexes._search_quantisations.clear()
+    settings.JAO_BACKEND_VECTOR_QUANTISATION = "bit"
+    assert get_index_quantisation(EmbeddingTiny) == VECTOR
+    assert get_search_quantisation(EmbeddingTiny) == VECTOR
+
+    model = EmbeddingModel.objects.create(name="quantisation-test")
+    embedding = EmbeddingTiny.objects.create(
+        embedding=np.ones(EmbeddingTiny.dimensions), embedding_model=model
+    )
+    queryset = EmbeddingTiny.objects.non_polymorphic()
+    assert search_nearest_ids(queryset, np.ones(EmbeddingTiny.dimensions), 1) == [
+        embedding.pk
+    ]
+
+    indexes._search_quantisations.clear()
+    monkeypatch.setattr(indexes, "get_index_quantisation", lambda model, using: BIT)
+    assert get_search_quantisation(EmbeddingTiny) == BIT
+    indexes._search_quantisations.clear()
+
+
+def test_get_rerank_fetch(settings):
+    settings.JAO_BACKEND_VECTOR_RERANK_OVERFETCH = 4
+    assert get_rerank_fetch(10, VECTOR) == 10
+    assert get_rerank_fetch(10, BIT) == 40
+    assert get_rerank_fetch(500, HALFVEC) == 1000
+
+
+@pytest.mark.django_db
+def test_quantised_distance_matches_index_expression():
+    """
+    Candidates are ordered by the Hamming distance of the same expression the bit
+    index is built on.
+    """
+    query_vector = np.array([0.5, -0.25, 0.0, 1.0] * 96)
+    assert binary_quantise(query_vector[:4]) == "1001"
+
+    queryset = EmbeddingTiny.objects.non_polymorphic().annotate(
+        distance=quantised_distance(query_vector, BIT)
+    )
+    sql = str(queryset.order_by("distance").query)
+    assert (
+        '(binary_quantize("embeddings_embeddingtiny"."embedding"))::bit(384) <~> 1001'
+        in sql
+    )
+
+
+def test_recall_at_k():
+    assert recall_at_k([1, 2, 3, 4], [4, 2, 9, 8]) == 0.5
+    assert recall_at_k([], [1]) == 1.0
+
+
+@pytest.mark.django_db
+def test_measure_recall():
+    """
+    A full precision index of a handful of rows finds the exact nearest.
+    """
+    model = EmbeddingModel.objects.create(name="recall-test")
+    rng = np.random.default_rng(0)
+    for vector in rng.normal(size=(20, EmbeddingTiny.dimensions)):
+        EmbeddingTiny.objects.create(embedding=vector, embedding_model=model)
+
+    assert measure_recall(EmbeddingTiny, queries=5, k=3) == 1.0
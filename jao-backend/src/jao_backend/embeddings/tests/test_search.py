@@ -0,0 +1,262 @@
+import time
+
+import numpy as np
+import pytest
+
+from jao_backend.embeddings.models import EmbeddingTag
+from jao_backend.embeddings.models import EmbeddingTiny
+from jao_backend.embeddings.search import PCA
+from jao_backend.embeddings.search import TRUNCATE
+from jao_backend.embeddings.search import NumpyVectorIndex
+from jao_backend.embeddings.search import Projection
+from jao_backend.embeddings.search import normalise
+from jao_backend.embeddings.snapshots import SnapshotVectorIndex
+from jao_backend.embeddings.snapshots import write_snapshot
+from jao_backend.vacancies.models import VacancyEmbedding
+from jao_backend.vacancies.tests.factories import VacancyFactory
+
+
+@pytest.fixture
+def tag():
+    EmbeddingTag.get_configured_tags.cache_clear()
+    EmbeddingTag.get_configured_tags()
+    yield EmbeddingTag.objects.order_by("-version").get(
+        name="job-title-responsibilities"
+    )
+    # Tags are rolled back with the test database.
+    EmbeddingTag.get_configured_tags.cache_clear()
+
+
+def save_embedding(tag, vector):
+    [vacancy_embedding] = VacancyEmbedding.save_embeddings(
+        tag=tag, chunks=[vector], vacancy=VacancyFactory.create()
+    )
+    return vacancy_embedding
+
+
+def test_normalise():
+    vectors = normalise(np.array([[3.0, 4.0], [0.0, 0.0]]))
+    assert vectors.dtype == np.float32
+    np.testing.assert_allclose(vectors, [[0.6, 0.8], [0.0, 0.0]])
+
+
+def test_numpy_vector_index_pooling():
+    """
+    Groups are ranked by their pooled distance, represented by their nearest row.
+    """
+    ids = np.array([10, 11, 12, 13, 14])
+    groups = np.array([1, 1, 1, 2, 3])
+    distances = np.array([0.1, 0.15, 0.9, 0.2, 0.3])
+
+    nearest = NumpyVectorIndex.nearest_per_group(distances, groups, top_n=2)
+    assert ids[nearest].tolist() == [10, 13]
+
+    mean_ids, mean_distances = NumpyVectorIndex.mean_per_group(
+        ids, distances, groups, top_n=3
+    )
+    assert mean_ids.tolist() == [13, 14, 10]
+    np.testing.assert_allclose(mean_distances, [0.2, 0.3, 0.3833333], rtol=1e-5)
+
+
+@pytest.mark.django_db
+def test_numpy_vector_index_search(tag):
+    """
+    Results should match the cosine distance calculated by pgvector.
+    """
+    query_vector = np.random.rand(EmbeddingTiny.dimensions)
+    for _ in range(5):
+        save_embedding(tag, np.random.rand(EmbeddingTiny.dimensions))
+
+    index = NumpyVectorIndex(VacancyEmbedding, tag, EmbeddingTiny.dimensions)
+    ids, distances = index.search(query_vector, top_n=3)
+
+    expected = list(
+        VacancyEmbedding.objects.filter(tag=tag).nearest(query_vector, top_n=3)
+    )
+    assert ids.tolist() == [ve.pk for ve in expected]
+    np.testing.assert_allclose(
+        distances, [ve.distance for ve in expected], rtol=1e-4, atol=1e-6
+    )
+
+
+@pytest.mark.django_db
+def test_numpy_vector_index_refresh(tag):
+    """
+    New rows are appended, deleted rows cause a reload.
+    """
+    first = save_embedding(tag, np.random.rand(EmbeddingTiny.dimensions))
+    index = NumpyVectorIndex(
+        VacancyEmbedding, tag, EmbeddingTiny.dimensions, refresh_interval=0
+    )
+    index.refresh()
+    assert index.ids.tolist() == [first.pk]
+
+    second = save_embedding(tag, np.random.rand(EmbeddingTiny.dimensions))
+    index.refresh()
+    assert index.ids.tolist() == [first.pk, second.pk]
+    assert index.watermark == second.pk
+
+    # Re-embedding replaces a row, the count is unchanged.
+    first.delete()
+    third = save_embedding(tag, np.random.rand(EmbeddingTiny.dimensions))
+    index.refresh()
+    assert index.ids.tolist() == [second.pk, third.pk]
+    assert index.vectors.shape == (2, EmbeddingTiny.dimensions)
+
+
+@pytest.mark.django_db
+def test_numpy_vector_index_refresh_reduces(tag, settings):
+    """
+    The projection is fitted on refresh, appended rows are projected with it.
+    """
+    settings.JAO_BACKEND_FIRST_STAGE_REDUCTION = PCA
+    settings.JAO_BACKEND_FIRST_STAGE_DIMENSIONS = 8
+    for _ in range(3):
+        save_embedding(tag, np.random.rand(EmbeddingTiny.dimensions))
+    index = NumpyVectorIndex(
+        VacancyEmbedding, tag, EmbeddingTiny.dimensions, refresh_interval=0
+    )
+    index.refresh()
+    projection = index.projection
+    assert index.reduced[0] is index.arrays
+    assert index.reduced[2].shape == (3, 8)
+
+    save_embedding(tag, np.random.rand(EmbeddingTiny.dimensions))
+    index.refresh()
+    assert index.projection is projection
+    assert index.reduced[0] is index.arrays
+    np.testing.assert_allclose(
+        index.reduced[2], projection.project(index.vectors), atol=1e-6
+    )
+
+
+@pytest.mark.django_db
+def test_snapshot_vector_index(tag, tmp_path):
+    """
+    Workers read the latest snapshot memory mapped, and swap in newer snapshots.
+    """
+    first = save_embedding(tag, np.random.rand(EmbeddingTiny.dimensions))
+    metadata = write_snapshot(VacancyEmbedding, tag, root=tmp_path)
+    assert metadata["count"] == 1
+    assert write_snapshot(VacancyEmbedding, tag, root=tmp_path) is None
+
+    index = SnapshotVectorIndex(
+        VacancyEmbedding, tag, EmbeddingTiny.dimensions, refresh_interval=0, root=tmp_path
+    )
+    index.refresh()
+    assert isinstance(index.vectors, np.memmap)
+    assert index.ids.tolist() == [first.pk]
+
+    second = save_embedding(tag, np.random.rand(EmbeddingTiny.dimensions))
+    write_snapshot(VacancyEmbedding, tag, root=tmp_path)
+    ids, _ = index.search(np.random.rand(EmbeddingTiny.dimensions), top_n=2)
+    assert sorted(ids.tolist()) == [first.pk, second.pk]
+
+
+def low_rank_vectors(count, dimensions=32, rank=8, seed=0):
+    """
+    Normalised vectors in a rank dimensional subspace, PCA to rank dimensions is exact.
+    """
+    rng = np.random.default_rng(seed)
+    basis = np.linalg.qr(rng.normal(size=(dimensions, rank)))[0].T
+    return normalise(rng.normal(size=(count, rank)) @ basis)
+
+
+def test_projection():
+    vectors = low_rank_vectors(50)
+
+    pca = Projection.fit(vectors, PCA, dimensions=8)
+    reduced = pca.project(vectors)
+    assert reduced.shape == (50, 8)
+    np.testing.assert_allclose(
+        reduced @ pca.project(vectors[0]), vectors @ vectors[0], atol=1e-5
+    )
+
+    truncated = Projection.fit(vectors, TRUNCATE, dimensions=4).project(vectors)
+    np.testing.assert_allclose(truncated, normalise(vectors[:, :4]))
+
+
+def test_projection_save_load(tmp_path):
+    vectors = low_rank_vectors(20)
+    projection = Projection.fit(vectors, PCA, dimensions=8)
+    with open(tmp_path / "projection.npz", "wb") as f:
+        projection.save(f)
+
+    loaded = Projection.load(tmp_path / "projection.npz")
+    assert (loaded.method, loaded.dimensions) == (PCA, 8)
+    np.testing.assert_array_equal(loaded.project(vectors), projection.project(vectors))
+
+
+@pytest.mark.parametrize("pooling", [None, "min", "mean"])
+def test_two_stage_search(settings, pooling):
+    """
+    Candidates from the reduced vectors, re-ranked with the full vectors, give the
+    same results as searching the full vectors.
+    """
+    vectors = low_rank_vectors(200, dimensions=EmbeddingTiny.dimensions)
+    ids = np.arange(1000, 1200)
+    # Two chunks per group, pooled by group.
+    groups = ids // 2
+    index = NumpyVectorIndex(
+        VacancyEmbedding, None, EmbeddingTiny.dimensions, refresh_interval=3600
+    )
+    index.arrays = (ids, vectors, groups)
+    index.refreshed_at = time.monotonic()
+    query_vector = vectors[0] + vectors[1]
+    allowed_ids = ids[::3]
+
+    settings.JAO_BACKEND_FIRST_STAGE_REDUCTION = ""
+    expected = index.search(query_vector, top_n=5, pooling=pooling)
+    expected_allowed = index.search(
+        query_vector, top_n=5, allowed_ids=allowed_ids, pooling=pooling
+    )
+
+    settings.JAO_BACKEND_FIRST_STAGE_REDUCTION = PCA
+    settings.JAO_BACKEND_FIRST_STAGE_DIMENSIONS = 8
+    settings.JAO_BACKEND_FIRST_STAGE_OVERFETCH = 4
+    # Not reduced yet, searches don't fit the projection themselves.
+    assert index.get_candidate_rows(index.arrays, normalise(query_vector), 5) is None
+    index.update_reduced()
+    candidate_rows = index.get_candidate_rows(index.arrays, normalise(query_vector), 5)
+    assert len(candidate_rows) < len(ids)
+
+    for (found_ids, distances), (expected_ids, expected_distances) in [
+        (index.search(query_vector, top_n=5, pooling=pooling), expected),
+        (
+            index.search(
+                query_vector, top_n=5, allowed_ids=allowed_ids, pooling=pooling
+            ),
+            expected_allowed,
+        ),
+    ]:
+        assert found_ids.tolist() == expected_ids.tolist()
+        np.testing.assert_allclose(distances, expected_distances, atol=1e-6)
+
+
+@pytest.mark.django_db
+def test_snapshot_two_stage_search(tag, tmp_path, settings):
+    """
+    The projection is fitted when the snapshot is written, workers read the reduced
+    vectors memory mapped.
+    """
+    settings.JAO_BACKEND_FIRST_STAGE_REDUCTION = TRUNCATE
+    settings.JAO_BACKEND_FIRST_STAGE_DIMENSIONS = 64
+    settings.JAO_BACKEND_FIRST_STAGE_OVERFETCH = 2
+    saved = [
+        save_embedding(tag, np.random.rand(EmbeddingTiny.dimensions))
+        for _ in range(10)
+    ]
+    metadata = write_snapshot(VacancyEmbedding, tag, root=tmp_path)
+    assert metadata["reduction"] == [TRUNCATE, 64]
+
+    index = SnapshotVectorIndex(
+        VacancyEmbedding, tag, EmbeddingTiny.dimensions, refresh_interval=0, root=tmp_path
+    )
+    index.refresh()
+    assert index.projection.dimensions == 64
+    assert isinstance(index.reduced[2], np.memmap)
+
+    query_vector = np.random.rand(EmbeddingTiny.dimensions)
+    ids, _ = index.search(query_vector, top_n=2)
+    assert len(ids) == 2
+    assert set(ids.tolist()) <= {ve.pk for ve in saved}
@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import redis
+from redis.lock import Lock
+
+from jao_backend.embeddings import singleflight
+from jao_backend.embeddings.singleflight import SingleFlight
+
+
+def test_single_flight_coalesces_threads():
+    """
+    Concurrent callers with the same key share one call.
+    """
+    flight = SingleFlight("test")
+    calls = []
+    started = threading.Event()
+
+    def slow_call():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        leader = executor.submit(flight.do, "key", slow_call)
+        started.wait()
+        followers = [executor.submit(flight.do, "key", slow_call) for _ in range(4)]
+        results = [leader.result()] + [f.result() for f in followers]
+
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+
+
+def test_single_flight_shares_exceptions():
+    flight = SingleFlight("test")
+
+    def fail():
+        raise ValueError("provider error")
+
+    with pytest.raises(ValueError):
+        flight.do("key", fail)
+
+    # Once finished the key can be called again.
+    assert flight.do("key", lambda: "result") == "result"
+
+
+def test_single_flight_coalesces_tasks():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def slow_call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*[flight.ado("key", slow_call) for _ in range(5)])
+
+    assert asyncio.run(main()) == ["result"] * 5
+    assert len(calls) == 1
+
+
+def test_single_flight_leader_cancelled():
+    """
+    Cancelling the first caller, e.g. its client went away, doesn't fail the others.
+    """
+    flight = SingleFlight("test")
+    calls = []
+
+    async def slow_call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        leader = asyncio.create_task(flight.ado("key", slow_call))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.ado("key", slow_call))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == "result"
+    assert len(calls) == 1
+
+
+def test_single_flight_cancelled_without_waiters():
+    flight = SingleFlight("test")
+    finished = []
+
+    async def slow_call():
+        await asyncio.sleep(1)
+        finished.append(1)
+
+    async def main():
+        caller = asyncio.create_task(flight.ado("key", slow_call))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.sleep(0)
+        assert not flight._calls
+
+    asyncio.run(main())
+    assert not finished
+
+
+def test_redis_lock_released_from_another_thread(monkeypatch):
+    """
+    Async callers acquire and release the lock in different asyncio.to_thread calls.
+    """
+    # The lock object only talks to Redis in do_acquire / do_release.
+    monkeypatch.setattr(singleflight, "RedisCache", object)
+    monkeypatch.setattr(singleflight, "get_redis_connection", lambda alias: redis.Redis())
+    monkeypatch.setattr(Lock, "do_acquire", lambda self, token: True)
+    released = []
+    monkeypatch.setattr(Lock, "do_release", lambda self, token: released.append(token))
+
+    flight = SingleFlight("test")
+    lock = flight.get_redis_lock("key")
+    with ThreadPoolExecutor(max_workers=1) as first, ThreadPoolExecutor(
+        max_workers=1
+    ) as second:
+        assert first.submit(flight.acquire, lock).result()
+        second.submit(lock.release).result()
+
+    assert len(released) == 1
@@ -12,11 +12,15 @@ from django.db.models.functions import Cast
 from django.contrib.contenttypes.models import ContentType
 from contextlib import suppress
 from django.db.models import Model
+import numpy as np
 
 from jao_backend.vacancies.models import Vacancy
 from jao_backend.common.models import ListModel
 from jao_backend.application_statistics.models import AggregatedApplicationStatistic
-from jao_backend.oleeo.models import Dandi, Vacancies
+from jao_backend.application_statistics.models import VacancyRegionStatistic
+from jao_backend.application_statistics.regions import REGIONS
+from jao_backend.application_statistics.regions import get_postcode_region_index
+from jao_backend.oleeo.models import Dandi, ListPostcode, Vacancies
 from jao_backend.oleeo.base_models import NoDestinationModel
 from jao_backend.oleeo.base_querysets import sliding_window_range
 
@@ -101,6 +105,70 @@ class OleeoApplicantStatisticsAggregator:
                 updated_at=row["latest_updated"],
             )
 
+    def _get_postcode_region_indexes(self):
+        """
+        :return: Region index of each ListPostcode id, for postcodes in a region.
+        """
+        region_indexes = {}
+        for postcode_id, postcode in ListPostcode.objects.values_list(
+            "postcode_id", "postcode_desc"
+        ):
+            region_index = get_postcode_region_index(postcode)
+            if region_index is not None:
+                region_indexes[postcode_id] = region_index
+        return region_indexes
+
+    def _get_vacancy_region_counts(
+        self, vacancy_id_start, vacancy_id_end, postcode_region_indexes
+    ):
+        """
+        :return: {vacancy_id: (applicants per region, latest update)}
+        """
+        local_vacancies = Vacancy.objects.filter(
+            pk__gte=vacancy_id_start, pk__lte=vacancy_id_end
+        ).values_list("pk", flat=True)
+        rows = (
+            Vacancies.objects_for_ingest.valid_for_ingest()
+            .filter(
+                vacancy_id__gte=vacancy_id_start,
+                vacancy_id__lte=vacancy_id_end,
+                vacancy_id__in=list(local_vacancies),
+                applications__dandi__postcode__isnull=False,
+            )
+            .values("vacancy_id", "applications__dandi__postcode_id")
+            .annotate(
+                applicant_count=Count("applications"),
+                latest_updated=Max("applications__dandi__row_last_updated"),
+            )
+            .order_by()
+            .values_list(
+                "vacancy_id",
+                "applications__dandi__postcode_id",
+                "applicant_count",
+                "latest_updated",
+            )
+        )
+
+        region_counts = {}
+        for vacancy_id, postcode_id, applicant_count, latest_updated in rows:
+            region_index = postcode_region_indexes.get(postcode_id)
+            if region_index is None:
+                continue
+            counts, updated_at = region_counts.get(
+                vacancy_id, (np.zeros(len(REGIONS), dtype=np.int64), latest_updated)
+            )
+            counts[region_index] += applicant_count
+            region_counts[vacancy_id] = (counts, max(updated_at, latest_updated))
+        return region_counts
+
+    def _create_region_statistics(self, region_counts):
+        for vacancy_id, (counts, updated_at) in region_counts.items():
+            yield VacancyRegionStatistic(
+                vacancy_id=vacancy_id,
+                region_counts=counts.tolist(),
+                updated_at=updated_at,
+            )
+
     def do_ingest(self):
         if not settings.JAO_BACKEND_ENABLE_OLEEO:
             logger.error("OLEEO integration is disabled")
@@ -110,6 +178,8 @@ class OleeoApplicantStatisticsAggregator:
             self.batch_size or settings.JAO_BACKEND_INGEST_DEFAULT_BATCH_SIZE
         )
         relations = get_related_list_models(Dandi)
+        # Postcodes are mapped to regions once, batches only count applicants.
+        postcode_region_indexes = self._get_postcode_region_indexes()
         max_vacancy_id = Vacancy.objects.order_by("pk").last().pk
 
         logger.info("Aggregate.. %s", max_vacancy_id)
@@ -161,4 +231,18 @@ class OleeoApplicantStatisticsAggregator:
                         f"  Batch {batch_start}-{batch_end}: No statistics to create"
                     )
 
+                VacancyRegionStatistic.objects.filter(
+                    vacancy_id__gte=batch_start, vacancy_id__lte=batch_end
+                ).delete()
+                region_statistics = VacancyRegionStatistic.objects.bulk_create(
+                    self._create_region_statistics(
+                        self._get_vacancy_region_counts(
+                            batch_start, batch_end, postcode_region_indexes
+                        )
+                    )
+                )
+                logger.info(
+                    f"  Batch {batch_start}-{batch_end}: Created {len(region_statistics)} region statistics"
+                )
+
             logger.info(f"Completed batch {batch_start}-{batch_end}")
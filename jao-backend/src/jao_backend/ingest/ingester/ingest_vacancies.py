@@ -195,6 +195,9 @@ class OleeoVacanciesIngest:
             "%s Create %s instances", source_model.__name__, len(create_instances)
         )
         if create_instances:
+            self.before_ingest(
+                source_model, destination_model, source_instances, create_instances
+            )
             created_count = destination_model.objects.bulk_create(
                 create_instances,
             )
@@ -209,6 +212,9 @@ class OleeoVacanciesIngest:
         if update_instances:
             for instance in update_instances:
                 instance.deleted = False
+            self.before_ingest(
+                source_model, destination_model, source_instances, update_instances
+            )
 
             non_pk_fields = [
                 field.name
@@ -317,6 +323,43 @@ class OleeoVacanciesIngest:
             if source_role_types != destination_role_types:
                 destination_instance.role_types.set(source_role_types)
 
+    @dispatch
+    def before_ingest(
+        self,
+        source_model,
+        destination_model,
+        source_instances=None,
+        destination_instances=None,
+    ):
+        """
+        default dispatch (see plum dispatch docs https://beartype.github.io/plum/basic_usage.html)
+
+        before_ingest is called before create and update, changes to
+        destination_instances are saved with them.
+        """
+        pass
+
+    @dispatch
+    def before_ingest(
+        self,
+        source_model: Type[Vacancies],
+        destination_model: Type[Vacancy],
+        source_instances=None,
+        destination_instances=None,
+    ):
+        """
+        Derive the HTML description and embedding text, where the source text changed.
+        """
+        updated_count = sum(
+            vacancy.update_derived_text() for vacancy in destination_instances
+        )
+        logger.info(
+            "Derived text for %d/%d %s",
+            updated_count,
+            len(destination_instances),
+            destination_model.__name__,
+        )
+
     @dispatch
     def after_ingest(
         self,
@@ -73,6 +73,90 @@ JAO_BACKEND_INGEST_DEFAULT_BATCH_SIZE = int(
     os.environ.get("JAO_BACKEND_INGEST_DEFAULT_BATCH_SIZE", 50000)
 )
 
+# Approximate nearest neighbour indexes on embedding tables, see jao_backend.embeddings.indexes
+# Build or rebuild them with: manage.py build_vector_indexes
+JAO_BACKEND_VECTOR_INDEX_TYPE = os.environ.get("JAO_BACKEND_VECTOR_INDEX_TYPE", "hnsw")
+JAO_BACKEND_HNSW_M = int(os.environ.get("JAO_BACKEND_HNSW_M", 16))
+JAO_BACKEND_HNSW_EF_CONSTRUCTION = int(
+    os.environ.get("JAO_BACKEND_HNSW_EF_CONSTRUCTION", 64)
+)
+# If not set, lists is derived from the number of rows when the index is built.
+JAO_BACKEND_IVFFLAT_LISTS = int(os.environ.get("JAO_BACKEND_IVFFLAT_LISTS", 0)) or None
+
+# Quantised indexes, "vector" (full precision), "halfvec" or "bit", for every embedding
+# table or per table, e.g. "embeddingxl=bit,embeddinglarge=halfvec".  Rebuild the
+# indexes after changing this: manage.py build_vector_indexes --rebuild
+# Until they are rebuilt, tables whose index doesn't match are searched as "vector".
+JAO_BACKEND_VECTOR_QUANTISATION = os.environ.get(
+    "JAO_BACKEND_VECTOR_QUANTISATION", "vector"
+)
+# Seconds between each process checking the quantisation of the existing indexes.
+JAO_BACKEND_VECTOR_INDEX_CHECK_INTERVAL = int(
+    os.environ.get("JAO_BACKEND_VECTOR_INDEX_CHECK_INTERVAL", 60)
+)
+# Candidates fetched from a quantised index per result, then re-ranked exactly.
+JAO_BACKEND_VECTOR_RERANK_OVERFETCH = int(
+    os.environ.get("JAO_BACKEND_VECTOR_RERANK_OVERFETCH", 4)
+)
+
+# Search time parameters, higher values trade speed for recall.
+JAO_BACKEND_HNSW_EF_SEARCH = int(os.environ.get("JAO_BACKEND_HNSW_EF_SEARCH", 40))
+JAO_BACKEND_IVFFLAT_PROBES = int(os.environ.get("JAO_BACKEND_IVFFLAT_PROBES", 10))
+# Vacancies with several chunks are ranked by the "min" or "mean" of their distances.
+JAO_BACKEND_VACANCY_CHUNK_POOLING = os.environ.get(
+    "JAO_BACKEND_VACANCY_CHUNK_POOLING", "min"
+)
+# Filtered searches matching up to this many embeddings compare them all exactly,
+# larger ones search the ANN index for extra candidates and filter them.
+JAO_BACKEND_VECTOR_PREFILTER_MAX_ROWS = int(
+    os.environ.get("JAO_BACKEND_VECTOR_PREFILTER_MAX_ROWS", 10_000)
+)
+
+# "pgvector" searches in the database, "numpy" searches an in-process copy of the
+# vectors (jao_backend.embeddings.search), "snapshot" is numpy reading memory mapped
+# files shared by all workers on a node (jao_backend.embeddings.snapshots).
+JAO_BACKEND_SIMILARITY_SEARCH_BACKEND = os.environ.get(
+    "JAO_BACKEND_SIMILARITY_SEARCH_BACKEND", "pgvector"
+)
+# Seconds between checks for new embeddings (or snapshots), when using numpy or snapshot.
+JAO_BACKEND_NUMPY_INDEX_REFRESH_INTERVAL = int(
+    os.environ.get("JAO_BACKEND_NUMPY_INDEX_REFRESH_INTERVAL", 60)
+)
+# Snapshots are written by the Celery worker and read by the API, which run as separate
+# tasks in ECS, so this must be a volume both mount (e.g. EFS).  There is no default, a
+# directory only one of them sees leaves every API worker loading the vectors itself.
+JAO_BACKEND_EMBEDDING_SNAPSHOT_DIR = os.environ.get("JAO_BACKEND_EMBEDDING_SNAPSHOT_DIR")
+if (
+    JAO_BACKEND_SIMILARITY_SEARCH_BACKEND == "snapshot"
+    and not JAO_BACKEND_EMBEDDING_SNAPSHOT_DIR
+):
+    raise ImproperlyConfigured(
+        "JAO_BACKEND_EMBEDDING_SNAPSHOT_DIR must be set to a volume shared by the "
+        "Celery worker and the API, when JAO_BACKEND_SIMILARITY_SEARCH_BACKEND is 'snapshot'."
+    )
+# Two stage numpy / snapshot search: candidates are found with vectors reduced to
+# JAO_BACKEND_FIRST_STAGE_DIMENSIONS by "truncate" (for Matryoshka models) or "pca",
+# then re-ranked with the full vectors.  Empty searches the full vectors only.
+JAO_BACKEND_FIRST_STAGE_REDUCTION = os.environ.get(
+    "JAO_BACKEND_FIRST_STAGE_REDUCTION", ""
+)
+JAO_BACKEND_FIRST_STAGE_DIMENSIONS = int(
+    os.environ.get("JAO_BACKEND_FIRST_STAGE_DIMENSIONS", 256)
+)
+# Candidates per result re-ranked with the full vectors.
+JAO_BACKEND_FIRST_STAGE_OVERFETCH = int(
+    os.environ.get("JAO_BACKEND_FIRST_STAGE_OVERFETCH", 10)
+)
+
+# Nearest neighbours stored per vacancy after embedding, see jao_backend.vacancies.neighbours
+JAO_BACKEND_VACANCY_NEIGHBOURS = int(
+    os.environ.get("JAO_BACKEND_VACANCY_NEIGHBOURS", 20)
+)
+# Vacancies compared per matrix product, memory is this x the number of vacancies.
+JAO_BACKEND_VACANCY_NEIGHBOURS_BLOCK_SIZE = int(
+    os.environ.get("JAO_BACKEND_VACANCY_NEIGHBOURS_BLOCK_SIZE", 1024)
+)
+
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = os.getenv(
@@ -85,6 +169,13 @@ CELERY_BEAT_SCHEDULE = {
     },
 }
 
+if JAO_BACKEND_SIMILARITY_SEARCH_BACKEND == "snapshot":
+    # Only the snapshot backend reads them.
+    CELERY_BEAT_SCHEDULE["write-vacancy-embedding-snapshots"] = {
+        "task": "jao_backend.vacancies.tasks.write_vacancy_embedding_snapshots",
+        "schedule": crontab(minute="*/15"),
+    }
+
 CELERY_TIMEZONE = "Europe/London"
 
 INSTALLED_APPS = [
@@ -157,6 +248,10 @@ EMBEDDING_TAG_JOB_TITLE_RESPONSIBILITIES_MODEL = os.environ.get(
 
 # Tag definitions here are synced to the database in `EmbeddingTag.get_configured_tags`
 # unique id is across uuid and model.
+#
+# Text longer than chunk_size tokens is split into windows that overlap by chunk_overlap
+# tokens, at most max_chunks are embedded and the results are combined according to pooling
+# (see jao_backend.embeddings.chunking).
 EMBEDDING_TAGS = {
     EMBEDDING_TAG_JOB_TITLE_RESPONSIBILITIES_ID: {
         # UUID is in UUID7 format, see
@@ -165,6 +260,10 @@ EMBEDDING_TAGS = {
         "description": "Job title and responsibilities concatenated",
         "model": EMBEDDING_TAG_JOB_TITLE_RESPONSIBILITIES_MODEL,
         "version": 1,
+        "chunk_size": int(os.environ.get("JAO_BACKEND_EMBEDDING_CHUNK_SIZE", 512)),
+        "chunk_overlap": int(os.environ.get("JAO_BACKEND_EMBEDDING_CHUNK_OVERLAP", 64)),
+        "max_chunks": int(os.environ.get("JAO_BACKEND_EMBEDDING_MAX_CHUNKS", 16)),
+        "pooling": "mean",
     },
 }
 
@@ -217,6 +316,71 @@ if JAO_BACKEND_ENABLE_OLEEO:
         env="JAO_BACKEND_OLEEO_DATABASE_URL")
     DATABASE_ROUTERS = ["jao_backend.common.routers.router.OleeoRouter"]
 
+# Redis cache shared between workers, separate database from celery by default.
+JAO_BACKEND_REDIS_URL = os.environ.get(
+    "JAO_BACKEND_REDIS_URL", "redis://localhost:6379/1"
+)
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "shared": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": JAO_BACKEND_REDIS_URL,
+        "OPTIONS": {
+            # Caches are an optimisation, if Redis is unavailable fail fast.
+            "SOCKET_CONNECT_TIMEOUT": 1,
+            "SOCKET_TIMEOUT": 1,
+        },
+    },
+}
+
+# Query embeddings are cached, so resubmitting the same text skips the embedding call.
+JAO_BACKEND_QUERY_EMBEDDING_CACHE_TIMEOUT = int(
+    os.environ.get("JAO_BACKEND_QUERY_EMBEDDING_CACHE_TIMEOUT", 60 * 60 * 24)
+)
+JAO_BACKEND_QUERY_EMBEDDING_CACHE_MAX_ENTRIES = int(
+    os.environ.get("JAO_BACKEND_QUERY_EMBEDDING_CACHE_MAX_ENTRIES", 50000)
+)
+# Entries also kept in each worker process.
+JAO_BACKEND_QUERY_EMBEDDING_CACHE_LOCAL_MAXSIZE = int(
+    os.environ.get("JAO_BACKEND_QUERY_EMBEDDING_CACHE_LOCAL_MAXSIZE", 256)
+)
+
+# Similar vacancies found for a description, shared by /analyse, /analyse/stream and the
+# section endpoints, are cached until vacancies are ingested or embedded,
+# see jao_backend.vacancies.cache
+JAO_BACKEND_SIMILAR_ADVERTS_CACHE_TIMEOUT = int(
+    os.environ.get("JAO_BACKEND_SIMILAR_ADVERTS_CACHE_TIMEOUT", 60 * 60 * 24)
+)
+JAO_BACKEND_SIMILAR_ADVERTS_CACHE_MAX_ENTRIES = int(
+    os.environ.get("JAO_BACKEND_SIMILAR_ADVERTS_CACHE_MAX_ENTRIES", 10000)
+)
+JAO_BACKEND_SIMILAR_ADVERTS_CACHE_LOCAL_MAXSIZE = int(
+    os.environ.get("JAO_BACKEND_SIMILAR_ADVERTS_CACHE_LOCAL_MAXSIZE", 256)
+)
+# Seconds between each process checking the corpus version for changes.
+JAO_BACKEND_CORPUS_VERSION_CHECK_INTERVAL = int(
+    os.environ.get("JAO_BACKEND_CORPUS_VERSION_CHECK_INTERVAL", 5)
+)
+
+# Corpus-wide applicant statistics that similar vacancies are compared with, kept per
+# corpus version, see jao_backend.application_statistics.cohorts
+JAO_BACKEND_STATISTICS_BASELINE_CACHE_TIMEOUT = int(
+    os.environ.get("JAO_BACKEND_STATISTICS_BASELINE_CACHE_TIMEOUT", 60 * 60 * 24)
+)
+
+# Seconds other workers wait for an in-flight embedding of the same text, before
+# embedding it themselves.
+JAO_BACKEND_EMBEDDING_LOCK_TIMEOUT = int(
+    os.environ.get("JAO_BACKEND_EMBEDDING_LOCK_TIMEOUT", 30)
+)
+
+# Threads (and so database connections) per process, used by async API views for
+# database access, see jao_backend.common.db.executor
+JAO_BACKEND_DB_THREADS = int(os.environ.get("JAO_BACKEND_DB_THREADS", 8))
+
 # Session engine, use the default database backed sessions
 SESSION_ENGINE = "django.contrib.sessions.backends.db"
 SESSION_CACHE_ALIAS = "default"
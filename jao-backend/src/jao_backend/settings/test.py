@@ -27,6 +27,11 @@ EMBEDDING_TAGS = {
     },
 }
 
+# Tests don't need Redis.
+CACHES["shared"] = {
+    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+}
+
 # Under test, Django will add "test" as a prefix to the database name and suffix a worker id under pytest-xdist
 DEFAULT_TEST_DATABASE_NAME = "postgresql:///jao-backend"
 # A Postgres database is used to simulate the oleeo database.
@@ -8,6 +8,9 @@ from django.contrib import admin, messages
 from django.db.models import Count, Q
 from django.shortcuts import redirect, render
 from django.urls import path
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.html import format_html_join
 from django.conf import settings
 from django import forms
 
@@ -15,6 +18,7 @@ from jao_backend.common.admin import ReadOnlyAdminMixin
 from jao_backend.common.celery.monitoring import is_task_running
 from jao_backend.embeddings.models import EmbeddingTag
 from jao_backend.vacancies.models import Vacancy, VacancyGrade, VacancyRoleType
+from jao_backend.vacancies.models import VacancyNeighbours
 from jao_backend.vacancies.tasks import embed_vacancies
 
 
@@ -91,10 +95,37 @@ class VacancyAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
     list_filter = (StatusFilter, "last_updated")
     ordering = ("-last_updated",)
     inlines = [VacancyGradeInline, VacancyRoleTypeInline]
+    readonly_fields = ("similar_vacancies",)
 
     def get_queryset(self, request):
         return super().get_queryset(request).select_related()
 
+    @admin.display(description="Similar vacancies")
+    def similar_vacancies(self, obj):
+        """
+        Precomputed neighbours of the vacancy, for each tag, see VacancyNeighbours.
+        """
+        sections = []
+        for neighbours in VacancyNeighbours.objects.filter(vacancy=obj).select_related(
+            "tag"
+        ):
+            links = format_html_join(
+                "",
+                '<li><a href="{}">{}</a> ({:.3f})</li>',
+                (
+                    (
+                        reverse("admin:vacancies_vacancy_change", args=[vacancy.pk]),
+                        vacancy.title,
+                        vacancy.distance,
+                    )
+                    for vacancy in neighbours.get_vacancies(top_n=10)
+                ),
+            )
+            sections.append(
+                format_html("<p>{}</p><ol>{}</ol>", neighbours.tag.name, links)
+            )
+        return format_html_join("", "{}", ((section,) for section in sections)) or "-"
+
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
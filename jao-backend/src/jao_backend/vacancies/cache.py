@@ -0,0 +1,100 @@
+"""
+Cached similarity search results.
+
+Results only change when the vacancy corpus does, so they are keyed by the
+description, the search options and `corpus_version`.  Ingest, embedding and snapshot
+tasks bump the version when they finish, after which old entries are never read and
+expire.  `update_vacancies` bumps it again as its last step.
+"""
+
+import hashlib
+import json
+from typing import Optional
+from typing import Tuple
+
+from django.conf import settings
+
+from jao_backend.common.cache import TieredCache
+from jao_backend.common.cache import VersionStamp
+
+corpus_version = VersionStamp(
+    "vacancies:corpus-version",
+    alias="shared",
+    check_interval=settings.JAO_BACKEND_CORPUS_VERSION_CHECK_INTERVAL,
+)
+"""Bumped when vacancies, embeddings or statistics change, see `bump_corpus_version`."""
+
+similar_vacancies_cache = TieredCache(
+    "similar-vacancies",
+    alias="shared",
+    timeout=settings.JAO_BACKEND_SIMILAR_ADVERTS_CACHE_TIMEOUT,
+    max_entries=settings.JAO_BACKEND_SIMILAR_ADVERTS_CACHE_MAX_ENTRIES,
+    local_maxsize=settings.JAO_BACKEND_SIMILAR_ADVERTS_CACHE_LOCAL_MAXSIZE,
+)
+"""JSON [[vacancy_id, distance], ...], nearest first, see api.v0.endpoints.get_similar_vacancies."""
+
+embedding_counts_cache = TieredCache(
+    "vacancy-embedding-counts",
+    alias="shared",
+    timeout=settings.JAO_BACKEND_SIMILAR_ADVERTS_CACHE_TIMEOUT,
+    local_maxsize=16,
+)
+"""Number of VacancyEmbedding rows of each tag, keyed by corpus version."""
+
+
+def get_similar_vacancies_cache_key(
+    description: str, top_n: int, filters: Optional[dict] = None
+) -> Optional[str]:
+    """
+    :return: Cache key for similar vacancies, or None if the corpus version isn't
+            available, in which case results aren't cached.
+    """
+    version = corpus_version.get()
+    if version is None:
+        return None
+
+    # Whitespace is normalised, as query embeddings are, see EmbeddingTag.get_query_cache_key.
+    normalised_description = " ".join(description.split())
+    digest = hashlib.sha256(
+        json.dumps(
+            [normalised_description, top_n, filters], sort_keys=True, default=str
+        ).encode()
+    ).hexdigest()
+    return f"{version}:{settings.EMBEDDING_TAG_JOB_TITLE_RESPONSIBILITIES_ID}:{digest}"
+
+
+def get_cached_similar_vacancies(
+    description: str, top_n: int, filters: Optional[dict] = None
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    :return: (cache key, cached JSON or None), the key is None when results can't be
+            cached.
+    """
+    key = get_similar_vacancies_cache_key(description, top_n, filters)
+    if key is None:
+        return None, None
+    return key, similar_vacancies_cache.get(key)
+
+
+def get_tag_embedding_count(queryset, tag) -> int:
+    """
+    :param queryset: All VacancyEmbedding rows, the count is cached per tag only.
+    :return: Number of rows with tag, counted once per corpus version.
+    """
+    version = corpus_version.get()
+    if version is None:
+        return queryset.filter(tag=tag).count()
+
+    key = f"{version}:{tag.pk}"
+    count = embedding_counts_cache.get(key)
+    if count is None:
+        count = queryset.filter(tag=tag).count()
+        embedding_counts_cache.set(key, count)
+    return count
+
+
+def bump_corpus_version():
+    """
+    Invalidate cached results, call after vacancies or their embeddings change.
+    """
+    return corpus_version.bump()
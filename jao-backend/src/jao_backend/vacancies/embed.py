@@ -15,7 +15,6 @@ import logging
 import nest_asyncio
 from django.conf import settings
 
-from jao_backend.common.text_processing.clean_oleeo import strip_oleeo_bbcode
 from jao_backend.embeddings.models import EmbeddingTag
 from jao_backend.embeddings.models import TaggedEmbedding
 from jao_backend.vacancies.models import Vacancy
@@ -43,15 +42,14 @@ def embed_vacancy(vacancy: "Vacancy") -> "TaggedEmbedding":
     tag = EmbeddingTag.get_tag(
         settings.EMBEDDING_TAG_JOB_TITLE_RESPONSIBILITIES_ID)
 
-    # Data from OLEEO can contain bbcode, strip it before embedding.
-    job_info_text = strip_oleeo_bbcode(
-        f"{vacancy.title}\n{vacancy.person_spec}\n{vacancy.description}"
-    )
+    # Cleaned of OLEEO markup at ingest.
+    job_info_text = vacancy.get_embedding_text()
 
     # Fix for ollama connection issue, remove if https://github.com/BerriAI/litellm/pull/7625 is merged:
     nest_asyncio.apply()
 
-    response = tag.embed(job_info_text)
+    # Long adverts are chunked and pooled according to the tag, rather than truncated.
+    vectors, response = tag.embed_text(job_info_text)
     cost = tag.completion_cost(response)  # noqa
 
     logger.info(
@@ -60,7 +58,7 @@ def embed_vacancy(vacancy: "Vacancy") -> "TaggedEmbedding":
         cost,
     )
 
-    chunks = tag.response_chunks(response)
+    chunks = list(vectors)
 
     # Associate a vacancy with the embeddings data and a tag
     # to specifies the version of the embedding process and the model.
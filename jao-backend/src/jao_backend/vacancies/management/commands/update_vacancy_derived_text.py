@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+
+from jao_backend.common.management.helpers import TaskCommandMixin
+from jao_backend.vacancies.tasks import update_vacancy_derived_text
+
+
+class Command(TaskCommandMixin, BaseCommand):
+    help = "Backfill the HTML description and embedding text stored on vacancies."
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Update vacancies even if their text hasn't changed.",
+        )
+
+    def handle(self, *args, **options):
+        super().run_task(options, update_vacancy_derived_text, force=options["force"])
@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+
+from jao_backend.common.management.helpers import TaskCommandMixin
+from jao_backend.vacancies.tasks import update_vacancy_neighbours
+
+
+class Command(TaskCommandMixin, BaseCommand):
+    help = "Precompute the nearest neighbours of each embedded vacancy."
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Recompute every vacancy, not only those affected by new embeddings.",
+        )
+
+    def handle(self, *args, **options):
+        super().run_task(options, update_vacancy_neighbours, force=options["force"])
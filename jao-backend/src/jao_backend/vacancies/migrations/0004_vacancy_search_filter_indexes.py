@@ -0,0 +1,22 @@
+# Generated by Django 5.0.14 on 2026-10-18 22:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('roles', '0002_alter_grade_options'),
+        ('vacancies', '0003_vacancy_person_spec_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vacancy',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['live_date', 'closing_date'], name='vacancy_live_dates_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vacancy',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['min_salary', 'max_salary'], name='vacancy_salary_idx'),
+        ),
+    ]
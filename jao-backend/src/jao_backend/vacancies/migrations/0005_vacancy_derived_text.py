@@ -0,0 +1,28 @@
+# Generated by Django 5.0.14 on 2026-10-18 22:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vacancies', '0004_vacancy_search_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vacancy',
+            name='description_html',
+            field=models.TextField(blank=True, help_text='Description rendered from OLEEO markup to HTML.', null=True),
+        ),
+        migrations.AddField(
+            model_name='vacancy',
+            name='embedding_text',
+            field=models.TextField(blank=True, help_text='Title, person spec and description without markup, as embedded.', null=True),
+        ),
+        migrations.AddField(
+            model_name='vacancy',
+            name='source_text_hash',
+            field=models.CharField(blank=True, default='', help_text='Hash of the text description_html and embedding_text were derived from.', max_length=64),
+        ),
+    ]
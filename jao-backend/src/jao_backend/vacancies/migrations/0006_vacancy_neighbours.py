@@ -0,0 +1,34 @@
+# Generated by Django 5.0.14 on 2026-10-18 23:13
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('embeddings', '0003_embedding_ann_indexes'),
+        ('vacancies', '0005_vacancy_derived_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VacancyNeighbours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('neighbour_ids', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), help_text='Vacancy ids, nearest first.', size=None)),
+                ('distances', django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), help_text='Cosine distance to each neighbour.', size=None)),
+                ('updated_at', models.DateTimeField(help_text='Start of the run that computed the neighbours.')),
+                ('tag', models.ForeignKey(help_text='The tag of the embeddings compared.', on_delete=django.db.models.deletion.CASCADE, to='embeddings.embeddingtag')),
+                ('vacancy', models.ForeignKey(help_text='The vacancy.', on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='vacancies.vacancy')),
+            ],
+            options={
+                'verbose_name_plural': 'Vacancy Neighbours',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='vacancyneighbours',
+            constraint=models.UniqueConstraint(fields=('vacancy', 'tag'), name='unique_vacancy_neighbours_tag'),
+        ),
+    ]
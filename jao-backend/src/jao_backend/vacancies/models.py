@@ -1,9 +1,29 @@
+import hashlib
+import json
+import math
+
 from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
 from django.db import models
-
+from django.db.models import Q
+
+from jao_backend.common.db.executor import db_sync_to_async
+from jao_backend.common.text_processing.clean_oleeo import parse_oleeo_bbcode
+from jao_backend.common.text_processing.clean_oleeo import strip_oleeo_bbcode
+from jao_backend.embeddings.indexes import MAX_HNSW_EF_SEARCH
+from jao_backend.embeddings.indexes import get_rerank_fetch
+from jao_backend.embeddings.indexes import get_search_quantisation
+from jao_backend.embeddings.indexes import vector_search_settings
+from jao_backend.embeddings.models import Embedding
 from jao_backend.embeddings.models import TaggedEmbedding, EmbeddingTag
+from jao_backend.embeddings.search import NUMPY
+from jao_backend.embeddings.search import NumpyVectorIndex
+from jao_backend.embeddings.search import SNAPSHOT
+from jao_backend.embeddings.search import get_numpy_vector_index
+from jao_backend.embeddings.snapshots import SnapshotVectorIndex
 from jao_backend.roles.models import Grade
 from jao_backend.roles.models import RoleType
+from jao_backend.vacancies.cache import get_tag_embedding_count
 from jao_backend.vacancies.querysets import VacancyQuerySet
 from jao_backend.vacancies.querysets import VacancyEmbeddingQuerySet
 
@@ -13,6 +33,17 @@ class Vacancy(models.Model):
         verbose_name_plural = "Vacancies"
         indexes = [
             models.Index(fields=["is_deleted"]),
+            # Partial indexes for filtered similarity search, see search_filter.
+            models.Index(
+                fields=["live_date", "closing_date"],
+                condition=Q(is_deleted=False),
+                name="vacancy_live_dates_idx",
+            ),
+            models.Index(
+                fields=["min_salary", "max_salary"],
+                condition=Q(is_deleted=False),
+                name="vacancy_salary_idx",
+            ),
         ]
 
     id = models.IntegerField(
@@ -43,6 +74,22 @@ class Vacancy(models.Model):
     summary = models.TextField(null=True, blank=True, help_text="Blerb about teams.")
     person_spec = models.TextField(null=True, blank=True, help_text="The person specification of a vacancy")
 
+    # Derived from the OLEEO text fields at ingest, see update_derived_text.
+    description_html = models.TextField(
+        null=True, blank=True, help_text="Description rendered from OLEEO markup to HTML."
+    )
+    embedding_text = models.TextField(
+        null=True,
+        blank=True,
+        help_text="Title, person spec and description without markup, as embedded.",
+    )
+    source_text_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        help_text="Hash of the text description_html and embedding_text were derived from.",
+    )
+
     grades = models.ManyToManyField(
         through="VacancyGrade", to=Grade, help_text="The grades of the vacancy."
     )
@@ -71,6 +118,59 @@ class Vacancy(models.Model):
             < expected_tags_count
         )
 
+    def get_source_text_hash(self) -> str:
+        return hashlib.sha256(
+            json.dumps([self.title, self.person_spec, self.description]).encode()
+        ).hexdigest()
+
+    def update_derived_text(self, force=False) -> bool:
+        """
+        Set description_html and embedding_text, if the text they derive from changed.
+
+        Doesn't save, so ingest can write them with the rest of the vacancy.
+
+        :return: True if the fields were updated.
+        """
+        source_text_hash = self.get_source_text_hash()
+        if not force and source_text_hash == self.source_text_hash:
+            return False
+
+        self.description_html = parse_oleeo_bbcode(self.description or "")
+        # Data from OLEEO can contain bbcode, strip it before embedding.
+        self.embedding_text = strip_oleeo_bbcode(
+            f"{self.title}\n{self.person_spec}\n{self.description}"
+        )
+        self.source_text_hash = source_text_hash
+        return True
+
+    def get_description_html(self) -> str:
+        """
+        :return: The stored description_html, or render it if it hasn't been set yet.
+        """
+        if self.description_html is None:
+            return parse_oleeo_bbcode(self.description or "")
+        return self.description_html
+
+    def get_embedding_text(self) -> str:
+        """
+        :return: The stored embedding_text, or derive it if it hasn't been set yet.
+        """
+        if self.embedding_text is None:
+            self.update_derived_text()
+        return self.embedding_text
+
+    def get_neighbours(self, tag: EmbeddingTag, top_n=None):
+        """
+        Vacancies most similar to this one, precomputed by update_vacancy_neighbours.
+
+        :return: list of Vacancy annotated with distance, nearest first, empty if the
+                neighbours haven't been computed yet.
+        """
+        neighbours = VacancyNeighbours.objects.filter(vacancy=self, tag=tag).first()
+        if neighbours is None:
+            return []
+        return neighbours.get_vacancies(top_n=top_n)
+
     def __str__(self):
         return f"{self.id, self.title}"
 
@@ -122,38 +222,202 @@ class VacancyEmbeddingManager(models.Manager):
     def get_queryset(self):
         return VacancyEmbeddingQuerySet(self.model, using=self._db)
 
-    def similar_vacancies(self, text, tag: EmbeddingTag, top_n=10):
+    def similar_vacancies(
+        self,
+        text,
+        tag: EmbeddingTag,
+        top_n=10,
+        ef_search=None,
+        probes=None,
+        filters=None,
+    ):
         """
         Get vacancies similar to the provided text.
 
         :param text: The text to compare against vacancy responsibilities.
         :param tag: The EmbeddingTag to use for similarity comparison.
         :param top_n: The number of similar vacancies to return (default is 10).
+        :param ef_search: HNSW search candidates, default settings.JAO_BACKEND_HNSW_EF_SEARCH
+        :param probes: IVFFlat lists to search, default settings.JAO_BACKEND_IVFFLAT_PROBES
+        :param filters: Keyword arguments for VacancyQuerySet.search_filter, e.g.
+                {"live": True, "grade_ids": [1, 2]}, applied inside the search.
 
         EmbeddingTag stores tag uuid and embedding model to use.
 
+        :return: list of VacancyEmbedding annotated with distance, nearest first.
+
         >>> tag = EmbeddingTag.get_tag(settings.EMBEDDING_TAG_JOB_TITLE_RESPONSIBILITIES_ID)
         ... similar_vacancies = VacancyEmbedding.objects.similar_vacancies("Sample job description", tag)
-        ... print(similar_vacancies.values_list("id", "title", flat=True))
+        ... print([(ve.vacancy_id, ve.vacancy.title) for ve in similar_vacancies])
         """
-        response = tag.embed(text)
-        chunks = tag.response_chunks(response)
+        # Query text is chunked and pooled in the same way as vacancies are when indexed.
+        query_vector = tag.embed_query(text)
+        return self.similar_vacancies_for_vector(
+            query_vector,
+            tag,
+            top_n=top_n,
+            ef_search=ef_search,
+            probes=probes,
+            filters=filters,
+        )
 
-        # If there are many chunks we sue the mean.
-        if len(chunks) > 1:
-            chunking_strategy = MeanStrategy()
-            query_vector = chunking_strategy.chunk(chunks)
-        else:
-            query_vector = chunks[0]  # for now take the first chunk
+    async def asimilar_vacancies(
+        self,
+        text,
+        tag: EmbeddingTag,
+        top_n=10,
+        ef_search=None,
+        probes=None,
+        filters=None,
+    ):
+        """
+        Async version of `similar_vacancies`.
+
+        The embedding call doesn't block, the search runs in the bounded database
+        thread pool (vector_search_settings needs a transaction, which the async ORM
+        doesn't support).
+        """
+        query_vector = await tag.aembed_query(text)
+        return await db_sync_to_async(self.similar_vacancies_for_vector)(
+            query_vector,
+            tag,
+            top_n=top_n,
+            ef_search=ef_search,
+            probes=probes,
+            filters=filters,
+        )
+
+    def similar_vacancies_for_vector(
+        self,
+        query_vector,
+        tag: EmbeddingTag,
+        top_n=10,
+        ef_search=None,
+        probes=None,
+        filters=None,
+    ):
+        """
+        similar_vacancies, for an already embedded query.
+
+        Vacancies are ranked by the pooled distance of their chunks, so each vacancy
+        appears once, see `VacancyEmbeddingQuerySet.nearest_vacancies`.
 
-        vacancy_embeddings = (
-            VacancyEmbedding.objects.filter(tag=tag)
-            .distance(query_vector)
-            .select_related("vacancy", "embedding")
-            .order_by("distance")[:top_n]
+        Filters are part of the search, filtering the top_n afterwards would return too
+        few results:
+
+        - When few rows match (settings.JAO_BACKEND_VECTOR_PREFILTER_MAX_ROWS), they
+          are found with the btree indexes on Vacancy and compared exactly.
+        - Otherwise the ANN index is searched for enough candidates that top_n
+          vacancies are expected to match, sized by the fraction of rows that match.
+
+        Matching rows are only counted up to JAO_BACKEND_VECTOR_PREFILTER_MAX_ROWS + 1,
+        and the rows of the tag once per corpus version, so the counts don't grow with
+        the corpus.  Above the limit the fraction is an upper bound, so at worst more
+        candidates are fetched than needed.
+
+        If the candidates cover fewer than top_n vacancies, more are fetched, scaled by
+        how many were found.
+        """
+        if settings.JAO_BACKEND_SIMILARITY_SEARCH_BACKEND in (NUMPY, SNAPSHOT):
+            return self.similar_vacancies_in_memory(
+                query_vector, tag, top_n, filters=filters
+            )
+
+        all_rows = self.model.objects.using(self.db)
+        candidates = self.filter(tag=tag)
+        matching = candidates
+        # Most vacancies have one or two chunks.
+        fetch = top_n * 2
+        total_count = None
+        if filters is not None:
+            matching = candidates.filter(
+                vacancy__in=Vacancy.objects.search_filter(**filters)
+            )
+            max_rows = settings.JAO_BACKEND_VECTOR_PREFILTER_MAX_ROWS
+            matching_count = matching[: max_rows + 1].count()
+            if matching_count <= max_rows:
+                return matching.nearest_vacancies(query_vector, top_n=top_n, exact=True)
+
+            total_count = get_tag_embedding_count(all_rows, tag)
+            fetch = math.ceil(
+                fetch * max(total_count, matching_count) / matching_count * 1.5
+            )
+
+        ef_search = ef_search or settings.JAO_BACKEND_HNSW_EF_SEARCH
+        quantisation = get_search_quantisation(
+            Embedding.get_subclass_for_embedding_dimensions(len(query_vector)),
+            using=self.db,
+        )
+        while True:
+            # HNSW returns at most ef_search results.
+            fetch = min(fetch, MAX_HNSW_EF_SEARCH)
+            with vector_search_settings(
+                ef_search=max(ef_search, get_rerank_fetch(fetch, quantisation)),
+                probes=probes or settings.JAO_BACKEND_IVFFLAT_PROBES,
+                using=self.db,
+            ):
+                vacancy_embeddings = matching.nearest_vacancies(
+                    query_vector, top_n=top_n, candidates=candidates, fetch=fetch
+                )
+
+            if len(vacancy_embeddings) >= top_n:
+                return vacancy_embeddings
+            if total_count is None:
+                total_count = get_tag_embedding_count(all_rows, tag)
+            # The count may be from before the latest embeddings, so rather than
+            # returning fewer results, the matching rows are compared exactly.
+            if fetch >= total_count or fetch >= MAX_HNSW_EF_SEARCH:
+                break
+            found = max(len(vacancy_embeddings), 1)
+            fetch = max(fetch * 2, math.ceil(fetch * top_n / found))
+
+        # Matches are too far down the index to reach, compare them all.
+        return matching.nearest_vacancies(query_vector, top_n=top_n, exact=True)
+
+    def similar_vacancies_in_memory(
+        self, query_vector, tag: EmbeddingTag, top_n=10, filters=None
+    ):
+        """
+        similar_vacancies, searching an in-process copy of the tag's vectors.
+
+        The index ranks vacancies by their pooled chunk distances, then only the top_n
+        rows are fetched from the database.  With filters, the ids of matching rows are
+        fetched too.
+        """
+        if settings.JAO_BACKEND_SIMILARITY_SEARCH_BACKEND == SNAPSHOT:
+            index_class = SnapshotVectorIndex
+        else:
+            index_class = NumpyVectorIndex
+
+        allowed_ids = None
+        if filters is not None:
+            allowed_ids = list(
+                self.filter(
+                    tag=tag, vacancy__in=Vacancy.objects.search_filter(**filters)
+                ).values_list("pk", flat=True)
+            )
+
+        index = get_numpy_vector_index(
+            self.model, tag, len(query_vector), index_class=index_class
+        )
+        ids, distances = index.search(
+            query_vector,
+            top_n=top_n,
+            allowed_ids=allowed_ids,
+            pooling=settings.JAO_BACKEND_VACANCY_CHUNK_POOLING,
         )
 
-        return vacancy_embeddings
+        vacancy_embeddings = self.select_related("vacancy", "embedding").in_bulk(
+            ids.tolist()
+        )
+        results = []
+        for pk, distance in zip(ids.tolist(), distances.tolist()):
+            # Rows deleted since the index was refreshed are skipped.
+            if pk in vacancy_embeddings:
+                vacancy_embedding = vacancy_embeddings[pk]
+                vacancy_embedding.distance = distance
+                results.append(vacancy_embedding)
+        return results
 
 class VacancyEmbedding(TaggedEmbedding):
     """
@@ -168,6 +432,8 @@ class VacancyEmbedding(TaggedEmbedding):
         settings.EMBEDDING_TAG_JOB_TITLE_RESPONSIBILITIES_ID,
     ]
 
+    chunk_parent_field = "vacancy_id"
+
     deprecated_tags = []
 
     objects = VacancyEmbeddingManager.from_queryset(VacancyEmbeddingQuerySet)()
@@ -187,3 +453,59 @@ class VacancyEmbedding(TaggedEmbedding):
 
     def __str__(self):
         return f"{self.vacancy.title} - {self.tag.name}"
+
+
+class VacancyNeighbours(models.Model):
+    """
+    The nearest vacancies to a vacancy, by cosine distance between their embeddings.
+
+    Computed for every vacancy after each embedding run, see
+    jao_backend.vacancies.neighbours, so "similar to this vacancy" is one row lookup.
+    """
+
+    vacancy = models.ForeignKey(
+        Vacancy,
+        on_delete=models.CASCADE,
+        related_name="neighbours",
+        help_text="The vacancy.",
+    )
+    tag = models.ForeignKey(
+        EmbeddingTag,
+        on_delete=models.CASCADE,
+        help_text="The tag of the embeddings compared.",
+    )
+    neighbour_ids = ArrayField(
+        models.IntegerField(), size=None, help_text="Vacancy ids, nearest first."
+    )
+    distances = ArrayField(
+        models.FloatField(), size=None, help_text="Cosine distance to each neighbour."
+    )
+    updated_at = models.DateTimeField(
+        help_text="Start of the run that computed the neighbours."
+    )
+
+    class Meta:
+        verbose_name_plural = "Vacancy Neighbours"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["vacancy", "tag"], name="unique_vacancy_neighbours_tag"
+            ),
+        ]
+
+    def get_vacancies(self, top_n=None):
+        """
+        :return: list of Vacancy annotated with distance, nearest first.  Vacancies
+                deleted since the neighbours were computed are skipped.
+        """
+        neighbour_ids = self.neighbour_ids[:top_n]
+        vacancies = Vacancy.objects.in_bulk(neighbour_ids)
+        results = []
+        for vacancy_id, distance in zip(neighbour_ids, self.distances):
+            if vacancy_id in vacancies:
+                vacancy = vacancies[vacancy_id]
+                vacancy.distance = distance
+                results.append(vacancy)
+        return results
+
+    def __str__(self):
+        return f"{self.vacancy_id} - {self.tag.name}"
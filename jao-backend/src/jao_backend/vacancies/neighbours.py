@@ -0,0 +1,203 @@
+"""
+Precomputed nearest neighbours of each vacancy, see VacancyNeighbours.
+
+Each vacancy is one vector, the mean of its normalised chunk vectors, normalised again.
+Neighbours are found by brute force, in blocks of rows: one block is a single matrix
+product against all vectors, so memory stays at block_size x number of vacancies.
+
+After the first run only affected vacancies are recomputed:
+
+- Vacancies embedded since their neighbours were computed, or without neighbours.
+- Vacancies whose neighbours include a changed or removed vacancy.
+- Vacancies a changed vacancy is now nearer to than their furthest neighbour.
+"""
+
+import logging
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from jao_backend.embeddings.search import NumpyVectorIndex
+from jao_backend.embeddings.search import normalise
+from jao_backend.embeddings.snapshots import get_tag_dimensions
+from jao_backend.vacancies.models import VacancyEmbedding
+from jao_backend.vacancies.models import VacancyNeighbours
+
+logger = logging.getLogger(__name__)
+
+
+def get_vacancy_vectors(tag, dimensions: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: (vacancy_ids, vectors), one normalised vector per vacancy, in id order.
+    """
+    _, vectors, vacancy_ids = NumpyVectorIndex(VacancyEmbedding, tag, dimensions).load()
+    if not len(vacancy_ids):
+        return vacancy_ids, vectors
+
+    order = np.argsort(vacancy_ids, kind="stable")
+    vacancy_ids = vacancy_ids[order]
+    starts = np.flatnonzero(np.r_[True, vacancy_ids[1:] != vacancy_ids[:-1]])
+    pooled = np.add.reduceat(vectors[order], starts, axis=0)
+    return vacancy_ids[starts], normalise(pooled)
+
+
+def compute_neighbours(
+    vectors: np.ndarray, rows: np.ndarray, k: int, block_size: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :param vectors: Normalised vectors, one per row.
+    :param rows: Rows to find the neighbours of.
+    :return: (indices, distances), of shape (len(rows), k), nearest first.  The row
+            itself is excluded, so k is at most len(vectors) - 1.
+    """
+    k = max(min(k, len(vectors) - 1), 0)
+    indices = np.empty((len(rows), k), dtype=np.int64)
+    distances = np.empty((len(rows), k), dtype=np.float32)
+    if not k:
+        return indices, distances
+
+    for start in range(0, len(rows), block_size):
+        block = rows[start : start + block_size]
+        block_distances = 1.0 - vectors[block] @ vectors.T
+        block_distances[np.arange(len(block)), block] = np.inf
+
+        nearest = np.argpartition(block_distances, k - 1, axis=1)[:, :k]
+        nearest_distances = np.take_along_axis(block_distances, nearest, axis=1)
+        order = np.argsort(nearest_distances, axis=1, kind="stable")
+        indices[start : start + len(block)] = np.take_along_axis(nearest, order, axis=1)
+        distances[start : start + len(block)] = np.take_along_axis(
+            nearest_distances, order, axis=1
+        )
+    return indices, distances
+
+
+def get_affected_rows(
+    vacancy_ids: np.ndarray,
+    vectors: np.ndarray,
+    stored: dict,
+    changed_rows: np.ndarray,
+    removed_ids: set,
+    k: int,
+    block_size: int,
+) -> np.ndarray:
+    """
+    :param stored: vacancy_id: (neighbour_ids, distances) of the current neighbours.
+    :param changed_rows: Rows embedded since their neighbours were computed.
+    :param removed_ids: Vacancies that have neighbours, but no embeddings now.
+    :return: Rows whose neighbours need to be recomputed.
+    """
+    k = min(k, len(vectors) - 1)
+    changed_ids = set(vacancy_ids[changed_rows].tolist()) | removed_ids
+    affected = np.zeros(len(vacancy_ids), dtype=bool)
+    affected[changed_rows] = True
+
+    furthest = np.full(len(vacancy_ids), np.inf, dtype=np.float32)
+    for row, vacancy_id in enumerate(vacancy_ids.tolist()):
+        neighbour_ids, distances = stored.get(vacancy_id, ((), ()))
+        if len(neighbour_ids) < k or changed_ids.intersection(neighbour_ids):
+            affected[row] = True
+        elif distances:
+            furthest[row] = distances[-1]
+
+    if len(changed_rows):
+        changed_vectors = vectors[changed_rows]
+        for start in range(0, len(vectors), block_size):
+            block = slice(start, start + block_size)
+            nearest_changed = (1.0 - vectors[block] @ changed_vectors.T).min(axis=1)
+            affected[block] |= nearest_changed < furthest[block]
+
+    return np.flatnonzero(affected)
+
+
+def update_vacancy_neighbours(
+    tag,
+    k: Optional[int] = None,
+    block_size: Optional[int] = None,
+    force=False,
+) -> int:
+    """
+    Compute the nearest neighbours of vacancies embedded with tag, and save them.
+
+    :param k: Neighbours per vacancy, default settings.JAO_BACKEND_VACANCY_NEIGHBOURS
+    :param block_size: Vacancies per matrix product,
+            default settings.JAO_BACKEND_VACANCY_NEIGHBOURS_BLOCK_SIZE
+    :param force: Recompute every vacancy, not only the affected ones.
+    :return: Number of vacancies whose neighbours were saved.
+    """
+    k = k or settings.JAO_BACKEND_VACANCY_NEIGHBOURS
+    block_size = block_size or settings.JAO_BACKEND_VACANCY_NEIGHBOURS_BLOCK_SIZE
+    # Embeddings created during the run are after this, so they are picked up next time.
+    started_at = timezone.now()
+
+    dimensions = get_tag_dimensions(VacancyEmbedding, tag)
+    if dimensions is None:
+        return 0
+
+    vacancy_ids, vectors = get_vacancy_vectors(tag, dimensions)
+    embedded_at = dict(
+        VacancyEmbedding.objects.filter(tag=tag)
+        .values("vacancy_id")
+        .annotate(embedded_at=Max("embedding__created_at"))
+        .values_list("vacancy_id", "embedded_at")
+    )
+    stored = {}
+    updated_at = {}
+    for vacancy_id, neighbour_ids, distances, neighbours_updated_at in (
+        VacancyNeighbours.objects.filter(tag=tag).values_list(
+            "vacancy_id", "neighbour_ids", "distances", "updated_at"
+        )
+    ):
+        stored[vacancy_id] = (neighbour_ids, distances)
+        updated_at[vacancy_id] = neighbours_updated_at
+
+    removed_ids = set(stored) - set(vacancy_ids.tolist())
+    if removed_ids:
+        VacancyNeighbours.objects.filter(tag=tag, vacancy_id__in=removed_ids).delete()
+
+    if force:
+        rows = np.arange(len(vacancy_ids))
+    else:
+        changed_rows = np.array(
+            [
+                row
+                for row, vacancy_id in enumerate(vacancy_ids.tolist())
+                if vacancy_id not in updated_at
+                or embedded_at[vacancy_id] > updated_at[vacancy_id]
+            ],
+            dtype=np.int64,
+        )
+        rows = get_affected_rows(
+            vacancy_ids, vectors, stored, changed_rows, removed_ids, k, block_size
+        )
+
+    indices, distances = compute_neighbours(vectors, rows, k, block_size)
+    VacancyNeighbours.objects.bulk_create(
+        [
+            VacancyNeighbours(
+                vacancy_id=vacancy_id,
+                tag=tag,
+                neighbour_ids=vacancy_ids[row_indices].tolist(),
+                distances=row_distances.tolist(),
+                updated_at=started_at,
+            )
+            for vacancy_id, row_indices, row_distances in zip(
+                vacancy_ids[rows].tolist(), indices, distances
+            )
+        ],
+        batch_size=block_size,
+        update_conflicts=True,
+        unique_fields=["vacancy", "tag"],
+        update_fields=["neighbour_ids", "distances", "updated_at"],
+    )
+    logger.info(
+        "Updated neighbours of %s/%s vacancies for %s, removed %s",
+        len(rows),
+        len(vacancy_ids),
+        tag.name,
+        len(removed_ids),
+    )
+    return len(rows)
@@ -1,13 +1,24 @@
 from django.db import models
 from django.conf import settings
 from django.db.models import Q
+from django.db.models import Avg
 from django.db.models import Count
+from django.db.models import F
+from django.db.models import Min
 from django.db.models import TextField
 from django.db.models import Value
 from django.db.models.functions import Concat
+from django.utils import timezone
 
+from pgvector.django.functions import CosineDistance
+
+from jao_backend.embeddings.models import Embedding
 from jao_backend.embeddings.models import EmbeddingTag
 from jao_backend.embeddings.querysets import PolymorphicEmbeddingQuerySetMixin
+from jao_backend.embeddings.search import MEAN
+from jao_backend.embeddings.search import MIN
+
+CHUNK_POOLING_AGGREGATES = {MIN: Min, MEAN: Avg}
 
 
 class VacancyQuerySet(PolymorphicEmbeddingQuerySetMixin, models.QuerySet):
@@ -25,6 +36,87 @@ class VacancyQuerySet(PolymorphicEmbeddingQuerySetMixin, models.QuerySet):
             )
         )
 
+    def live(self, at=None):
+        """
+        Vacancies open for applications at a time, default now.
+        """
+        at = at or timezone.now()
+        return self.filter(is_deleted=False, live_date__lte=at, closing_date__gte=at)
+
+    def search_filter(
+        self,
+        live=False,
+        grade_ids=None,
+        role_type_ids=None,
+        live_from=None,
+        live_to=None,
+        min_salary=None,
+        max_salary=None,
+    ):
+        """
+        Filter vacancies for similarity search, deleted vacancies are always excluded.
+
+        :param live: Only vacancies open for applications now.
+        :param grade_ids: Vacancies with any of these Grade ids.
+        :param role_type_ids: Vacancies with any of these RoleType ids.
+        :param live_from: Vacancies that went live on or after this time.
+        :param live_to: Vacancies that went live on or before this time.
+        :param min_salary: Vacancies whose salary range reaches at least min_salary.
+        :param max_salary: Vacancies whose salary range starts at or below max_salary.
+        """
+        qs = self.live() if live else self.filter(is_deleted=False)
+
+        # Subqueries on the through tables, rather than joins, so vacancies with
+        # several matching grades aren't repeated.
+        if grade_ids is not None:
+            qs = qs.filter(
+                pk__in=self.model.grades.through.objects.filter(
+                    grade_id__in=grade_ids
+                ).values("vacancy_id")
+            )
+        if role_type_ids is not None:
+            qs = qs.filter(
+                pk__in=self.model.role_types.through.objects.filter(
+                    role_type_id__in=role_type_ids
+                ).values("vacancy_id")
+            )
+
+        if live_from is not None:
+            qs = qs.filter(live_date__gte=live_from)
+        if live_to is not None:
+            qs = qs.filter(live_date__lte=live_to)
+
+        # Salary ranges overlap the requested band, max_salary is optional on vacancies.
+        if min_salary is not None:
+            qs = qs.filter(
+                Q(max_salary__gte=min_salary)
+                | Q(max_salary__isnull=True, min_salary__gte=min_salary)
+            )
+        if max_salary is not None:
+            qs = qs.filter(min_salary__lte=max_salary)
+        return qs
+
+    def update_derived_text(self, force=False, batch_size=1000) -> int:
+        """
+        Update Vacancy.description_html and embedding_text where the source text changed.
+
+        Ingest does this as vacancies are written, this backfills existing vacancies.
+
+        :return: Number of vacancies updated.
+        """
+        fields = ["description_html", "embedding_text", "source_text_hash"]
+        updated_count = 0
+        batch = []
+        for vacancy in self.order_by("pk").iterator(chunk_size=batch_size):
+            if vacancy.update_derived_text(force=force):
+                batch.append(vacancy)
+            if len(batch) >= batch_size:
+                updated_count += self.model.objects.bulk_update(batch, fields)
+                batch = []
+        if batch:
+            updated_count += self.model.objects.bulk_update(batch, fields)
+        return updated_count
+
     def configured_for_embed(self, limit=None):
         """
         Filter to vacancies that are configured for embedding.
@@ -77,3 +169,60 @@ class VacancyEmbeddingQuerySet(PolymorphicEmbeddingQuerySetMixin, models.QuerySe
     """
     QuerySet for VacancyEmbedding model.
     """
+
+    def nearest_vacancies(
+        self, query_vector, top_n=10, candidates=None, fetch=None, exact=False, pooling=None
+    ):
+        """
+        Up to top_n distinct vacancies nearest to query_vector.
+
+        A vacancy may have several chunks, their distances are pooled in the database:
+
+            SELECT vacancy_id, MIN(embedding <=> query) ... GROUP BY vacancy_id
+            ORDER BY 2 LIMIT top_n
+
+        over the rows of the fetch nearest embeddings (see `nearest`), or every row if
+        exact.  With "mean" pooling every chunk of those vacancies is averaged.
+
+        Fewer than top_n are returned if the fetched embeddings belong to fewer
+        vacancies, callers fetch more and try again.
+
+        :param pooling: "min" or "mean", default settings.JAO_BACKEND_VACANCY_CHUNK_POOLING
+        :return: list of the nearest VacancyEmbedding of each vacancy, annotated with
+                the pooled distance, nearest first.
+        """
+        pooling = pooling or settings.JAO_BACKEND_VACANCY_CHUNK_POOLING
+        subclass = Embedding.get_subclass_for_embedding_dimensions(len(query_vector))
+        distance = CosineDistance(
+            F(f"embedding__{subclass._meta.model_name}__embedding"), query_vector
+        )
+
+        rows = self
+        if not exact:
+            nearest_ids = self.nearest_embedding_ids(
+                query_vector, fetch or top_n, candidates=candidates
+            )
+            rows = self.filter(embedding_id__in=nearest_ids)
+            if pooling != MIN:
+                rows = self.filter(vacancy_id__in=rows.values("vacancy_id"))
+
+        pooled = dict(
+            rows.values("vacancy_id")
+            .annotate(pooled_distance=CHUNK_POOLING_AGGREGATES[pooling](distance))
+            .order_by("pooled_distance", "vacancy_id")
+            .values_list("vacancy_id", "pooled_distance")[:top_n]
+        )
+
+        # DISTINCT ON picks the nearest chunk of each vacancy.
+        vacancy_embeddings = list(
+            self.filter(vacancy_id__in=pooled)
+            .annotate(chunk_distance=distance)
+            .order_by("vacancy_id", "chunk_distance")
+            .distinct("vacancy_id")
+            .select_related("vacancy", "embedding")
+        )
+        for vacancy_embedding in vacancy_embeddings:
+            vacancy_embedding.distance = pooled[vacancy_embedding.vacancy_id]
+        return sorted(
+            vacancy_embeddings, key=lambda ve: (ve.distance, ve.vacancy_id)
+        )
@@ -11,10 +11,17 @@ from litellm.exceptions import RateLimitError
 from litellm.exceptions import ServiceUnavailableError
 from litellm.exceptions import Timeout
 
+from jao_backend.application_statistics.cohorts import update_statistics_baseline
 from jao_backend.common.celery.active_singleton import ActiveSingleton
 from jao_backend.common.db.connections import DatabaseConnectionLostError, on_db_disconnect_raise
+from jao_backend.embeddings.models import EmbeddingTag
+from jao_backend.embeddings.search import SNAPSHOT
+from jao_backend.embeddings.snapshots import write_snapshots
+from jao_backend.vacancies.cache import bump_corpus_version
 from jao_backend.vacancies.embed import embed_vacancy
 from jao_backend.vacancies.models import Vacancy
+from jao_backend.vacancies.models import VacancyEmbedding
+from jao_backend.vacancies import neighbours
 
 
 from jao_backend.common.celery import app as celery
@@ -42,12 +49,14 @@ TASK_KWARGS = {
 
 @celery.task(**TASK_KWARGS)
 @on_db_disconnect_raise(using="oleeo")
-def embed_vacancies(limit=settings.JAO_BACKEND_VACANCY_EMBED_LIMIT):
+def embed_vacancies(limit=settings.JAO_BACKEND_VACANCY_EMBED_LIMIT, bump_version=True):
     """
     Run embedding, on vacancies (limited by the setting `JAO_BACKEND_VACANCY_EMBED_LIMIT`).
 
     This is a singleton task as embedding typically.
 
+    :param bump_version: Bump the corpus version if anything was embedded, False when
+            later steps change the results too and bump it themselves.
     :return: Number of vacancies embedded.
     """
     # Grab the vacancies that are not fully embedded yet, in reverse order so the newest are embedded first.
@@ -79,6 +88,9 @@ def embed_vacancies(limit=settings.JAO_BACKEND_VACANCY_EMBED_LIMIT):
         raise e
     finally:
         logger.info("Embedded %s/%s vacancies", total_embedded, len(vacancies))
+        if total_embedded and bump_version:
+            # Cached similarity responses don't include the new embeddings.
+            bump_corpus_version()
 
     return len(vacancies)
 
@@ -100,6 +112,7 @@ def ingest_vacancies(batch_size=settings.JAO_BACKEND_INGEST_DEFAULT_BATCH_SIZE):
     logger.info(f"Starting Oleeo ingest with max_batch_size={batch_size}")
     ingester = OleeoVacanciesIngest(batch_size=batch_size)
     ingester.do_ingest()
+    bump_corpus_version()
 
 
 @celery.task(**TASK_KWARGS)
@@ -123,11 +136,90 @@ def aggregate_applicant_statistics(
         batch_size=batch_size, initial_vacancy_id=initial_vacancy_id
     )
     ingester.do_ingest()
+    # Precompute the baseline for the new statistics, before requests need it.
+    update_statistics_baseline()
+    bump_corpus_version()
+
+
+@celery.task(**TASK_KWARGS)
+def write_vacancy_embedding_snapshots(force=False):
+    """
+    Export vacancy embeddings to the memory mapped snapshots read by API workers,
+    when JAO_BACKEND_SIMILARITY_SEARCH_BACKEND is "snapshot".
+
+    Tags with unchanged embeddings are skipped, unless force is True.  Nothing is
+    written with other backends, nothing would read it.
+    """
+    if settings.JAO_BACKEND_SIMILARITY_SEARCH_BACKEND != SNAPSHOT:
+        logger.info(
+            "Not writing vacancy embedding snapshots, the similarity search backend is %s",
+            settings.JAO_BACKEND_SIMILARITY_SEARCH_BACKEND,
+        )
+        return
+
+    written = write_snapshots(VacancyEmbedding, force=force)
+    written_count = sum(metadata is not None for metadata in written.values())
+    logger.info("Wrote %s/%s vacancy embedding snapshots", written_count, len(written))
+    if written_count:
+        # Responses cached before the snapshot was written don't include its embeddings.
+        bump_corpus_version()
+
+
+@celery.task(**TASK_KWARGS)
+def update_vacancy_neighbours(force=False):
+    """
+    Precompute the nearest neighbours of each vacancy, for each configured tag.
+
+    Only vacancies affected by embeddings since the last run are updated, unless
+    force is True.
+
+    :return: Number of vacancies updated.
+    """
+    updated_count = 0
+    for tag in EmbeddingTag.get_configured_tags().values():
+        updated_count += neighbours.update_vacancy_neighbours(tag, force=force)
+    logger.info("Updated neighbours of %s vacancies", updated_count)
+    return updated_count
+
+
+@celery.task(**TASK_KWARGS)
+def update_vacancy_derived_text(force=False):
+    """
+    Backfill the HTML description and embedding text of vacancies, ingest keeps them
+    up to date after that.
+
+    :param force: Update vacancies even if their text hasn't changed.
+    :return: Number of vacancies updated.
+    """
+    updated_count = Vacancy.objects.update_derived_text(force=force)
+    logger.info("Updated derived text for %s vacancies", updated_count)
+    if updated_count:
+        bump_corpus_version()
+    return updated_count
+
+
+@celery.task(**TASK_KWARGS)
+def bump_vacancy_corpus_version():
+    """
+    Invalidate cached similarity responses, the last step of `update_vacancies`.
+
+    :return: The new corpus version.
+    """
+    return bump_corpus_version()
 
 
 update_vacancies = chain(
-    ingest_vacancies.s(), aggregate_applicant_statistics.s(), embed_vacancies.s()
+    ingest_vacancies.s(),
+    aggregate_applicant_statistics.s(),
+    embed_vacancies.s(bump_version=False),
+    update_vacancy_neighbours.si(),
+    write_vacancy_embedding_snapshots.si(),
+    bump_vacancy_corpus_version.si(),
 )
 """
-Ingest vacancies, and then start embedding.
+Ingest vacancies, start embedding, then update vacancy neighbours and the embedding
+snapshots.
+
+The corpus version is bumped again once everything is written, otherwise responses
+cached between embedding and the snapshot write would be kept under the new version.
 """
@@ -0,0 +1,59 @@
+from jao_backend.vacancies.cache import bump_corpus_version
+from jao_backend.vacancies.cache import corpus_version
+from jao_backend.vacancies.cache import get_similar_vacancies_cache_key
+from jao_backend.vacancies import tasks
+from jao_backend.vacancies.tasks import bump_vacancy_corpus_version
+from jao_backend.vacancies.tasks import update_vacancies
+
+
+def test_similar_vacancies_cache_key():
+    """
+    Keys ignore whitespace changes, but not other options, and change with the corpus.
+    """
+    key = get_similar_vacancies_cache_key("Data  scientist\n", 10, {"live": True})
+    assert key == get_similar_vacancies_cache_key("Data scientist", 10, {"live": True})
+    assert key != get_similar_vacancies_cache_key("Data scientist", 10, None)
+    assert key != get_similar_vacancies_cache_key("Data scientist", 5, {"live": True})
+
+    bump_corpus_version()
+    assert key != get_similar_vacancies_cache_key("Data scientist", 10, {"live": True})
+    corpus_version.cache.delete(corpus_version.key)
+
+
+def test_update_vacancies_bumps_corpus_version_last():
+    """
+    Responses cached while the chain runs aren't kept under the final version.
+    """
+    assert update_vacancies.tasks[-1].task == bump_vacancy_corpus_version.name
+    assert update_vacancies.tasks[2].kwargs == {"bump_version": False}
+
+
+def test_write_snapshots_bumps_corpus_version(monkeypatch, settings):
+    written = {}
+    monkeypatch.setattr(tasks, "write_snapshots", lambda model, force: written)
+    settings.JAO_BACKEND_SIMILARITY_SEARCH_BACKEND = "snapshot"
+    version = corpus_version.get()
+
+    tasks.write_vacancy_embedding_snapshots()
+    assert corpus_version.get() == version
+
+    written["tag"] = {"version": 1}
+    tasks.write_vacancy_embedding_snapshots()
+    assert corpus_version.get() != version
+    corpus_version.cache.delete(corpus_version.key)
+
+
+def test_write_snapshots_only_for_snapshot_backend(monkeypatch, settings):
+    """
+    Other backends don't read snapshots, so they aren't written or invalidate responses.
+    """
+    written = []
+    monkeypatch.setattr(
+        tasks, "write_snapshots", lambda model, force: written.append(model) or {}
+    )
+    settings.JAO_BACKEND_SIMILARITY_SEARCH_BACKEND = "pgvector"
+    version = corpus_version.get()
+
+    tasks.write_vacancy_embedding_snapshots()
+    assert written == []
+    assert corpus_version.get() == version
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from jao_backend.embeddings.models import EmbeddingTag
+from jao_backend.embeddings.models import EmbeddingTiny
+from jao_backend.embeddings.search import normalise
+from jao_backend.vacancies.models import VacancyEmbedding
+from jao_backend.vacancies.models import VacancyNeighbours
+from jao_backend.vacancies.neighbours import compute_neighbours
+from jao_backend.vacancies.neighbours import update_vacancy_neighbours
+
+from .factories import VacancyFactory
+
+
+def axis_vector(*weights):
+    """
+    Vector with weights in its first dimensions, the rest zero.
+    """
+    vector = np.zeros(EmbeddingTiny.dimensions)
+    vector[: len(weights)] = weights
+    return vector
+
+
+@pytest.fixture
+def tag():
+    EmbeddingTag.get_configured_tags.cache_clear()
+    EmbeddingTag.get_configured_tags()
+    return EmbeddingTag.objects.order_by("-version").get(
+        name="job-title-responsibilities"
+    )
+
+
+def embed(tag, *chunks):
+    vacancy = VacancyFactory.create()
+    VacancyEmbedding.save_embeddings(tag=tag, chunks=list(chunks), vacancy=vacancy)
+    return vacancy
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 100])
+def test_compute_neighbours_matches_exact_search(block_size):
+    rng = np.random.default_rng(0)
+    vectors = normalise(rng.normal(size=(10, 8)))
+    rows = np.arange(10)
+
+    indices, distances = compute_neighbours(vectors, rows, k=3, block_size=block_size)
+
+    all_distances = 1.0 - vectors @ vectors.T
+    np.fill_diagonal(all_distances, np.inf)
+    expected = np.argsort(all_distances, axis=1)[:, :3]
+    np.testing.assert_array_equal(indices, expected)
+    np.testing.assert_allclose(
+        distances, np.take_along_axis(all_distances, expected, axis=1), atol=1e-6
+    )
+
+
+@pytest.mark.django_db
+def test_update_vacancy_neighbours(tag):
+    north = embed(tag, axis_vector(1, 0))
+    north_east = embed(tag, axis_vector(1, 0.2))
+    east = embed(tag, axis_vector(0, 1))
+
+    assert update_vacancy_neighbours(tag, k=2) == 3
+
+    neighbours = north.get_neighbours(tag)
+    assert [vacancy.id for vacancy in neighbours] == [north_east.id, east.id]
+    assert neighbours[0].distance < neighbours[1].distance
+    assert north.get_neighbours(tag, top_n=1) == [north_east]
+
+
+@pytest.mark.django_db
+def test_update_vacancy_neighbours_only_updates_affected(tag):
+    north = embed(tag, axis_vector(1, 0))
+    east = embed(tag, axis_vector(0, 1))
+    west = embed(tag, axis_vector(0, -1))
+    south_east = embed(tag, axis_vector(-1, 1))
+    update_vacancy_neighbours(tag, k=1)
+    assert update_vacancy_neighbours(tag, k=1) == 0
+
+    # Nearer to north than east is, east and west are not affected.
+    north_north_east = embed(tag, axis_vector(1, 0.1), axis_vector(1, 0.1))
+
+    assert update_vacancy_neighbours(tag, k=1) == 2
+    assert north.get_neighbours(tag) == [north_north_east]
+    assert north_north_east.get_neighbours(tag) == [north]
+    assert east.get_neighbours(tag) == [south_east]
+
+    # The same neighbours as computing everything again.
+    incremental = dict(
+        VacancyNeighbours.objects.values_list("vacancy_id", "neighbour_ids")
+    )
+    update_vacancy_neighbours(tag, k=1, force=True)
+    assert incremental == dict(
+        VacancyNeighbours.objects.values_list("vacancy_id", "neighbour_ids")
+    )
+
+    # Removing a vacancy's embeddings updates the vacancies it was a neighbour of.
+    VacancyEmbedding.objects.filter(vacancy=north_north_east).delete()
+    update_vacancy_neighbours(tag, k=1)
+    assert not north_north_east.neighbours.exists()
+    assert north.get_neighbours(tag) != [north_north_east]
@@ -0,0 +1,41 @@
+import pytest
+
+from jao_backend.common.text_processing.clean_oleeo import strip_oleeo_bbcode
+from jao_backend.vacancies.models import Vacancy
+
+from .factories import VacancyFactory
+
+
+@pytest.mark.django_db
+def test_vacancy_update_derived_text():
+    """
+    The HTML description and embedding text are only derived again when the source
+    text changes.
+    """
+    vacancy = VacancyFactory.build(
+        title="Analyst",
+        person_spec="Curious",
+        description="[p]Duties:[/p][list=ul][li]Analyse data[/li][/list]",
+    )
+
+    assert vacancy.update_derived_text() is True
+    assert vacancy.description_html == (
+        "<p>Duties:</p><ul><li>Analyse data</li></ul>"
+    )
+    assert vacancy.embedding_text == strip_oleeo_bbcode(
+        f"Analyst\nCurious\n{vacancy.description}"
+    )
+    assert vacancy.update_derived_text() is False
+
+    vacancy.description = "Updated"
+    assert vacancy.update_derived_text() is True
+    assert vacancy.description_html == "Updated"
+
+
+@pytest.mark.django_db
+def test_vacancy_queryset_update_derived_text():
+    VacancyFactory.create_batch(3)
+
+    assert Vacancy.objects.update_derived_text(batch_size=2) == 3
+    assert not Vacancy.objects.filter(embedding_text__isnull=True).exists()
+    assert Vacancy.objects.update_derived_text() == 0
@@ -1,9 +1,20 @@
+import asyncio
+
 import numpy as np
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from jao_backend.embeddings.models import EmbeddingTag
 from jao_backend.embeddings.models import EmbeddingTiny
+from jao_backend.embeddings.search import clear_numpy_vector_indexes
+from jao_backend.embeddings.search import normalise
+from jao_backend.roles.models import Grade
+from jao_backend.vacancies.cache import bump_corpus_version
+from jao_backend.vacancies.cache import embedding_counts_cache
 from jao_backend.vacancies.models import VacancyEmbedding
+from jao_backend.vacancies.models import VacancyGrade
 
 from .factories import VacancyFactory
 
@@ -34,3 +45,207 @@ def test_vacancy_embedding_save_embeddings():
         0 < len(saved_embeddings) == len(fake_embeddings)
     ), "Failed to save embeddings"
     assert list(vacancy.vacancyembedding_set.all()) == saved_embeddings
+    # Saved L2 normalised.
+    saved_vector = saved_embeddings[0].embedding.embedding
+    assert np.linalg.norm(saved_vector) == pytest.approx(1.0, rel=1e-5)
+
+
+@pytest.mark.django_db
+def test_vacancy_embedding_nearest():
+    """
+    nearest should return the closest vacancy embeddings for the tag, ordered by
+    distance, querying the embedding subclass table directly.
+    """
+    EmbeddingTag.get_configured_tags.cache_clear()
+    EmbeddingTag.get_configured_tags()
+
+    tag = EmbeddingTag.objects.order_by("-version").get(
+        name="job-title-responsibilities"
+    )
+    query_vector = np.random.rand(EmbeddingTiny.dimensions)
+    vacancies = VacancyFactory.create_batch(3)
+    for vacancy, scale in zip(vacancies, [0.5, 0.0, 2.0]):
+        # Mix in noise, so distance from the query increases with scale.
+        vector = query_vector + scale * np.random.rand(EmbeddingTiny.dimensions)
+        VacancyEmbedding.save_embeddings(tag=tag, chunks=[vector], vacancy=vacancy)
+
+    with CaptureQueriesContext(connection) as context:
+        nearest = list(
+            VacancyEmbedding.objects.filter(tag=tag).nearest(query_vector, top_n=2)
+        )
+
+    assert [ve.vacancy_id for ve in nearest] == [vacancies[1].pk, vacancies[0].pk]
+    assert nearest[0].distance <= nearest[1].distance
+    assert not any("CASE" in query["sql"] for query in context.captured_queries)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_vacancy_embedding_asimilar_vacancies(monkeypatch):
+    """
+    The async search should match the sync one, the database query runs in the
+    database thread pool (so the test data must be committed).
+    """
+    EmbeddingTag.get_configured_tags.cache_clear()
+    EmbeddingTag.get_configured_tags()
+
+    tag = EmbeddingTag.objects.order_by("-version").get(
+        name="job-title-responsibilities"
+    )
+    query_vector = np.random.rand(EmbeddingTiny.dimensions).astype(np.float32)
+    for vacancy in VacancyFactory.create_batch(3):
+        VacancyEmbedding.save_embeddings(
+            tag=tag,
+            chunks=[np.random.rand(EmbeddingTiny.dimensions)],
+            vacancy=vacancy,
+        )
+
+    async def aembed_query(text):
+        return query_vector
+
+    monkeypatch.setattr(tag, "aembed_query", aembed_query)
+    monkeypatch.setattr(tag, "embed_query", lambda text: query_vector)
+
+    results = asyncio.run(
+        VacancyEmbedding.objects.asimilar_vacancies("Data scientist", tag, top_n=2)
+    )
+    expected = VacancyEmbedding.objects.similar_vacancies("Data scientist", tag, top_n=2)
+
+    assert [ve.pk for ve in results] == [ve.pk for ve in expected]
+    assert results[0].vacancy.title == expected[0].vacancy.title
+    EmbeddingTag.get_configured_tags.cache_clear()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "backend,prefilter_max_rows",
+    [("pgvector", 10_000), ("pgvector", 0), ("numpy", 10_000)],
+)
+def test_vacancy_embedding_similar_vacancies_filtered(
+    settings, backend, prefilter_max_rows
+):
+    """
+    Filters are applied inside the search, so top_n matching vacancies are returned
+    even when nearer vacancies don't match, whether the matching rows are compared
+    exactly or found by over fetching from the index.
+    """
+    settings.JAO_BACKEND_SIMILARITY_SEARCH_BACKEND = backend
+    settings.JAO_BACKEND_VECTOR_PREFILTER_MAX_ROWS = prefilter_max_rows
+    EmbeddingTag.get_configured_tags.cache_clear()
+    EmbeddingTag.get_configured_tags()
+    clear_numpy_vector_indexes()
+
+    tag = EmbeddingTag.objects.order_by("-version").get(
+        name="job-title-responsibilities"
+    )
+    grade = Grade.objects.create(
+        description="Senior Executive Officer",
+        shorthand_name="SEO",
+        last_updated=timezone.now(),
+    )
+    query_vector = np.random.rand(EmbeddingTiny.dimensions)
+    vectors = {}
+    for i, vacancy in enumerate(VacancyFactory.create_batch(6)):
+        # Odd vacancies have the grade, even ones are nearer the query.
+        vector = query_vector + (i + 1) * np.random.rand(EmbeddingTiny.dimensions)
+        VacancyEmbedding.save_embeddings(tag=tag, chunks=[vector], vacancy=vacancy)
+        if i % 2:
+            VacancyGrade.objects.create(vacancy=vacancy, grade=grade)
+            vectors[vacancy.pk] = vector
+
+    results = VacancyEmbedding.objects.similar_vacancies_for_vector(
+        query_vector, tag, top_n=2, filters={"grade_ids": [grade.pk]}
+    )
+
+    distances = {
+        pk: 1.0 - normalise(vector) @ normalise(query_vector)
+        for pk, vector in vectors.items()
+    }
+    assert [ve.vacancy_id for ve in results] == sorted(distances, key=distances.get)[:2]
+
+    clear_numpy_vector_indexes()
+    EmbeddingTag.get_configured_tags.cache_clear()
+
+
+@pytest.mark.django_db
+def test_vacancy_embedding_similar_vacancies_filtered_counts(settings):
+    """
+    Filtered searches only count the matching rows up to the prefilter limit, the rows
+    of the tag are counted once per corpus version.
+    """
+    settings.JAO_BACKEND_SIMILARITY_SEARCH_BACKEND = "pgvector"
+    settings.JAO_BACKEND_VECTOR_PREFILTER_MAX_ROWS = 1
+    EmbeddingTag.get_configured_tags.cache_clear()
+    EmbeddingTag.get_configured_tags()
+    embedding_counts_cache.local.clear()
+    bump_corpus_version()
+
+    tag = EmbeddingTag.objects.order_by("-version").get(
+        name="job-title-responsibilities"
+    )
+    for vacancy in VacancyFactory.create_batch(4):
+        VacancyEmbedding.save_embeddings(
+            tag=tag, chunks=[np.random.rand(EmbeddingTiny.dimensions)], vacancy=vacancy
+        )
+    query_vector = np.random.rand(EmbeddingTiny.dimensions)
+
+    def count_queries():
+        with CaptureQueriesContext(connection) as context:
+            VacancyEmbedding.objects.similar_vacancies_for_vector(
+                query_vector, tag, top_n=2, filters={"live": False}
+            )
+        return [
+            query["sql"] for query in context.captured_queries if "COUNT(" in query["sql"]
+        ]
+
+    first = count_queries()
+    assert len(first) == 2
+    assert any("LIMIT 2" in sql for sql in first)
+    assert count_queries() == [sql for sql in first if "LIMIT 2" in sql]
+
+    embedding_counts_cache.local.clear()
+    EmbeddingTag.get_configured_tags.cache_clear()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("backend", ["pgvector", "numpy"])
+@pytest.mark.parametrize("pooling", ["min", "mean"])
+def test_vacancy_embedding_similar_vacancies_distinct(settings, backend, pooling):
+    """
+    A vacancy with several chunks near the query should only take one result, the
+    remaining results are filled by other vacancies.
+    """
+    settings.JAO_BACKEND_SIMILARITY_SEARCH_BACKEND = backend
+    settings.JAO_BACKEND_VACANCY_CHUNK_POOLING = pooling
+    EmbeddingTag.get_configured_tags.cache_clear()
+    EmbeddingTag.get_configured_tags()
+    clear_numpy_vector_indexes()
+
+    tag = EmbeddingTag.objects.order_by("-version").get(
+        name="job-title-responsibilities"
+    )
+    query_vector = np.random.rand(EmbeddingTiny.dimensions)
+    long_vacancy, *vacancies = VacancyFactory.create_batch(4)
+    VacancyEmbedding.save_embeddings(
+        tag=tag,
+        chunks=[query_vector + 0.01 * i for i in range(5)],
+        vacancy=long_vacancy,
+    )
+    for i, vacancy in enumerate(vacancies):
+        vector = query_vector + (i + 1) * np.random.rand(EmbeddingTiny.dimensions)
+        VacancyEmbedding.save_embeddings(tag=tag, chunks=[vector], vacancy=vacancy)
+
+    results = VacancyEmbedding.objects.similar_vacancies_for_vector(
+        query_vector, tag, top_n=3
+    )
+
+    assert [ve.vacancy_id for ve in results] == [
+        long_vacancy.pk,
+        vacancies[0].pk,
+        vacancies[1].pk,
+    ]
+    # The nearest chunk represents the vacancy.
+    assert results[0].chunk_index == 0
+    assert [ve.distance for ve in results] == sorted(ve.distance for ve in results)
+
+    clear_numpy_vector_indexes()
+    EmbeddingTag.get_configured_tags.cache_clear()
@@ -13,4 +13,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "jao_web.settings.dev")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up.
+from jao_web.common.lifespan import with_lifespan  # noqa: E402
+from jao_web.job_advert_optimiser.services.client import (  # noqa: E402
+    close_shared_async_clients,
+)
+
+application = with_lifespan(
+    django_application, on_shutdown=[close_shared_async_clients]
+)
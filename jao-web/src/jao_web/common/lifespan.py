@@ -0,0 +1,39 @@
+"""
+ASGI lifespan events for the Django application.
+
+Django's ASGI handler only accepts HTTP, this answers lifespan events from the server
+(e.g. hypercorn), so resources shared between requests are released on shutdown.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def with_lifespan(application, on_shutdown=()):
+    """
+    :param application: ASGI application to pass other connections to.
+    :param on_shutdown: Async functions to call when the server shuts down.
+    :return: ASGI application.
+
+    >>> application = with_lifespan(get_asgi_application(), [close_clients])
+    """
+
+    async def lifespan_application(scope, receive, send):
+        if scope["type"] != "lifespan":
+            return await application(scope, receive, send)
+
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for callback in on_shutdown:
+                    try:
+                        await callback()
+                    except Exception:
+                        logger.exception("Error in shutdown callback %s", callback)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    return lifespan_application
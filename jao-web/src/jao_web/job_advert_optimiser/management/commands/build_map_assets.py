@@ -0,0 +1,68 @@
+import gzip
+import json
+from pathlib import Path
+
+from django.core.management import BaseCommand
+
+from jao_web.job_advert_optimiser.maps import MAP_RESOLUTIONS
+from jao_web.job_advert_optimiser.maps import REGIONS_NAME
+from jao_web.job_advert_optimiser.maps import get_regions_geojson_path
+from jao_web.job_advert_optimiser.maps import get_regions_topology_path
+from jao_web.job_advert_optimiser.topology import to_topology
+
+STATIC_DIR = Path(__file__).resolve().parents[2] / "static"
+
+
+def is_brotli_available():
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class Command(BaseCommand):
+    help = (
+        "Build simplified TopoJSON of the applicant map regions at each map "
+        "resolution, with gzip and brotli compressed copies."
+    )
+
+    def write(self, path: Path, content: bytes):
+        path.write_bytes(content)
+        self.stdout.write(f"{path.name}: {len(content)} bytes")
+
+    def handle(self, *args, **options):
+        """
+        Compressed copies are written next to each file (.gz, .br), for servers that
+        send precompressed static files.  Brotli copies need the brotli package.
+        """
+        brotli_available = is_brotli_available()
+        if not brotli_available:
+            self.stderr.write("brotli is not installed, only writing gzip copies.")
+
+        source = STATIC_DIR / get_regions_geojson_path()
+        feature_collection = json.loads(source.read_text())
+
+        for resolution in MAP_RESOLUTIONS:
+            topology = to_topology(
+                feature_collection,
+                tolerance=resolution.tolerance,
+                quantisation=resolution.quantisation,
+                object_name=REGIONS_NAME,
+            )
+            content = json.dumps(topology, separators=(",", ":")).encode("utf-8")
+
+            path = STATIC_DIR / get_regions_topology_path(resolution)
+            self.write(path, content)
+            # mtime=0, so unchanged files compress to the same bytes.
+            self.write(
+                path.with_name(path.name + ".gz"),
+                gzip.compress(content, compresslevel=9, mtime=0),
+            )
+            if brotli_available:
+                import brotli
+
+                self.write(
+                    path.with_name(path.name + ".br"),
+                    brotli.compress(content, quality=11),
+                )
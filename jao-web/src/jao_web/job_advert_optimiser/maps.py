@@ -0,0 +1,38 @@
+"""
+Region boundaries for the applicant map.
+
+The full resolution GeoJSON is simplified to TopoJSON at each of MAP_RESOLUTIONS by
+`manage.py build_map_assets`, the map loads the lowest resolution detailed enough for
+its zoom level, see map_geodata.js.
+"""
+
+from typing import NamedTuple
+from typing import Optional
+
+GEODATA_STATIC_DIR = "job_advert_optimiser/geojson"
+REGIONS_NAME = "rgn2023"
+
+
+class MapResolution(NamedTuple):
+    name: str
+    tolerance: float
+    """Simplification tolerance in degrees, about a pixel at max_zoom."""
+    quantisation: int
+    max_zoom: Optional[float]
+    """Highest zoom level the resolution is used at, None for any."""
+
+
+MAP_RESOLUTIONS = [
+    MapResolution("low", tolerance=0.01, quantisation=10_000, max_zoom=7),
+    MapResolution("medium", tolerance=0.002, quantisation=100_000, max_zoom=9),
+    MapResolution("high", tolerance=0.0005, quantisation=100_000, max_zoom=None),
+]
+"""From lowest to highest resolution."""
+
+
+def get_regions_geojson_path() -> str:
+    return f"{GEODATA_STATIC_DIR}/{REGIONS_NAME}.geojson"
+
+
+def get_regions_topology_path(resolution: MapResolution) -> str:
+    return f"{GEODATA_STATIC_DIR}/{REGIONS_NAME}.{resolution.name}.topo.json"
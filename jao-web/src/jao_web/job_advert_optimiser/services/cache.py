@@ -0,0 +1,182 @@
+"""
+In-process cache of backend responses, keyed by job description.
+
+Users resubmit the same advert many times while editing it, the analysis of a
+description is served from here instead of asking the backend again.
+
+Entries are fresh for `fresh_for` seconds, then stale for `stale_for` seconds more:
+a stale entry is still served, and refreshed in the background so the next request
+gets the new one.  The least recently used entries are evicted above maxsize.
+
+Concurrent requests for a missing entry share one fetch, including fetches the caller
+makes itself, e.g. streaming the sections of an analysis, see `fetching`.
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def get_description_key(description: str) -> str:
+    """
+    :return: Hash of the description, ignoring differences in whitespace.
+    """
+    normalised = " ".join(description.split())
+    return hashlib.sha256(normalised.encode("utf-8")).hexdigest()
+
+
+class StaleWhileRevalidateCache:
+    """
+    LRU cache of async results, stale entries are served while they are refreshed.
+
+    Refreshes and fetches of the same key share one task, on the running event loop.
+
+    >>> cache = StaleWhileRevalidateCache(maxsize=256, fresh_for=300, stale_for=3600)
+    ... analysis = await cache.get_or_fetch(key, lambda: get_analysis(client, text))
+    """
+
+    def __init__(self, maxsize=256, fresh_for=300, stale_for=3600):
+        self.maxsize = maxsize
+        self.fresh_for = fresh_for
+        self.stale_for = stale_for
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._tasks = {}
+
+    def get(
+        self, key: str, refresh: Optional[Callable[[], Awaitable[Any]]] = None
+    ) -> Optional[Any]:
+        """
+        :param refresh: Called to fetch a new value, in the background, if the entry
+                        is stale.
+        :return: Value, fresh or stale, or None if there isn't one.
+        """
+        now = time.monotonic()
+        with self._lock:
+            try:
+                value, stored_at = self._data[key]
+            except KeyError:
+                return None
+
+            age = now - stored_at
+            if age > self.fresh_for + self.stale_for:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+
+        if age > self.fresh_for and refresh is not None:
+            self.start_fetch(key, refresh)
+        return value
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_fetch(self, key: str) -> Optional[asyncio.Future]:
+        """
+        :return: The running fetch of key on this event loop, or None.
+        """
+        task = self._tasks.get(key)
+        if (
+            task is not None
+            and not task.done()
+            and task.get_loop() is asyncio.get_running_loop()
+        ):
+            return task
+        return None
+
+    @contextmanager
+    def fetching(self, key: str):
+        """
+        Register a fetch of key that the caller makes itself, so `get_fetch` and
+        `get_or_fetch` wait for it rather than fetching again.
+
+        Waiters get the value stored with `set` inside the block, or None if it wasn't.
+
+        >>> with cache.fetching(key):
+        ...     async for part in fetch_parts():
+        ...         ...
+        ...     cache.set(key, value)
+        """
+        started_at = time.monotonic()
+        future = self._tasks[key] = asyncio.get_running_loop().create_future()
+        try:
+            yield future
+        finally:
+            if self._tasks.get(key) is future:
+                del self._tasks[key]
+            with self._lock:
+                value, stored_at = self._data.get(key, (None, None))
+            if not future.done():
+                future.set_result(
+                    value if stored_at and stored_at >= started_at else None
+                )
+
+    def start_fetch(
+        self, key: str, fetch: Callable[[], Awaitable[Any]]
+    ) -> asyncio.Future:
+        """
+        Fetch a value for key and store it, unless a fetch of key is already running.
+
+        Errors are logged, and leave the current entry in place.
+
+        :return: Task of the fetch, or the future of one registered with `fetching`.
+        """
+        loop = asyncio.get_running_loop()
+        task = self.get_fetch(key)
+        if task is not None:
+            return task
+
+        async def fetch_and_set():
+            value = await fetch()
+            self.set(key, value)
+            return value
+
+        def discard(task):
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+            if not task.cancelled() and task.exception() is not None:
+                logger.warning("Could not fetch %s: %s", key, task.exception())
+
+        task = self._tasks[key] = loop.create_task(fetch_and_set())
+        task.add_done_callback(discard)
+        return task
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]]):
+        """
+        :return: Cached value, or the result of fetch if there isn't one.
+        :raise: Exceptions from fetch, if there is no value.
+        """
+        value = self.get(key, refresh=fetch)
+        if value is not None:
+            return value
+        # Shielded, so a request that goes away doesn't cancel the fetch for others.
+        value = None
+        while value is None:
+            # None if a fetch registered with `fetching` ended without a value.
+            value = await asyncio.shield(self.start_fetch(key, fetch))
+        return value
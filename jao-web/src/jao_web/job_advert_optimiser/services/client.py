@@ -1,24 +1,109 @@
+"""
+HTTP clients for the JAO backend.
+
+Views share one AsyncClient per event loop (`get_shared_async_client`), so connections to
+the backend are kept alive between page views instead of being set up for each one.
+The session's X-Session-Id header is sent with each request, see `get_session_headers`.
+
+httpx clients can only be used on the event loop they were created on, with a server
+there is one loop per process, so one client.  Clients are closed on ASGI lifespan
+shutdown, see `close_shared_async_clients`.
+"""
+
+import asyncio
+import logging
+import weakref
 from urllib.parse import urljoin
 
 import httpx
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
 
-def get_async_client(session_key):
+_shared_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def is_http2_available():
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_async_client(**kwargs) -> httpx.AsyncClient:
     """
     AsyncClient for accessing JAO backend, configured from Django.
 
-    Session key must be provided to so that backend sessions match Django sessions.
+    :settings.JAO_BACKEND_ENABLE_HTTP2: Enable HTTP/2 for the client, if h2 is installed.
+    :settings.JAO_BACKEND_MAX_CONNECTIONS: Maximum connections to the backend.
+    :settings.JAO_BACKEND_MAX_KEEPALIVE_CONNECTIONS: Idle connections kept open.
+    :settings.JAO_BACKEND_KEEPALIVE_EXPIRY: Seconds before idle connections are closed.
+    """
+    http2 = settings.JAO_BACKEND_ENABLE_HTTP2
+    if http2 and not is_http2_available():
+        logger.warning("JAO_BACKEND_ENABLE_HTTP2 is set, but h2 is not installed")
+        http2 = False
 
-    :param session_key: Session key to use for the client.
-    :settings.JAO_BACKEND_ENABLE_HTTP2: Enable HTTP/2 for the client.
+    return httpx.AsyncClient(
+        http2=http2,
+        base_url=urljoin(settings.JAO_BACKEND_URL, "api/v0"),
+        limits=httpx.Limits(
+            max_connections=settings.JAO_BACKEND_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.JAO_BACKEND_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.JAO_BACKEND_KEEPALIVE_EXPIRY,
+        ),
+        **kwargs,
+    )
+
+
+def get_session_headers(session_key):
+    """
+    Headers for a request on behalf of a session.
+
+    Session key must be provided to so that backend sessions match Django sessions.
     """
     if not session_key:
         raise ValueError("Session key must not be empty.")
+    return {"X-Session-Id": session_key}
 
-    base_url = urljoin(settings.JAO_BACKEND_URL, "api/v0")
-    return httpx.AsyncClient(
-        http2=settings.JAO_BACKEND_ENABLE_HTTP2,
-        base_url=base_url,
-        headers={"X-Session-Id": session_key},
-    )
+
+def get_async_client(session_key):
+    """
+    AsyncClient for accessing JAO backend, for a single session.
+
+    Views should use `get_shared_async_client` and `get_session_headers` instead.
+
+    :param session_key: Session key to use for the client.
+    """
+    return create_async_client(headers=get_session_headers(session_key))
+
+
+def get_shared_async_client() -> httpx.AsyncClient:
+    """
+    AsyncClient for accessing JAO backend, shared by everything on the running event loop.
+
+    Don't close it, or use it as a context manager.
+    """
+    loop = asyncio.get_running_loop()
+    client = _shared_clients.get(loop)
+    if client is None or client.is_closed:
+        client = _shared_clients[loop] = create_async_client()
+    return client
+
+
+async def close_shared_async_clients():
+    """
+    Close the shared client of the running event loop, call on shutdown.
+
+    Clients of other loops, that have since closed, are discarded.
+    """
+    loop = asyncio.get_running_loop()
+    for client_loop, client in list(_shared_clients.items()):
+        if client_loop is loop:
+            await client.aclose()
+        elif not client_loop.is_closed():
+            continue
+        _shared_clients.pop(client_loop, None)
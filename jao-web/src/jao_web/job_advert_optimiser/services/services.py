@@ -1,16 +1,23 @@
 """
 Access the JAO backend services.
+
+:param headers: Each function takes headers for the request, e.g. `get_session_headers`.
 """
 
 import logging
+from typing import Optional
 
 import httpx
 from django.conf import settings
 
 from jao_backend_schemas.advice import AdviceResponse
+from jao_backend_schemas.analysis import AnalysisResponse
+from jao_backend_schemas.analysis import AnalysisSection
 from jao_backend_schemas.maps import AreaFrequenciesResponse
 from jao_backend_schemas.plots import PlotlyFiguresResponse
 from jao_backend_schemas.vacancies import JobDescriptionRequest, SimilarVacanciesResponse
+from jao_web.job_advert_optimiser.services.cache import StaleWhileRevalidateCache
+from jao_web.job_advert_optimiser.services.cache import get_description_key
 from jao_web.job_advert_optimiser.services.problem_details import raise_exception_on_problem
 
 logger = logging.getLogger(__name__)
@@ -18,64 +25,157 @@ logger = logging.getLogger(__name__)
 JAO_BACKEND_URL = settings.JAO_BACKEND_URL
 JAO_SERVICE_TIMEOUT = settings.JAO_BACKEND_TIMEOUT
 
+analysis_cache = StaleWhileRevalidateCache(
+    maxsize=settings.JAO_WEB_ANALYSIS_CACHE_SIZE,
+    fresh_for=settings.JAO_WEB_ANALYSIS_CACHE_FRESH,
+    stale_for=settings.JAO_WEB_ANALYSIS_CACHE_STALE,
+)
+"""AnalysisResponse by get_description_key."""
+
 
-async def get_advice(client: httpx.AsyncClient, description: str) -> AdviceResponse:
+class AnalysisSectionError(Exception):
+    """
+    The backend couldn't build a section of the analysis.
+    """
+
+
+async def get_advice(
+    client: httpx.AsyncClient, description: str, headers: Optional[dict] = None
+) -> AdviceResponse:
     request = JobDescriptionRequest(description=description)
     response = await client.post(
-        "advice", json=request.model_dump(), timeout=JAO_SERVICE_TIMEOUT
+        "advice",
+        json=request.model_dump(),
+        headers=headers,
+        timeout=JAO_SERVICE_TIMEOUT,
     )
     raise_exception_on_problem(response)
     return AdviceResponse.model_validate(response.json())
 
 
 async def get_similar_adverts(
-    client: httpx.AsyncClient, description: str
+    client: httpx.AsyncClient, description: str, headers: Optional[dict] = None
 ) -> SimilarVacanciesResponse:
     """
     Similar vacancies.
     """
     request = JobDescriptionRequest(description=description)
     response = await client.post(
-        "similar_adverts", json=request.model_dump(), timeout=JAO_SERVICE_TIMEOUT
+        "similar_adverts",
+        json=request.model_dump(),
+        headers=headers,
+        timeout=JAO_SERVICE_TIMEOUT,
     )
     raise_exception_on_problem(response)
     return SimilarVacanciesResponse.model_validate(response.json(), strict=True)
 
 
 async def get_demographics_plots(
-    client: httpx.AsyncClient, description: str
+    client: httpx.AsyncClient, description: str, headers: Optional[dict] = None
 ) -> PlotlyFiguresResponse:
     """
     Demographics plots for similar vacancies.
     """
     request = JobDescriptionRequest(description=description)
     response = await client.post(
-        "similar_advert_plots", json=request.model_dump(), timeout=JAO_SERVICE_TIMEOUT
+        "similar_advert_plots",
+        json=request.model_dump(),
+        headers=headers,
+        timeout=JAO_SERVICE_TIMEOUT,
     )
     raise_exception_on_problem(response)
     return PlotlyFiguresResponse.model_validate(response.json(), strict=True)
 
 
 async def get_skills_plots(
-    client: httpx.AsyncClient, description: str
+    client: httpx.AsyncClient, description: str, headers: Optional[dict] = None
 ) -> PlotlyFiguresResponse:
     """
     Skills plots for similar vacancies.
     """
     request = JobDescriptionRequest(description=description)
     response = await client.post(
-        "skills_plots", json=request.model_dump(), timeout=JAO_SERVICE_TIMEOUT
+        "skills_plots",
+        json=request.model_dump(),
+        headers=headers,
+        timeout=JAO_SERVICE_TIMEOUT,
     )
     raise_exception_on_problem(response)
     return PlotlyFiguresResponse.model_validate(response.json(), strict=True)
 
 
 async def get_applicant_locations(
-    client: httpx.AsyncClient, description: str
+    client: httpx.AsyncClient, description: str, headers: Optional[dict] = None
 ) -> AreaFrequenciesResponse:
     request = JobDescriptionRequest(description=description)
     response = await client.post(
-        "applicant_locations", json=request.model_dump(), timeout=JAO_SERVICE_TIMEOUT
+        "applicant_locations",
+        json=request.model_dump(),
+        headers=headers,
+        timeout=JAO_SERVICE_TIMEOUT,
     )
     raise_exception_on_problem(response)
     return AreaFrequenciesResponse.model_validate(response.json(), strict=True)
+
+
+async def get_analysis(
+    client: httpx.AsyncClient, description: str, headers: Optional[dict] = None
+) -> AnalysisResponse:
+    """
+    Every section of the analysis in one request, the backend embeds the description once.
+    """
+    request = JobDescriptionRequest(description=description)
+    response = await client.post(
+        "analyse",
+        json=request.model_dump(),
+        headers=headers,
+        timeout=JAO_SERVICE_TIMEOUT,
+    )
+    raise_exception_on_problem(response)
+    return AnalysisResponse.model_validate(response.json())
+
+
+async def get_cached_analysis(
+    client: httpx.AsyncClient, description: str, headers: Optional[dict] = None
+) -> AnalysisResponse:
+    """
+    get_analysis, from analysis_cache if the description was analysed recently.
+    """
+    return await analysis_cache.get_or_fetch(
+        get_description_key(description),
+        lambda: get_analysis(client, description, headers=headers),
+    )
+
+
+async def iter_analysis_sections(
+    client: httpx.AsyncClient, description: str, headers: Optional[dict] = None
+):
+    """
+    Sections of the analysis, in the order the backend finishes them.
+
+    The timeout applies to each section, not the whole analysis.
+
+    :return: Async iterator of (section name, AnalysisResponse field), or
+            (section name, AnalysisSectionError) for sections the backend couldn't build.
+    """
+    request = JobDescriptionRequest(description=description)
+    async with client.stream(
+        "POST",
+        "analyse/stream",
+        json=request.model_dump(),
+        headers=headers,
+        timeout=JAO_SERVICE_TIMEOUT,
+    ) as response:
+        if response.is_error:
+            # Problem details are read from the body.
+            await response.aread()
+        raise_exception_on_problem(response)
+
+        async for line in response.aiter_lines():
+            if not line.strip():
+                continue
+            section = AnalysisSection.model_validate_json(line)
+            if section.error is not None:
+                yield section.section, AnalysisSectionError(section.error)
+            else:
+                yield section.section, section.get_response()
@@ -4,6 +4,8 @@
 
 import chroma from 'chroma-js';
 
+import { chooseResolution, loadMapGeoData } from './map_geodata.js';
+
 /**
  * Returns the color based on the frequency value.
  * @param {number} frequency - The frequency value (percentage).
@@ -127,6 +129,47 @@ export function createLegend(areaFrequencies) {
     return legend;
 }
 
+/**
+ * Add a layer of the areas in geojsonData for each layer in the map data.
+ *
+ * @param {object} map - Leaflet map.
+ * @param {object} mapData - Configuration and data for the map.
+ * @param {object} geojsonData - GeoJSON FeatureCollection of the areas.
+ * @param {number} min - The minimum frequency in the dataset.
+ * @param {number} max - The maximum frequency in the dataset.
+ * @returns {Array} - The Leaflet layers added.
+ */
+export function addAreaLayers(map, mapData, geojsonData, min, max) {
+    // Create lookup of area info by code, or by name if the backend doesn't provide codes
+    const areaFrequencies = Object.fromEntries(
+        mapData.area_frequencies.map(({ area_code, area_name, frequency }) => [area_code || area_name, frequency])
+    );
+    const getFrequency = properties => areaFrequencies[properties.areacd] ?? areaFrequencies[properties.areanm];
+
+    // Add each layer from the map data
+    return mapData.layers.map(layer => {
+        return L.geoJson(geojsonData, {
+            style: function(feature) {
+                const frequency = getFrequency(feature.properties);
+                return getFeatureStyle(frequency, min, max);
+            },
+            onEachFeature: function(feature, layer) {
+                const areaName = feature.properties.areanm;
+                const frequency = getFrequency(feature.properties);
+                const readableFrequency = frequency ? `${frequency}%` : 'No applicants';
+                const tooltipOptions = mapData.tooltip_options;
+                layer.bindTooltip(
+                    `<div class="map-tooltip">
+                        <strong>Region:</strong> ${areaName}<br>
+                        <strong>Percentage of applications:</strong> ${readableFrequency}
+                    </div>`,
+                    tooltipOptions
+                );
+            }
+        }).addTo(map);
+    });
+}
+
 /**
  * Creates and initializes the applicant map.
  * @param {HTMLElement} containerElement - The DOM element to contain the map.
@@ -160,38 +203,24 @@ export function renderApplicantMap(containerElement, mapData) {
     // Add the legend to the map with area frequencies data
     createLegend(mapData.area_frequencies).addTo(map);
 
-    // Get the GeoJSON data
-    const geojsonData = mapData.geojson;
-
-    // Create lookup of area info by name
-    // TODO: use area code once backend provides it
-    const areaFrequencies = Object.fromEntries(
-        mapData.area_frequencies.map(({ area_name, frequency }) => [area_name, frequency])
-    );
-
-    // Add each layer from the map data
-    mapData.layers.forEach(layer => {
-        L.geoJson(geojsonData, {
-            style: function(feature) {
-                const areaName = feature.properties.areanm;
-                const frequency = areaFrequencies[areaName];
-                return getFeatureStyle(frequency, min, max);
-            },
-            onEachFeature: function(feature, layer) {
-                const areaName = feature.properties.areanm;
-                const frequency = areaFrequencies[areaName];
-                const readableFrequency = frequency ? `${frequency}%` : 'No applicants';
-                const tooltipOptions = mapData.tooltip_options;
-                layer.bindTooltip(
-                    `<div class="map-tooltip">
-                        <strong>Region:</strong> ${areaName}<br>
-                        <strong>Percentage of applications:</strong> ${readableFrequency}
-                    </div>`,
-                    tooltipOptions
-                );
-            }
-        }).addTo(map);
-    });
+    let areaLayers = addAreaLayers(map, mapData, mapData.geojson, min, max);
+
+    // Swap in boundaries with more, or less, detail as the user zooms.
+    if (mapData.geodata_resolutions?.length) {
+        let currentUrl = chooseResolution(mapData.geodata_resolutions, map.getZoom()).url;
+        map.on('zoomend', async () => {
+            const zoom = map.getZoom();
+            const url = chooseResolution(mapData.geodata_resolutions, zoom).url;
+            if (url === currentUrl) return;
+            currentUrl = url;
+
+            const geojsonData = await loadMapGeoData(mapData, zoom);
+            // Skip if the user zoomed again while this loaded.
+            if (!geojsonData || url !== currentUrl) return;
+            areaLayers.forEach(layer => layer.remove());
+            areaLayers = addAreaLayers(map, mapData, geojsonData, min, max);
+        });
+    }
 
     return map;
 }
\ No newline at end of file
@@ -8,6 +8,23 @@ import {
   renderApplicantMap
 } from './applicant_map.js';
 
+import {
+  loadMapGeoData
+} from './map_geodata.js';
+
+import {
+  renderPlotlyFigures,
+  resizePlotlyFigures
+} from './plotly_figures.js';
+
+import {
+  enableSectionStreaming
+} from './section_stream.js';
+
 export {
   renderApplicantMap,
-}
\ No newline at end of file
+  loadMapGeoData,
+  renderPlotlyFigures,
+  resizePlotlyFigures,
+  enableSectionStreaming,
+}
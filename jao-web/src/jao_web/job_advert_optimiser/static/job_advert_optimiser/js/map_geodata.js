@@ -0,0 +1,85 @@
+/**
+ * Load region boundaries for the applicant map, at a resolution for the zoom level.
+ *
+ * Map data lists simplified TopoJSON boundaries, from lowest to highest resolution:
+ *
+ *   geodata_resolutions: [{url: '.../rgn2023.low.topo.json', max_zoom: 7}, ...]
+ *
+ * built by `manage.py build_map_assets`.  If none load, the full resolution GeoJSON at
+ * geojson_url is used.
+ */
+
+import { feature } from 'topojson-client';
+
+const geoDataCache = new Map();
+
+/**
+ * Pick the lowest resolution with enough detail for a zoom level.
+ *
+ * @param {Array} resolutions - {url, max_zoom} objects, lowest resolution first.
+ * @param {number} zoom - Map zoom level.
+ * @returns {object|null} - The resolution, or null if there are none.
+ */
+export function chooseResolution(resolutions, zoom) {
+    if (!resolutions?.length) return null;
+    return resolutions.find(({ max_zoom }) => max_zoom === null || zoom <= max_zoom)
+        ?? resolutions[resolutions.length - 1];
+}
+
+/**
+ * Convert a TopoJSON topology with one object to a GeoJSON FeatureCollection.
+ *
+ * @param {object} topology - TopoJSON Topology.
+ * @returns {object} - GeoJSON FeatureCollection.
+ */
+export function topologyToGeoJSON(topology) {
+    const [name] = Object.keys(topology.objects);
+    return feature(topology, topology.objects[name]);
+}
+
+/**
+ * Fetch GeoJSON, or TopoJSON converted to GeoJSON, each URL is fetched once.
+ *
+ * @param {string} url - URL of the GeoJSON or TopoJSON.
+ * @returns {Promise<object>} - GeoJSON FeatureCollection.
+ */
+export function loadGeoData(url) {
+    if (!geoDataCache.has(url)) {
+        const promise = fetch(url)
+            .then((response) => {
+                if (!response.ok) throw new Error(`HTTP error loading geo data from ${url} ${response.status}`);
+                return response.json();
+            })
+            .then((data) => data.type === 'Topology' ? topologyToGeoJSON(data) : data);
+        // Failed requests may be retried.
+        promise.catch(() => geoDataCache.delete(url));
+        geoDataCache.set(url, promise);
+    }
+    return geoDataCache.get(url);
+}
+
+/**
+ * Load boundaries for the map at a zoom level.
+ *
+ * @param {object} mapData - Map data, with geodata_resolutions and geojson_url.
+ * @param {number} zoom - Map zoom level.
+ * @returns {Promise<object|null>} - GeoJSON FeatureCollection, or null if none loaded.
+ */
+export async function loadMapGeoData(mapData, zoom) {
+    const resolution = chooseResolution(mapData.geodata_resolutions, zoom);
+    if (resolution) {
+        try {
+            return await loadGeoData(resolution.url);
+        } catch (error) {
+            console.warn('Simplified geo data failed to load, using full resolution:', error.message);
+        }
+    }
+
+    if (!mapData.geojson_url) return null;
+    try {
+        return await loadGeoData(mapData.geojson_url);
+    } catch (error) {
+        console.error('GeoJSON loading failed:', error.message);
+        return null;
+    }
+}
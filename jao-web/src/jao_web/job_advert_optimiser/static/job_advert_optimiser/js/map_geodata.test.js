@@ -0,0 +1,50 @@
+import { describe, it, expect } from 'vitest';
+import { chooseResolution, topologyToGeoJSON } from './map_geodata';
+
+describe('Map geo data', () => {
+  describe('chooseResolution', () => {
+    const resolutions = [
+      { url: 'low', max_zoom: 7 },
+      { url: 'medium', max_zoom: 9 },
+      { url: 'high', max_zoom: null },
+    ];
+
+    it('should choose the lowest resolution for the zoom level', () => {
+      expect(chooseResolution(resolutions, 5.2).url).toBe('low');
+      expect(chooseResolution(resolutions, 7).url).toBe('low');
+      expect(chooseResolution(resolutions, 8).url).toBe('medium');
+      expect(chooseResolution(resolutions, 12).url).toBe('high');
+    });
+
+    it('should return null without resolutions', () => {
+      expect(chooseResolution([], 5)).toBeNull();
+      expect(chooseResolution(undefined, 5)).toBeNull();
+    });
+  });
+
+  describe('topologyToGeoJSON', () => {
+    it('should convert a topology to features with their properties', () => {
+      const topology = {
+        type: 'Topology',
+        transform: { scale: [1, 1], translate: [0, 0] },
+        objects: {
+          rgn2023: {
+            type: 'GeometryCollection',
+            geometries: [
+              { type: 'MultiPolygon', properties: { areacd: 'E12000007' }, arcs: [[[0]]] },
+            ],
+          },
+        },
+        arcs: [[[0, 0], [1, 0], [0, 1], [-1, 0], [0, -1]]],
+      };
+
+      const geojson = topologyToGeoJSON(topology);
+
+      expect(geojson.type).toBe('FeatureCollection');
+      expect(geojson.features[0].properties.areacd).toBe('E12000007');
+      expect(geojson.features[0].geometry.coordinates[0][0]).toEqual(
+        [[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]
+      );
+    });
+  });
+});
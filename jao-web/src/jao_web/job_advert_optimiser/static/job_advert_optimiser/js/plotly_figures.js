@@ -0,0 +1,61 @@
+/**
+ * Render plotly figures from the JSON the backend built them as.
+ *
+ * Templates output each figure as:
+ *
+ *   <div data-plotly-figure><script type="application/json">{"data": ..., "layout": ...}</script></div>
+ *
+ * plotly.js is large, so it is loaded on first use, pages without figures don't load it.
+ */
+
+let plotlyPromise = null;
+
+function loadPlotly() {
+    if (!plotlyPromise) {
+        plotlyPromise = import('plotly.js-dist-min').then((module) => module.default);
+    }
+    return plotlyPromise;
+}
+
+/**
+ * Read a figure from its element.
+ *
+ * @param {HTMLElement} element - Element with a data-plotly-figure attribute.
+ * @returns {object|null} - Figure JSON, with data and layout, or null if there isn't one.
+ */
+export function readFigure(element) {
+    const script = element.querySelector('script[type="application/json"]');
+    if (!script?.textContent) return null;
+    return JSON.parse(script.textContent);
+}
+
+/**
+ * Render figures in root that haven't been rendered yet.
+ *
+ * @param {ParentNode} root - Element or document to look for figures in.
+ */
+export async function renderPlotlyFigures(root = document) {
+    const elements = Array.from(root.querySelectorAll('[data-plotly-figure]:not([data-rendered])'));
+    if (!elements.length) return;
+
+    const Plotly = await loadPlotly();
+    elements.forEach((element) => {
+        const figure = readFigure(element);
+        if (!figure) return;
+        element.setAttribute('data-rendered', '');
+        Plotly.newPlot(element, figure.data || [], figure.layout || {}, {responsive: true});
+    });
+}
+
+/**
+ * Resize rendered figures in root, e.g. after the tab they are in is shown.
+ *
+ * @param {ParentNode} root - Element or document to look for figures in.
+ */
+export async function resizePlotlyFigures(root = document) {
+    const elements = root.querySelectorAll('[data-plotly-figure][data-rendered]');
+    if (!elements.length) return;
+
+    const Plotly = await loadPlotly();
+    elements.forEach((element) => Plotly.Plots.resize(element));
+}
@@ -0,0 +1,23 @@
+import { describe, it, expect } from 'vitest';
+import { readFigure } from './plotly_figures';
+
+describe('Plotly figures', () => {
+  describe('readFigure', () => {
+    it('should read the figure JSON from the element', () => {
+      document.body.innerHTML = `
+        <div data-plotly-figure>
+          <script type="application/json">{"data": [{"type": "bar"}], "layout": {}}</script>
+        </div>`;
+
+      const figure = readFigure(document.querySelector('[data-plotly-figure]'));
+
+      expect(figure).toEqual({data: [{type: 'bar'}], layout: {}});
+    });
+
+    it('should return null without figure JSON', () => {
+      document.body.innerHTML = '<div data-plotly-figure></div>';
+
+      expect(readFigure(document.querySelector('[data-plotly-figure]'))).toBeNull();
+    });
+  });
+});
@@ -0,0 +1,121 @@
+/**
+ * Load analysis sections progressively.
+ *
+ * When the job description is submitted, the page is rendered with a placeholder for
+ * each section, and a data-stream-url.  The description is posted again to that URL,
+ * which responds with one JSON line per section as the backend finishes it:
+ *
+ *   {"section": "advice", "html": "<h2 ..."}
+ *
+ * Each section's HTML replaces the element with a matching data-section attribute.
+ * Without JavaScript the form is submitted normally, and every section is rendered
+ * with the page.
+ */
+
+/**
+ * Split complete lines from text received so far.
+ *
+ * @param {string} buffer - Text received, which may end part way through a line.
+ * @returns {[string[], string]} - Complete, non-empty lines, and the remaining text.
+ */
+export function splitLines(buffer) {
+    const lines = buffer.split('\n');
+    const rest = lines.pop();
+    return [lines.filter((line) => line.trim()), rest];
+}
+
+/**
+ * Replace a section's content, scripts in the HTML (e.g. plotly figures) are run.
+ *
+ * Dispatches 'jao:section-loaded' on the document, so pages can set up widgets in it.
+ *
+ * @param {HTMLElement} container - Element containing the sections.
+ * @param {string} section - Name of the section.
+ * @param {string} html - HTML of the section.
+ */
+export function swapSection(container, section, html) {
+    const element = container.querySelector(`[data-section="${section}"]`);
+    if (!element) {
+        console.warn(`No element for section ${section}`);
+        return;
+    }
+
+    element.innerHTML = html;
+    // Scripts added with innerHTML are not run, replace them with new script elements.
+    element.querySelectorAll('script').forEach((oldScript) => {
+        const script = document.createElement('script');
+        Array.from(oldScript.attributes).forEach((attribute) => {
+            script.setAttribute(attribute.name, attribute.value);
+        });
+        script.text = oldScript.text;
+        oldScript.replaceWith(script);
+    });
+
+    document.dispatchEvent(new CustomEvent('jao:section-loaded', {detail: {section}}));
+}
+
+/**
+ * Mark sections that are still loading as failed.
+ *
+ * @param {HTMLElement} container - Element containing the sections.
+ */
+function failPendingSections(container) {
+    container.querySelectorAll('[data-section] [role="status"]').forEach((status) => {
+        status.textContent = 'This section could not be loaded, please try again.';
+        status.className = 'govuk-error-message';
+    });
+}
+
+/**
+ * Post form data to url, and swap in each section as it arrives.
+ *
+ * @param {string} url - URL of the section stream.
+ * @param {FormData} formData - The submitted form.
+ * @param {HTMLElement} container - Element containing the sections.
+ */
+export async function streamSections(url, formData, container) {
+    try {
+        const response = await fetch(url, {method: 'POST', body: formData});
+        if (!response.ok) throw new Error(`HTTP error streaming sections ${response.status}`);
+
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        while (true) {
+            const {value, done} = await reader.read();
+            if (done) break;
+
+            let lines;
+            [lines, buffer] = splitLines(buffer + value);
+            lines.forEach((line) => {
+                const {section, html} = JSON.parse(line);
+                swapSection(container, section, html);
+            });
+        }
+    } catch (error) {
+        console.error('Section streaming failed:', error.message);
+    }
+    failPendingSections(container);
+}
+
+/**
+ * Ask for sections to be streamed when the form is submitted, and start streaming
+ * if the page has placeholders for them.
+ *
+ * @param {HTMLFormElement} form - The job description form.
+ * @param {HTMLElement} container - Element containing the sections, if any.
+ */
+export function enableSectionStreaming(form, container) {
+    if (!form || !window.fetch || !window.TextDecoderStream) return;
+
+    form.addEventListener('submit', () => {
+        if (form.querySelector('input[name="stream"]')) return;
+        const input = document.createElement('input');
+        input.type = 'hidden';
+        input.name = 'stream';
+        input.value = '1';
+        form.appendChild(input);
+    });
+
+    const url = container?.dataset.streamUrl;
+    if (url) streamSections(url, new FormData(form), container);
+}
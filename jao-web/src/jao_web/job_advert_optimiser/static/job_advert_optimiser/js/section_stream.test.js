@@ -0,0 +1,36 @@
+import { describe, it, expect, vi } from 'vitest';
+import { splitLines, swapSection } from './section_stream';
+
+describe('Section streaming', () => {
+  describe('splitLines', () => {
+    it('should keep a partial line for the next chunk', () => {
+      const [lines, rest] = splitLines('{"a": 1}\n{"b": 2}\n{"c"');
+
+      expect(lines).toEqual(['{"a": 1}', '{"b": 2}']);
+      expect(rest).toBe('{"c"');
+    });
+
+    it('should skip blank lines', () => {
+      const [lines, rest] = splitLines('\n{"a": 1}\n\n');
+
+      expect(lines).toEqual(['{"a": 1}']);
+      expect(rest).toBe('');
+    });
+  });
+
+  describe('swapSection', () => {
+    it('should replace the section and announce it', () => {
+      document.body.innerHTML = `
+        <div id="sections">
+          <div data-section="advice"><p role="status">Loading</p></div>
+        </div>`;
+      const listener = vi.fn();
+      document.addEventListener('jao:section-loaded', listener);
+
+      swapSection(document.getElementById('sections'), 'advice', '<h2>Advice</h2>');
+
+      expect(document.querySelector('[data-section="advice"]').innerHTML).toBe('<h2>Advice</h2>');
+      expect(listener.mock.calls[0][0].detail).toEqual({section: 'advice'});
+    });
+  });
+});
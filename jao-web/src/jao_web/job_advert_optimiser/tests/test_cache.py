@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from jao_web.job_advert_optimiser.services import cache as cache_module
+from jao_web.job_advert_optimiser.services.cache import StaleWhileRevalidateCache
+from jao_web.job_advert_optimiser.services.cache import get_description_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    return clock
+
+
+def fetcher(*values):
+    """
+    Fetch function returning each of values in turn, and the number of calls.
+    """
+    calls = []
+
+    async def fetch():
+        calls.append(None)
+        value = values[len(calls) - 1]
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    return fetch, calls
+
+
+def test_description_key_ignores_whitespace():
+    assert get_description_key("Policy  advisor\n") == get_description_key(
+        "Policy advisor"
+    )
+    assert get_description_key("Policy advisor") != get_description_key("Analyst")
+
+
+@pytest.mark.asyncio
+async def test_fresh_entries_are_not_fetched_again(clock):
+    cache = StaleWhileRevalidateCache(maxsize=2, fresh_for=10, stale_for=100)
+    fetch, calls = fetcher("first", "second")
+
+    assert await cache.get_or_fetch("key", fetch) == "first"
+    clock.now += 5
+    assert await cache.get_or_fetch("key", fetch) == "first"
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_entries_are_served_while_refreshed(clock):
+    cache = StaleWhileRevalidateCache(maxsize=2, fresh_for=10, stale_for=100)
+    fetch, calls = fetcher("first", "second")
+    await cache.get_or_fetch("key", fetch)
+
+    clock.now += 50
+    assert await cache.get_or_fetch("key", fetch) == "first"
+    await asyncio.sleep(0)
+    assert cache.get("key") == "second"
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_keeps_stale_entry(clock):
+    cache = StaleWhileRevalidateCache(maxsize=2, fresh_for=10, stale_for=100)
+    fetch, calls = fetcher("first", RuntimeError("Backend unavailable"))
+    await cache.get_or_fetch("key", fetch)
+
+    clock.now += 50
+    assert await cache.get_or_fetch("key", fetch) == "first"
+    await asyncio.sleep(0)
+    assert cache.get("key") == "first"
+
+
+@pytest.mark.asyncio
+async def test_expired_entries_are_fetched(clock):
+    cache = StaleWhileRevalidateCache(maxsize=2, fresh_for=10, stale_for=100)
+    fetch, calls = fetcher("first", "second")
+    await cache.get_or_fetch("key", fetch)
+
+    clock.now += 200
+    assert await cache.get_or_fetch("key", fetch) == "second"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_a_fetch(clock):
+    cache = StaleWhileRevalidateCache(maxsize=2, fresh_for=10, stale_for=100)
+    fetch, calls = fetcher("first", "second")
+
+    results = await asyncio.gather(
+        cache.get_or_fetch("key", fetch), cache.get_or_fetch("key", fetch)
+    )
+
+    assert results == ["first", "first"]
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_misses_wait_for_a_registered_fetch(clock):
+    """
+    While the caller fetches a value itself, e.g. streaming it, other misses wait for
+    it.  If it isn't stored, they fetch it.
+    """
+    cache = StaleWhileRevalidateCache(maxsize=2, fresh_for=10, stale_for=100)
+    fetch, calls = fetcher("fetched")
+
+    with cache.fetching("key"):
+        waiting = asyncio.ensure_future(cache.get_or_fetch("key", fetch))
+        await asyncio.sleep(0)
+        assert cache.get_fetch("key") is not None
+        cache.set("key", "streamed")
+    assert await waiting == "streamed"
+    assert calls == []
+    assert cache.get_fetch("key") is None
+
+    cache.delete("key")
+    with cache.fetching("key"):
+        waiting = asyncio.ensure_future(cache.get_or_fetch("key", fetch))
+        await asyncio.sleep(0)
+    assert await waiting == "fetched"
+    assert len(calls) == 1
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    cache = StaleWhileRevalidateCache(maxsize=2, fresh_for=10, stale_for=100)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
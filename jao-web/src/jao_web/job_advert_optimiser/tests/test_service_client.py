@@ -1,9 +1,19 @@
+import json
+
 import httpx
 import pytest
 
+from jao_backend_schemas.analysis import AnalysisResponse
 from pytest_httpx import HTTPXMock
 
+from jao_web.common.lifespan import with_lifespan
+from jao_web.job_advert_optimiser.services.client import close_shared_async_clients
 from jao_web.job_advert_optimiser.services.client import get_async_client
+from jao_web.job_advert_optimiser.services.client import get_session_headers
+from jao_web.job_advert_optimiser.services.client import get_shared_async_client
+from jao_web.job_advert_optimiser.services.services import AnalysisSectionError
+from jao_web.job_advert_optimiser.services.services import get_analysis
+from jao_web.job_advert_optimiser.services.services import iter_analysis_sections
 
 
 def test_client_session_key_cannot_be_empty():
@@ -34,3 +44,109 @@ async def test_client_session_key_sets_session_id_header(httpx_mock: HTTPXMock,
 
     assert request.url == similar_applicants_url
     assert request.headers["X-Session-Id"] == session_key
+
+
+@pytest.mark.asyncio
+async def test_get_analysis(httpx_mock: HTTPXMock, session_key):
+    """
+    get_analysis fetches every section of the analysis with one request.
+    """
+    client = get_async_client(session_key)
+    httpx_mock.add_response(
+        method="POST",
+        url=str(client.base_url.join("analyse")),
+        json={
+            "advice": {"advice": "Add a salary."},
+            "similar_adverts": {
+                "similar_vacancies": [
+                    {"job_title": "Analyst", "full_job_desc": "...", "vacancy_id": 1}
+                ]
+            },
+            "similar_advert_plots": {"plotly_figures": []},
+            "skills_plots": {"plotly_figures": []},
+            "applicant_locations": {"area_frequencies": []},
+        },
+    )
+
+    analysis = await get_analysis(client, "Analyst")
+
+    assert isinstance(analysis, AnalysisResponse)
+    assert analysis.advice.advice == "Add a salary."
+    assert analysis.similar_adverts.similar_vacancies[0].vacancy_id == 1
+    assert len(httpx_mock.get_requests()) == 1
+
+
+@pytest.mark.asyncio
+async def test_iter_analysis_sections(httpx_mock: HTTPXMock, session_key):
+    """
+    Sections are read from the NDJSON stream in the order the backend sends them.
+    """
+    client = get_async_client(session_key)
+    lines = [
+        {"section": "skills_plots", "data": {"plotly_figures": []}},
+        {"section": "applicant_locations", "error": "Could not build applicant_locations."},
+        {"section": "advice", "data": {"advice": "Add a salary."}},
+    ]
+    httpx_mock.add_response(
+        method="POST",
+        url=str(client.base_url.join("analyse/stream")),
+        content="\n".join(json.dumps(line) for line in lines).encode() + b"\n",
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+
+    sections = [
+        section async for section in iter_analysis_sections(client, "Analyst")
+    ]
+
+    assert [name for name, _ in sections] == [
+        "skills_plots",
+        "applicant_locations",
+        "advice",
+    ]
+    assert sections[0][1].plotly_figures == []
+    assert isinstance(sections[1][1], AnalysisSectionError)
+    assert sections[2][1].advice == "Add a salary."
+
+
+@pytest.mark.asyncio
+async def test_shared_client_sends_session_id_per_request(httpx_mock: HTTPXMock):
+    """
+    Views share one client per event loop, each request carries its own session's X-Session-Id.
+    """
+    client = get_shared_async_client()
+    assert get_shared_async_client() is client
+    assert "X-Session-Id" not in client.headers
+
+    httpx_mock.add_response(
+        method="GET", url=str(client.base_url.join("advice")), json={}, is_reusable=True
+    )
+    await client.get("advice", headers=get_session_headers("first"))
+    await client.get("advice", headers=get_session_headers("second"))
+
+    first, second = httpx_mock.get_requests()
+    assert first.headers["X-Session-Id"] == "first"
+    assert second.headers["X-Session-Id"] == "second"
+
+    await close_shared_async_clients()
+    assert client.is_closed
+    assert get_shared_async_client() is not client
+    await close_shared_async_clients()
+
+
+@pytest.mark.asyncio
+async def test_lifespan_shutdown_closes_shared_client():
+    client = get_shared_async_client()
+    messages = iter([{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}])
+    sent = []
+
+    async def receive():
+        return next(messages)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    application = with_lifespan(None, on_shutdown=[close_shared_async_clients])
+    await application({"type": "lifespan"}, receive, send)
+
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    assert client.is_closed
@@ -0,0 +1,106 @@
+import pytest
+
+from jao_web.job_advert_optimiser.topology import simplify_line
+from jao_web.job_advert_optimiser.topology import to_topology
+
+
+def square_feature(name, x, y, size=1.0, border_points=()):
+    """
+    Square polygon, with extra points on its right hand edge.
+    """
+    right = [(x + size, y + size * t) for t in border_points]
+    ring = [(x, y), (x + size, y), *right, (x + size, y + size), (x, y + size), (x, y)]
+    return {
+        "type": "Feature",
+        "properties": {"areanm": name},
+        "geometry": {"type": "Polygon", "coordinates": [[list(p) for p in ring]]},
+    }
+
+
+def decode_arcs(topology):
+    """
+    Absolute coordinates of each arc.
+    """
+    (sx, sy), (tx, ty) = (
+        topology["transform"]["scale"],
+        topology["transform"]["translate"],
+    )
+    arcs = []
+    for arc in topology["arcs"]:
+        x = y = 0
+        points = []
+        for dx, dy in arc:
+            x, y = x + dx, y + dy
+            points.append((round(x * sx + tx, 6), round(y * sy + ty, 6)))
+        arcs.append(points)
+    return arcs
+
+
+@pytest.fixture
+def neighbours():
+    """
+    Two squares side by side, sharing the border x=1.
+    """
+    west = square_feature("West", 0, 0, border_points=[0.25, 0.5, 0.75])
+    east = {
+        "type": "Feature",
+        "properties": {"areanm": "East"},
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [
+                [[1, 0], [2, 0], [2, 1], [1, 1], [1, 0.75], [1, 0.5], [1, 0.25], [1, 0]]
+            ],
+        },
+    }
+    return {"type": "FeatureCollection", "features": [west, east]}
+
+
+def test_shared_border_is_one_arc(neighbours):
+    # Quantised to a grid of 0.5, so coordinates decode exactly.
+    topology = to_topology(neighbours, quantisation=5, object_name="regions")
+
+    geometries = topology["objects"]["regions"]["geometries"]
+    assert [g["properties"]["areanm"] for g in geometries] == ["West", "East"]
+    west_arcs = set(geometries[0]["arcs"][0][0])
+    east_arcs = set(geometries[1]["arcs"][0][0])
+    # The border is referenced by both, in opposite directions.
+    shared = [i for i in west_arcs if ~i in east_arcs]
+    assert len(shared) == 1
+    assert len(topology["arcs"]) == 3
+
+    border = decode_arcs(topology)[shared[0]]
+    assert border[0] == (1.0, 0.0)
+    assert border[-1] == (1.0, 1.0)
+
+
+def test_simplified_border_keeps_junctions(neighbours):
+    topology = to_topology(neighbours, tolerance=0.1)
+
+    # The straight border's middle points are removed, its ends kept.
+    lengths = sorted(len(arc) for arc in topology["arcs"])
+    assert lengths == [2, 4, 4]
+
+
+def test_collapsed_islands_are_dropped():
+    island = [[5, 5], [5.001, 5], [5.001, 5.001], [5, 5]]
+    mainland = square_feature("Mainland", 0, 0)
+    mainland["geometry"] = {
+        "type": "MultiPolygon",
+        "coordinates": [mainland["geometry"]["coordinates"], [island]],
+    }
+
+    topology = to_topology({"features": [mainland]}, tolerance=0.01)
+
+    (geometry,) = topology["objects"]["areas"]["geometries"]
+    assert len(geometry["arcs"]) == 1
+
+
+@pytest.mark.parametrize(
+    "tolerance,expected",
+    [
+        (0.0, [(0, 0), (1, 0.05), (2, 0), (3, 1)]),
+        (0.1, [(0, 0), (2, 0), (3, 1)]),
+    ],
+)
+def test_simplify_line(tolerance, expected):
+    assert simplify_line([(0, 0), (1, 0.05), (2, 0), (3, 1)], tolerance) == expected
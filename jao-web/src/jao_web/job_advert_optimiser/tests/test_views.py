@@ -1,10 +1,19 @@
 # from django.test import SimpleTestCase
 # import pytest
+import asyncio
+import json
 import warnings
 
+import pytest
 from django.urls import reverse
+from pytest_httpx import HTTPXMock
 
 from jao_web.job_advert_optimiser.forms import JobAdvertForm
+from jao_web.job_advert_optimiser.services.client import close_shared_async_clients
+from jao_web.job_advert_optimiser.services.client import get_shared_async_client
+from jao_web.job_advert_optimiser.services.services import analysis_cache
+from jao_web.job_advert_optimiser.views import SECTION_HEADINGS
+from jao_web.job_advert_optimiser.views import JobAdvertOptimiserView
 
 
 def test_initial_form_appears(client):
@@ -16,3 +25,134 @@ def test_initial_form_appears(client):
 
     assert result.status_code == 200
     assert isinstance(result.context["form"], JobAdvertForm)
+
+
+def test_view_is_async():
+    """
+    Submissions wait on the backend without blocking a worker thread.
+    """
+    assert JobAdvertOptimiserView.view_is_async
+
+
+def test_invalid_form_is_shown_again(client):
+    url = reverse("job_advert_optimiser")
+    result = client.post(url, {"job_description": ""})
+
+    assert result.status_code == 200
+    assert result.context["form"].errors
+    assert result.context["session_key"]
+
+
+def test_streamed_sections_are_placeholders(client, settings):
+    """
+    When the page asks for sections to be streamed, they are loaded after the page.
+    """
+    settings.JAO_WEB_STREAM_SECTIONS = True
+    url = reverse("job_advert_optimiser")
+    result = client.post(url, {"job_description": "Analyst", "stream": "1"})
+
+    assert result.status_code == 200
+    assert result.context["stream_url"] == reverse("job_advert_optimiser_stream")
+    assert b'data-section="advice"' in result.content
+
+
+def get_stream_lines(content: bytes):
+    return [json.loads(line) for line in content.decode().splitlines()]
+
+
+def add_analysis_stream_response(httpx_mock, sections):
+    httpx_mock.add_response(
+        method="POST",
+        url=str(get_shared_async_client().base_url.join("analyse/stream")),
+        content="".join(json.dumps(section) + "\n" for section in sections).encode(),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+
+
+ANALYSIS_SECTIONS = [
+    {"section": "advice", "data": {"advice": "Add a salary."}},
+    {
+        "section": "similar_adverts",
+        "data": {
+            "similar_vacancies": [
+                {"job_title": "Analyst", "full_job_desc": "...", "vacancy_id": 1}
+            ]
+        },
+    },
+    {"section": "similar_advert_plots", "data": {"plotly_figures": []}},
+    {"section": "skills_plots", "data": {"plotly_figures": []}},
+    {"section": "applicant_locations", "data": {"area_frequencies": []}},
+]
+
+
+@pytest.fixture
+def empty_analysis_cache():
+    analysis_cache.clear()
+    yield analysis_cache
+    analysis_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_section_stream(async_client, httpx_mock: HTTPXMock, empty_analysis_cache):
+    """
+    One line per section.  Sections the backend fails or drops are shown as errors and
+    the analysis isn't cached, a complete analysis is cached and served from there.
+    """
+    url = reverse("job_advert_optimiser_stream")
+    failed = [
+        ANALYSIS_SECTIONS[0],
+        ANALYSIS_SECTIONS[1],
+        ANALYSIS_SECTIONS[2],
+        # skills_plots is dropped.
+        {"section": "applicant_locations", "error": "Could not build applicant_locations."},
+    ]
+    add_analysis_stream_response(httpx_mock, failed)
+
+    response = await async_client.post(url, {"job_description": "Analyst"})
+    lines = get_stream_lines(b"".join([chunk async for chunk in response.streaming_content]))
+
+    assert response["Content-Type"] == "application/x-ndjson"
+    assert sorted(line["section"] for line in lines) == sorted(SECTION_HEADINGS)
+    html = {line["section"]: line["html"] for line in lines}
+    assert "Could not load skills." in html["skills_plots"]
+    assert "Could not load locations." in html["applicant_locations"]
+    assert "Analyst" in html["similar_adverts"]
+    assert len(empty_analysis_cache) == 0
+
+    add_analysis_stream_response(httpx_mock, ANALYSIS_SECTIONS)
+    response = await async_client.post(url, {"job_description": "Analyst"})
+    lines = get_stream_lines(b"".join([chunk async for chunk in response.streaming_content]))
+    assert [line["section"] for line in lines] == list(SECTION_HEADINGS)
+    assert not any("govuk-error-message" in line["html"] for line in lines)
+    assert len(empty_analysis_cache) == 1
+
+    # Served from the cache, without asking the backend.
+    response = await async_client.post(url, {"job_description": " Analyst\n"})
+    lines = get_stream_lines(b"".join([chunk async for chunk in response.streaming_content]))
+    assert [line["section"] for line in lines] == list(SECTION_HEADINGS)
+    assert len(httpx_mock.get_requests()) == 2
+
+    await close_shared_async_clients()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_section_streams_share_a_request(
+    async_client, httpx_mock: HTTPXMock, empty_analysis_cache
+):
+    """
+    A description submitted again while it is streamed waits for that analysis.
+    """
+    add_analysis_stream_response(httpx_mock, ANALYSIS_SECTIONS)
+    url = reverse("job_advert_optimiser_stream")
+
+    async def stream_lines():
+        response = await async_client.post(url, {"job_description": "Analyst"})
+        return get_stream_lines(
+            b"".join([chunk async for chunk in response.streaming_content])
+        )
+
+    for lines in await asyncio.gather(stream_lines(), stream_lines()):
+        assert [line["section"] for line in lines] == list(SECTION_HEADINGS)
+    assert len(httpx_mock.get_requests()) == 1
+
+    await close_shared_async_clients()
@@ -0,0 +1,271 @@
+"""
+Convert GeoJSON polygons to simplified, quantised TopoJSON.
+
+Borders shared by neighbouring areas are stored once, as an arc, and simplified once,
+so simplified areas still meet without gaps or overlaps.  Arc ends (where three or more
+areas meet) are never simplified away.
+
+See https://github.com/topojson/topojson-specification
+"""
+
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Set
+from typing import Tuple
+
+Point = Tuple[float, float]
+Ring = List[Point]
+
+
+def get_polygons(geometry: dict) -> List[List[Ring]]:
+    """
+    :param geometry: GeoJSON Polygon or MultiPolygon.
+    :return: Rings of each polygon, the exterior first.
+    """
+    if geometry["type"] == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif geometry["type"] == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        raise ValueError(f"Unsupported geometry type: {geometry['type']}")
+
+    return [
+        [[(point[0], point[1]) for point in ring] for ring in polygon]
+        for polygon in polygons
+    ]
+
+
+def find_junctions(rings: Iterable[Ring]) -> Set[Point]:
+    """
+    Points where shared borders start or end.
+
+    A point on a border shared by two rings has the same neighbours in both, where
+    the neighbours differ more than two rings meet, or a shared border ends.
+    """
+    neighbours: Dict[Point, frozenset] = {}
+    junctions = set()
+    for ring in rings:
+        points = ring[:-1]
+        for i, point in enumerate(points):
+            pair = frozenset((points[i - 1], points[(i + 1) % len(points)]))
+            if neighbours.setdefault(point, pair) != pair:
+                junctions.add(point)
+    return junctions
+
+
+def split_ring(ring: Ring, junctions: Set[Point]) -> List[List[Point]]:
+    """
+    :param ring: Closed ring, the last point is the first.
+    :return: Arcs between junctions in the ring, in order.
+    """
+    points = ring[:-1]
+    starts = [i for i, point in enumerate(points) if point in junctions]
+    if not starts:
+        # Start at the smallest point, so rings shared by two areas (an enclave and
+        # the hole around it) are the same arc.
+        start = points.index(min(points))
+        return [points[start:] + points[: start + 1]]
+
+    start = starts[0]
+    rotated = points[start:] + points[: start + 1]
+    arcs = []
+    arc = [rotated[0]]
+    for point in rotated[1:]:
+        arc.append(point)
+        if point in junctions:
+            arcs.append(arc)
+            arc = [point]
+    return arcs
+
+
+class ArcIndex:
+    """
+    Arcs, each stored once, shared arcs are referenced reversed as ~index.
+    """
+
+    def __init__(self):
+        self.arcs: List[List[Point]] = []
+        self.indexes: Dict[tuple, int] = {}
+
+    def add(self, arc: List[Point]) -> int:
+        key = tuple(arc)
+        if key in self.indexes:
+            return self.indexes[key]
+
+        reverse_key = key[::-1]
+        if reverse_key in self.indexes:
+            return ~self.indexes[reverse_key]
+
+        index = self.indexes[key] = len(self.arcs)
+        self.arcs.append(arc)
+        return index
+
+
+def get_segment_distance(point: Point, start: Point, end: Point) -> float:
+    """
+    :return: Distance from point to the line segment between start and end.
+    """
+    px, py = point
+    sx, sy = start
+    dx, dy = end[0] - sx, end[1] - sy
+    length_squared = dx * dx + dy * dy
+    if length_squared:
+        t = max(0.0, min(1.0, ((px - sx) * dx + (py - sy) * dy) / length_squared))
+        sx, sy = sx + t * dx, sy + t * dy
+    return ((px - sx) ** 2 + (py - sy) ** 2) ** 0.5
+
+
+def simplify_line(points: List[Point], tolerance: float) -> List[Point]:
+    """
+    Douglas-Peucker simplification, the first and last points are kept.
+
+    :param tolerance: Largest distance a removed point may be from the line.
+    """
+    if tolerance <= 0 or len(points) < 3:
+        return list(points)
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        furthest, distance = None, tolerance
+        for i in range(start + 1, end):
+            point_distance = get_segment_distance(points[i], points[start], points[end])
+            if point_distance > distance:
+                furthest, distance = i, point_distance
+        if furthest is not None:
+            keep[furthest] = True
+            stack.append((start, furthest))
+            stack.append((furthest, end))
+
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def get_arc(arcs: List[List[Point]], index: int) -> List[Point]:
+    return arcs[index] if index >= 0 else arcs[~index][::-1]
+
+
+def is_valid_ring(arcs: List[List[Point]], ring: List[int]) -> bool:
+    """
+    :return: True if the ring still encloses an area, it has three or more points.
+    """
+    points = {point for index in ring for point in get_arc(arcs, index)}
+    return len(points) >= 3
+
+
+def quantise_arc(arc: List[Point], translate, scale) -> List[List[int]]:
+    """
+    :return: Arc as integer deltas from the previous point, the first is absolute.
+    """
+    quantised = []
+    for x, y in arc:
+        point = [
+            round((x - translate[0]) / scale[0]),
+            round((y - translate[1]) / scale[1]),
+        ]
+        if not quantised or point != quantised[-1]:
+            quantised.append(point)
+    if len(quantised) == 1:
+        quantised.append(quantised[0])
+
+    encoded = [quantised[0]]
+    for previous, point in zip(quantised, quantised[1:]):
+        encoded.append([point[0] - previous[0], point[1] - previous[1]])
+    return encoded
+
+
+def to_topology(
+    feature_collection: dict,
+    tolerance: float = 0.0,
+    quantisation: int = 100_000,
+    object_name: str = "areas",
+) -> dict:
+    """
+    :param feature_collection: GeoJSON FeatureCollection of Polygons and MultiPolygons.
+    :param tolerance: Simplification tolerance, in the units of the coordinates.
+    :param quantisation: Number of distinct x and y values in the output.
+    :param object_name: Name of the GeometryCollection in the topology.
+    :return: TopoJSON Topology, each feature a MultiPolygon with its properties.
+    """
+    features = feature_collection["features"]
+    feature_polygons = [get_polygons(feature["geometry"]) for feature in features]
+    junctions = find_junctions(
+        ring
+        for polygons in feature_polygons
+        for polygon in polygons
+        for ring in polygon
+    )
+
+    index = ArcIndex()
+    feature_arcs = [
+        [
+            [
+                [index.add(arc) for arc in split_ring(ring, junctions)]
+                for ring in polygon
+            ]
+            for polygon in polygons
+        ]
+        for polygons in feature_polygons
+    ]
+    arcs = [simplify_line(arc, tolerance) for arc in index.arcs]
+
+    # Small islands and holes can collapse when simplified, drop them, but keep at
+    # least one polygon for each feature.
+    kept_feature_arcs = []
+    for polygons in feature_arcs:
+        kept = [
+            [polygon[0], *(ring for ring in polygon[1:] if is_valid_ring(arcs, ring))]
+            for polygon in polygons
+            if is_valid_ring(arcs, polygon[0])
+        ]
+        kept_feature_arcs.append(kept or polygons[:1])
+
+    # Renumber the arcs that are still used.
+    used = sorted(
+        {
+            i if i >= 0 else ~i
+            for polygons in kept_feature_arcs
+            for polygon in polygons
+            for ring in polygon
+            for i in ring
+        }
+    )
+    renumbered = {old: new for new, old in enumerate(used)}
+    arcs = [arcs[i] for i in used]
+
+    points = [point for arc in arcs for point in arc]
+    xs = [x for x, _ in points]
+    ys = [y for _, y in points]
+    bbox = [min(xs), min(ys), max(xs), max(ys)]
+    translate = [bbox[0], bbox[1]]
+    scale = [
+        (bbox[2] - bbox[0]) / (quantisation - 1) or 1,
+        (bbox[3] - bbox[1]) / (quantisation - 1) or 1,
+    ]
+
+    geometries = [
+        {
+            "type": "MultiPolygon",
+            "properties": feature.get("properties") or {},
+            "arcs": [
+                [
+                    [renumbered[i] if i >= 0 else ~renumbered[~i] for i in ring]
+                    for ring in polygon
+                ]
+                for polygon in polygons
+            ],
+        }
+        for feature, polygons in zip(features, kept_feature_arcs)
+    ]
+
+    return {
+        "type": "Topology",
+        "bbox": bbox,
+        "transform": {"scale": scale, "translate": translate},
+        "objects": {
+            object_name: {"type": "GeometryCollection", "geometries": geometries}
+        },
+        "arcs": [quantise_arc(arc, translate, scale) for arc in arcs],
+    }
@@ -4,4 +4,9 @@ from . import views
 
 urlpatterns = [
     path("", views.JobAdvertOptimiserView.as_view(), name="job_advert_optimiser"),
+    path(
+        "stream/",
+        views.JobAdvertSectionsStreamView.as_view(),
+        name="job_advert_optimiser_stream",
+    ),
 ]
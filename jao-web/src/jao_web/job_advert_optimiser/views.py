@@ -1,31 +1,49 @@
 import asyncio
+import json
 import logging
 from typing import Tuple
 
-from asgiref.sync import async_to_sync
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.http import HttpResponseBadRequest
+from django.http import StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
 from django.urls import reverse_lazy
-from django.utils.decorators import method_decorator
-from django.utils.decorators import sync_and_async_middleware
 from django.views.generic.edit import FormView
 
+from jao_backend_schemas.analysis import AnalysisResponse
 from jao_backend_schemas.maps import AreaFrequenciesResponse
 from jao_backend_schemas.plots import PlotlyFiguresResponse
 from jao_backend_schemas.advice import AdviceResponse
 from jao_backend_schemas.vacancies import SimilarVacanciesResponse
 
-from jao_web.job_advert_optimiser.services.services import get_advice
-from jao_web.job_advert_optimiser.services.services import get_applicant_locations
-from jao_web.job_advert_optimiser.services.client import get_async_client
-from jao_web.job_advert_optimiser.services.services import get_demographics_plots
-from jao_web.job_advert_optimiser.services.services import get_similar_adverts
-from jao_web.job_advert_optimiser.services.services import get_skills_plots
+from jao_web.job_advert_optimiser.services.cache import get_description_key
+from jao_web.job_advert_optimiser.services.client import get_session_headers
+from jao_web.job_advert_optimiser.services.client import get_shared_async_client
+from jao_web.job_advert_optimiser.services.services import AnalysisSectionError
+from jao_web.job_advert_optimiser.services.services import analysis_cache
+from jao_web.job_advert_optimiser.services.services import get_analysis
+from jao_web.job_advert_optimiser.services.services import get_cached_analysis
+from jao_web.job_advert_optimiser.services.services import iter_analysis_sections
 from jao_web.job_advert_optimiser.forms import JobAdvertForm
+from jao_web.job_advert_optimiser.maps import MAP_RESOLUTIONS
+from jao_web.job_advert_optimiser.maps import get_regions_geojson_path
+from jao_web.job_advert_optimiser.maps import get_regions_topology_path
 
 logger = logging.getLogger(__name__)
 
 APPLICANT_MAP_CSS_PREFIX = "applicant-"
-UK_GEOJSON_URL = settings.STATIC_URL + "job_advert_optimiser/geojson/rgn2023.geojson"
+UK_GEOJSON_URL = settings.STATIC_URL + get_regions_geojson_path()
+
+SECTION_HEADINGS = {
+    "advice": "Advice",
+    "similar_adverts": "Similar Adverts",
+    "similar_advert_plots": "Demographics",
+    "skills_plots": "Skills",
+    "applicant_locations": "Locations",
+}
+"""Analysis sections, each is rendered by fragments/<section>.html."""
 
 def format_error(error: Exception):
     if settings.DEBUG:
@@ -41,23 +59,53 @@ def format_error(error: Exception):
     return f"{error}"
 
 
-@method_decorator(sync_and_async_middleware, name="dispatch")
+def get_figures_json(plots: PlotlyFiguresResponse):
+    """
+    Figures for plotly.js to render in the browser, see plotly_figures.js.
+
+    Building plotly Figure objects is slow, so figures are only validated in DEBUG.
+    """
+    if settings.DEBUG:
+        plots.validate_figures()
+    return plots.plotly_figures
+
+
 class JobAdvertOptimiserView(FormView):
+    """
+    Async view: while the backend analyses a job description the worker serves other
+    requests, rather than blocking a thread.
+
+    Every handler must be async, so PUT (a sync alias of POST in FormView) isn't allowed.
+    Templates are rendered lazily by Django's handler, in its thread pool.
+    """
 
+    http_method_names = ["get", "post", "options"]
     template_name = "job_advert_optimiser/job_advert_optimiser.html"
     form_class = JobAdvertForm
     success_url = reverse_lazy(
         "job_advert_optimiser"
     )  # This can be any URL you want to redirect to on success
 
-    def get_or_create_session_key(self):
+    async def aget_or_create_session_key(self):
         session = self.request.session
         session_key = session.session_key
         if not session_key:
-            session.save()
+            # Saving a new session writes to the session store.
+            await sync_to_async(session.save)()
             session_key = session.session_key
         return session_key
 
+    async def get(self, request, *args, **kwargs):
+        await self.aget_or_create_session_key()
+        return self.render_to_response(self.get_context_data())
+
+    async def post(self, request, *args, **kwargs):
+        await self.aget_or_create_session_key()
+        form = self.get_form()
+        if form.is_valid():
+            return await self.form_valid(form)
+        return await self.form_invalid(form)
+
     async def get_data(self, job_description) -> Tuple[
         AdviceResponse,
         SimilarVacanciesResponse,
@@ -65,17 +113,27 @@ class JobAdvertOptimiserView(FormView):
         PlotlyFiguresResponse,
         AreaFrequenciesResponse,
     ]:
-        session_key = self.get_or_create_session_key()
-        async with get_async_client(session_key) as client:
-            results = await asyncio.gather(
-                get_advice(client, job_description),
-                get_similar_adverts(client, job_description),
-                get_demographics_plots(client, job_description),
-                get_skills_plots(client, job_description),
-                get_applicant_locations(client, job_description),
-                return_exceptions=True,
+        """
+        Fetch every section with one request to the backend /analyse endpoint, unless
+        the description was analysed recently.
+
+        If the request fails, the exception is returned in place of each section.
+        """
+        headers = get_session_headers(await self.aget_or_create_session_key())
+        try:
+            analysis = await get_cached_analysis(
+                get_shared_async_client(), job_description, headers=headers
             )
-        return results
+        except Exception as e:
+            return (e,) * 5
+
+        return (
+            analysis.advice,
+            analysis.similar_adverts,
+            analysis.similar_advert_plots,
+            analysis.skills_plots,
+            analysis.applicant_locations,
+        )
 
     def get_base_map_data(self):
         """
@@ -83,6 +141,14 @@ class JobAdvertOptimiserView(FormView):
         """
         map_data = {
             "geojson_url": UK_GEOJSON_URL,
+            # Simplified boundaries, the map picks one for its zoom level.
+            "geodata_resolutions": [
+                {
+                    "url": settings.STATIC_URL + get_regions_topology_path(resolution),
+                    "max_zoom": resolution.max_zoom,
+                }
+                for resolution in MAP_RESOLUTIONS
+            ],
             "geojson_data": None,  # Placeholder populated by the frontend.
             "map_options": {"center": [54, -3], "zoom": 5.2},
             "layers": [
@@ -126,17 +192,54 @@ class JobAdvertOptimiserView(FormView):
         }
         return map_data
 
+    def get_section_context(self, section, response):
+        """
+        Template context for the fragment of a section of the analysis.
+
+        :param section: Name of the AnalysisResponse field.
+        :param response: The field's value.
+        """
+        if section == "advice":
+            return {"job_advert_advice": response.advice}
+        if section == "similar_adverts":
+            return {"similar_vacancies": response.similar_vacancies}
+        if section == "similar_advert_plots":
+            return {"similar_vacancies_figures": get_figures_json(response)}
+        if section == "skills_plots":
+            return {"skills_figures": get_figures_json(response)}
+        if section == "applicant_locations":
+            return {"applicant_map_data": self.get_applicant_map_data(response)}
+        raise ValueError(f"Unknown analysis section: {section}")
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        # Created by get or post, before the context is needed.
         context.update(
             {
-                "session_key": self.get_or_create_session_key(),
+                "session_key": self.request.session.session_key,
             }
         )
         return context
 
-    @async_to_sync
+    def use_section_stream(self):
+        """
+        Page JavaScript asks for sections to be streamed, see section_stream.js.
+        """
+        return settings.JAO_WEB_STREAM_SECTIONS and self.request.POST.get("stream")
+
     async def form_valid(self, form):
+        if self.use_section_stream():
+            # Sections are loaded from the stream view, render placeholders for them.
+            context = self.get_context_data(form=form)
+            context.update(
+                {
+                    "show_extra_widgets": True,
+                    "stream_url": reverse("job_advert_optimiser_stream"),
+                    "service_errors": [],
+                }
+            )
+            return self.render_to_response(context)
+
         job_description = form.cleaned_data["job_description"]
 
         (
@@ -147,7 +250,7 @@ class JobAdvertOptimiserView(FormView):
             applicant_locations,
         ) = await self.get_data(job_description)
 
-        # Handle possible exceptions from asyncio.gather
+        # Handle possible exceptions from get_data
         service_errors = []
         if isinstance(advice_response, Exception):
             logger.error("Error fetching advice: %s", format_error(advice_response))
@@ -164,14 +267,14 @@ class JobAdvertOptimiserView(FormView):
             logger.error("Error fetching demographics plots: %s", format_error(demographics_plots))
             demographic_figures = None
         else:
-            demographic_figures = demographics_plots.get_figures()
+            demographic_figures = get_figures_json(demographics_plots)
 
         if isinstance(skills_plots, Exception):
             service_errors.append(skills_plots)
             logger.error("Error fetching skills plots: %s", format_error(skills_plots))
             skills_figures = None
         else:
-            skills_figures = skills_plots.get_figures()
+            skills_figures = get_figures_json(skills_plots)
 
         if isinstance(applicant_locations, Exception):
             logger.error("Error fetching applicant locations: %s", format_error(applicant_locations))
@@ -196,12 +299,13 @@ class JobAdvertOptimiserView(FormView):
                 "similar_vacancies_figures": demographic_figures,
                 "skills_figures": skills_figures,
                 "applicant_map_data": applicant_map_data,
-                "service_errors": service_errors,
+                # A failed /analyse request is reported once, not once per section.
+                "service_errors": list({id(e): e for e in service_errors}.values()),
             }
         )
         return self.render_to_response(context)
 
-    def form_invalid(self, form):
+    async def form_invalid(self, form):
         context = self.get_context_data(form=form)
         base_map_data = self.get_base_map_data()
         context.update(
@@ -217,6 +321,100 @@ class JobAdvertOptimiserView(FormView):
         return self.render_to_response(context)
 
 
+class JobAdvertSectionsStreamView(JobAdvertOptimiserView):
+    """
+    Sections of the analysis as HTML, as the backend finishes them.
+
+    The job description form is posted here by section_stream.js, the response has one
+    line of JSON per section: {"section": <name>, "html": <rendered fragment>}.
+    """
+
+    http_method_names = ["post", "options"]
+
+    async def render_section_line(self, section, response):
+        heading = SECTION_HEADINGS[section]
+        if isinstance(response, Exception):
+            template_name = "job_advert_optimiser/fragments/section_error.html"
+            context = {
+                "heading": heading,
+                "error": f"Could not load {heading.lower()}.",
+            }
+        else:
+            template_name = f"job_advert_optimiser/fragments/{section}.html"
+            context = self.get_section_context(section, response)
+
+        html = await sync_to_async(render_to_string)(
+            template_name, context, request=self.request
+        )
+        return json.dumps({"section": section, "html": html}) + "\n"
+
+    async def iter_section_lines(self, job_description, headers):
+        """
+        Lines of the cached analysis, or of the backend's stream.  While a description
+        is streamed or fetched, other requests for it wait for that analysis rather than
+        asking the backend again.
+        """
+        client = get_shared_async_client()
+        key = get_description_key(job_description)
+        analysis = analysis_cache.get(
+            key, refresh=lambda: get_analysis(client, job_description, headers=headers)
+        )
+        running = analysis_cache.get_fetch(key)
+        if analysis is None and running is not None:
+            try:
+                # Shielded, so a request that goes away doesn't cancel it for others.
+                analysis = await asyncio.shield(running)
+            except Exception as e:
+                logger.warning("Could not fetch analysis: %s", format_error(e))
+
+        if analysis is not None:
+            for section in SECTION_HEADINGS:
+                response = getattr(analysis, section)
+                yield await self.render_section_line(section, response)
+            return
+
+        with analysis_cache.fetching(key):
+            pending = dict.fromkeys(SECTION_HEADINGS)
+            received = {}
+            try:
+                async for section, response in iter_analysis_sections(
+                    client, job_description, headers=headers
+                ):
+                    if section not in pending:
+                        logger.warning("Unexpected analysis section: %s", section)
+                        continue
+                    del pending[section]
+                    if isinstance(response, Exception):
+                        logger.error(
+                            "Error fetching %s: %s", section, format_error(response)
+                        )
+                    else:
+                        received[section] = response
+                        if len(received) == len(SECTION_HEADINGS):
+                            # Before the last line, so requests waiting get it even
+                            # if this client goes away.
+                            analysis_cache.set(key, AnalysisResponse(**received))
+                    yield await self.render_section_line(section, response)
+            except Exception as e:
+                logger.error("Error streaming analysis: %s", format_error(e))
+
+            # Sections not received, e.g. if the stream failed, are shown as failed.
+            for section in pending:
+                yield await self.render_section_line(
+                    section, AnalysisSectionError(f"{section} was not received.")
+                )
+
+    async def form_valid(self, form):
+        headers = get_session_headers(await self.aget_or_create_session_key())
+        return StreamingHttpResponse(
+            self.iter_section_lines(form.cleaned_data["job_description"], headers),
+            content_type="application/x-ndjson",
+        )
+
+    async def form_invalid(self, form):
+        return HttpResponseBadRequest(form.errors.as_text())
+
+
 from django.http import HttpResponse
 
 def show_client_ip(request):
@@ -21,8 +21,26 @@ PROJECT_DIR = BASE_DIR.parent
 # See https://docs.djangoproject.com/en/5.0/howto/deployment/checklist/
 
 JAO_BACKEND_URL = os.getenv("JAO_BACKEND_URL", "http://localhost:8001/jao")
-JAO_BACKEND_ENABLE_HTTP2 = True
+JAO_BACKEND_ENABLE_HTTP2 = os.getenv("JAO_BACKEND_ENABLE_HTTP2", "true").lower() == "true"
 JAO_BACKEND_TIMEOUT = os.getenv("JAO_BACKEND_TIMEOUT", 15)
+# Connections to the backend, shared by views in each process, see
+# jao_web.job_advert_optimiser.services.client
+JAO_BACKEND_MAX_CONNECTIONS = int(os.getenv("JAO_BACKEND_MAX_CONNECTIONS", 100))
+JAO_BACKEND_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("JAO_BACKEND_MAX_KEEPALIVE_CONNECTIONS", 20)
+)
+# Seconds idle connections are kept open.
+JAO_BACKEND_KEEPALIVE_EXPIRY = float(os.getenv("JAO_BACKEND_KEEPALIVE_EXPIRY", 30))
+# Send analysis sections to the browser as the backend finishes them, disable if a
+# proxy buffers responses.
+JAO_WEB_STREAM_SECTIONS = os.getenv("JAO_WEB_STREAM_SECTIONS", "true").lower() == "true"
+# Analyses kept per process, by job description, see
+# jao_web.job_advert_optimiser.services.cache
+JAO_WEB_ANALYSIS_CACHE_SIZE = int(os.getenv("JAO_WEB_ANALYSIS_CACHE_SIZE", 256))
+# Seconds an analysis is served without asking the backend.
+JAO_WEB_ANALYSIS_CACHE_FRESH = int(os.getenv("JAO_WEB_ANALYSIS_CACHE_FRESH", 300))
+# Seconds more it is served while refreshed in the background.
+JAO_WEB_ANALYSIS_CACHE_STALE = int(os.getenv("JAO_WEB_ANALYSIS_CACHE_STALE", 3600))
 
 
 # Application definition